@@ -0,0 +1,432 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from history_pipeline import AuthorRecord
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+MENTION_PATTERN = re.compile(r"<@!?\d+>")
+WINDOW_PATTERN = re.compile(
+    r"\b(?:in |over |during |for |from )?(?:the )?(?:(?:last|past) (?:(?P<count>\d+|few|couple(?: of)?) )?"
+    r"(?P<unit>hour|day|week|month|year)s?|(?P<fixed>today|yesterday|this week|this month|this year|24 hours|recently))\b"
+)
+UNIT_SECONDS = {'hour': HOUR, 'day': DAY, 'week': 7 * DAY, 'month': 30 * DAY, 'year': 365 * DAY}
+FIXED_WINDOWS = {'today': DAY, 'yesterday': 2 * DAY, 'this week': 7 * DAY, 'this month': 30 * DAY,
+                 'this year': 365 * DAY, '24 hours': DAY, 'recently': 7 * DAY}
+SCOPE_PATTERN = re.compile(
+    r"\b(?:in|on|of|from|across)(?: (?:the|this|our))? (?:chat|channel|server|discord|here)\b|\b(?:in |on )?here\b"
+)
+GUILD_SCOPE_PATTERN = re.compile(r"\b(?:server|discord|all channels|every channel|everywhere)\b")
+TERM_FILLER_PATTERN = re.compile(
+    r"^(?:the (?:word|term|topic|phrase) |about |on )|"
+    r"(?: (?:been )?(?:mentioned|said|used|brought up|discussed|talked about|come up|came up|posted))+$"
+)
+
+# (kind, pattern) in match order; rankings by term before plain activity rankings
+QUESTION_PATTERNS = [
+    ('histogram', re.compile(
+        r"\b(?:when|what time|which (?:hours?|days?|times?)|what (?:hours?|days?|times?))\b.*\b(?:most|least|more) active\b"
+        r"|\bbusiest (?:hours?|times?|days?)\b|\bpeak (?:hours?|times?)\b"
+        r"|\bactivity (?:histogram|by hour|by day|over time|per hour|per day)\b"
+    )),
+    ('rank_term', re.compile(
+        r"\bwho (?:talks?|posts?|chats?|writes?|speaks?|rants?|complains?) (?:the )?(?P<dir>most|least) (?:about|on) (?P<term>.+)"
+    )),
+    ('rank_term', re.compile(
+        r"\bwho (?:talks?|posts?|chats?|writes?|speaks?|rants?|complains?) (?:about|on) (?P<term>.+?) (?:the )?(?P<dir>most|least)\b"
+    )),
+    ('rank_term', re.compile(
+        r"\bwho (?:mentions?|says?|uses?|brings? up|discusses?|types?|posts?) (?P<term>.+?) (?:the )?(?P<dir>most|least|more|less)"
+        r"(?: often)?\b"
+    )),
+    ('rank_term', re.compile(
+        r"\brank (?:the )?(?:members|users|people|everyone) by (?:how (?:often|much) they (?:mention|say|talk about|use) "
+        r"|mentions of |messages about )(?P<term>.+)"
+    )),
+    ('count_term', re.compile(
+        r"\bhow (?:many times|often) (?:has|have|did|do|does) (?:we|people|anyone|everyone|someone|i|you|y'?all)"
+        r" (?:mention(?:ed)?|say|said|talk(?:ed)? about|use[d]?|bring up|brought up|discuss(?:ed)?|post(?:ed)? about) (?P<term>.+)"
+    )),
+    ('count_user', re.compile(
+        r"\bhow many messages (?:have|has|did|do|does) (?P<who>i|you|we|\S+) (?:sent|send|post(?:ed)?|written|write|typed)\b"
+        r"|\bhow many messages (?:have been|were) (?:sent|posted)\b|\bmy message count\b"
+    )),
+    ('rank_messages', re.compile(
+        r"\bwho (?:talks?|posts?|chats?|messages?|types?|speaks?|writes?|yaps?) (?:the )?(?P<dir>most|least)\b"
+        r"|\b(?P<adj>most|least) (?:active|talkative|chatty) (?:members?|users?|people|person|posters?)\b"
+        r"|\brank (?:the )?(?:members|users|people|everyone)(?: by (?:activity|messages|message count|posts))?\b"
+        r"|\btop (?:posters|chatters|members|users|talkers|yappers)\b|\bleaderboard\b"
+    )),
+]
+
+
+class AnalyticsQuestion:
+    """A counting / ranking question the archive can answer exactly"""
+
+    __slots__ = ('kind', 'term', 'window', 'ascending', 'guild_wide', 'about_self')
+
+    def __init__(self, kind: str, term: Optional[str] = None, window: Optional[int] = None,
+                 ascending: bool = False, guild_wide: bool = False, about_self: bool = False):
+        self.kind = kind  # rank_messages, rank_term, count_term, count_user or histogram
+        self.term = term
+        self.window = window  # Seconds back from now, None for everything archived
+        self.ascending = ascending  # "least" instead of "most"
+        self.guild_wide = guild_wide  # Whole server rather than this channel
+        self.about_self = about_self  # "how many messages have I sent"
+
+
+def parse_window(text: str) -> Optional[int]:
+    match = WINDOW_PATTERN.search(text)
+    if not match:
+        return None
+    if match.group('fixed'):
+        return FIXED_WINDOWS[match.group('fixed')]
+    count = match.group('count')
+    if count is None:
+        count = 1
+    elif not count.isdigit():
+        count = 3 if count == 'few' else 2
+    return int(count) * UNIT_SECONDS[match.group('unit')]
+
+
+def clean_term(term: str) -> Optional[str]:
+    """The searched term without window / scope phrases, quotes and trailing filler"""
+    term = WINDOW_PATTERN.sub(" ", term)
+    term = SCOPE_PATTERN.sub(" ", term)
+    term = " ".join(term.strip(" ?!.,;:").split())
+    term = TERM_FILLER_PATTERN.sub("", term).strip(" ?!.,;:\"'`“”‘’")
+    if not term or len(term) > 60 or term in {'it', 'that', 'this', 'stuff', 'things', 'anything', 'something'}:
+        return None
+    return term
+
+
+def parse_analytics_question(query: str) -> Optional[AnalyticsQuestion]:
+    """Detect "who talks the most" / "how many times have we mentioned X" style questions, else None"""
+    text = " ".join(MENTION_PATTERN.sub(" ", query.lower()).split())
+    for kind, pattern in QUESTION_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        term = None
+        if 'term' in groups and groups['term'] is not None:
+            term = clean_term(groups['term'])
+            if term is None:
+                continue
+        direction = groups.get('dir') or groups.get('adj') or ''
+        return AnalyticsQuestion(
+            kind,
+            term=term,
+            window=parse_window(text),
+            ascending=direction in ('least', 'less'),
+            guild_wide=bool(GUILD_SCOPE_PATTERN.search(text)),
+            about_self=kind == 'count_user' and (groups.get('who') == 'i' or 'my message count' in text),
+        )
+    return None
+
+
+class AnalyticsResult:
+    """Exact numbers for one question, as prompt lines plus the author handles they use"""
+
+    __slots__ = ('facts', 'authors', 'messages_in_scope', 'elapsed_ms')
+
+    def __init__(self, facts: str, authors: Dict[str, AuthorRecord], messages_in_scope: int, elapsed_ms: float):
+        self.facts = facts
+        self.authors = authors  # {'A1': AuthorRecord}
+        self.messages_in_scope = messages_in_scope
+        self.elapsed_ms = elapsed_ms
+
+
+class ActivityColumns:
+    """
+    Columnar copy of one guild's (or DM channel's) archived human messages, in archive order (not
+    necessarily by time, as scans archive older history late). Appended to incrementally: columns grow
+    by doubling their capacity, and message text is kept lowercased in one chunk per appended batch
+    with start offsets. Term hits are cached per term and extended with only the chunks added since,
+    so a repeated term search scans only new text.
+    """
+
+    COLUMNS = {'message_ids': np.int64, 'channel_ids': np.int64, 'author_codes': np.int32,
+               'timestamps': np.int64, 'lengths': np.int32, 'starts': np.int64}
+
+    def __init__(self, max_cached_terms: int = 32):
+        self._arrays = {name: np.empty(0, dtype) for name, dtype in self.COLUMNS.items()}
+        self._size = 0
+        self.author_ids: List[int] = []  # code -> author ID
+        self.author_names: List[str] = []  # code -> latest name
+        self._codes: Dict[int, int] = {}
+        self._chunks: List[Tuple[int, str]] = []  # (offset of the chunk, lowercased lines)
+        self._text_length = 0
+        self._term_hits: OrderedDict = OrderedDict()  # {term: (chunks scanned, message indexes)}
+        self.max_cached_terms = max_cached_terms
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    # Views of the filled part of each column
+    @property
+    def message_ids(self) -> np.ndarray:
+        return self._arrays['message_ids'][:self._size]
+
+    @property
+    def channel_ids(self) -> np.ndarray:
+        return self._arrays['channel_ids'][:self._size]
+
+    @property
+    def author_codes(self) -> np.ndarray:  # Dense per-column author index
+        return self._arrays['author_codes'][:self._size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._arrays['timestamps'][:self._size]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self._arrays['lengths'][:self._size]
+
+    @property
+    def starts(self) -> np.ndarray:  # Offset of each message in the text
+        return self._arrays['starts'][:self._size]
+
+    def extend(self, rows: List[tuple]):
+        """Append archive rows (seq, message_id, channel_id, author_id, author_name, created_at, length, content)"""
+        if not rows:
+            return
+        codes = np.empty(len(rows), np.int32)
+        starts = np.empty(len(rows), np.int64)
+        contents = []
+        position = self._text_length
+        for i, (_, _, _, author_id, author_name, _, _, content) in enumerate(rows):
+            code = self._codes.get(author_id)
+            if code is None:
+                code = self._codes[author_id] = len(self.author_ids)
+                self.author_ids.append(author_id)
+                self.author_names.append(author_name)
+            else:
+                self.author_names[code] = author_name
+            codes[i] = code
+            # One line per message, so a term match never spans two messages
+            content = content.lower().replace("\n", " ")
+            starts[i] = position
+            position += len(content) + 1
+            contents.append(content)
+        self._chunks.append((self._text_length, "\n".join(contents) + "\n"))
+        self._text_length = position
+
+        columns = list(zip(*rows))
+        size = self._size + len(rows)
+        if size > len(self._arrays['message_ids']):
+            capacity = max(size, 2 * len(self._arrays['message_ids']), 1024)
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity, array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[name] = grown
+        for name, values in (('message_ids', columns[1]), ('channel_ids', columns[2]), ('author_codes', codes),
+                             ('timestamps', columns[5]), ('lengths', columns[6]), ('starts', starts)):
+            self._arrays[name][self._size:size] = values
+        self._size = size
+        self.last_seq = rows[-1][0]
+
+    def code(self, author_id: Optional[int]) -> Optional[int]:
+        return self._codes.get(author_id) if author_id is not None else None
+
+    def term_hits(self, term: str) -> np.ndarray:
+        """Message index of every whole-word occurrence of term (one entry per occurrence)"""
+        term = term.lower()
+        scanned, hits = self._term_hits.pop(term, (0, np.empty(0, np.int64)))
+        if scanned < len(self._chunks):
+            pattern = re.compile(r"(?<!\w)" + re.escape(term) + r"(?!\w)")
+            positions = np.fromiter((offset + match.start() for offset, chunk in self._chunks[scanned:]
+                                     for match in pattern.finditer(chunk)), np.int64)
+            hits = np.concatenate([hits, np.searchsorted(self.starts, positions, side='right') - 1])
+        self._term_hits[term] = (len(self._chunks), hits)
+        while len(self._term_hits) > self.max_cached_terms:
+            self._term_hits.popitem(last=False)
+        return hits
+
+
+class ActivityAnalytics:
+    """
+    Exact activity statistics over the message archive with vectorized NumPy operations:
+    message counts and rankings, per-member term frequency, and hour / weekday histograms.
+    Columns are loaded per guild on first use and then only the newly archived rows are appended;
+    the `max_scopes` most recently used guilds stay loaded. Answers are computed in a worker thread.
+    """
+
+    def __init__(self, archive, tz, top_n: int = 10, max_scopes: int = 8):
+        self.archive = archive
+        self.tz = tz
+        self.top_n = top_n
+        self.max_scopes = max_scopes
+        self._columns: OrderedDict = OrderedDict()  # {scope: ActivityColumns}, least recently used first
+        self._lock = threading.Lock()  # Columns are read and extended in worker threads
+        self.counters = {'answered': 0, 'total_ms': 0.0}
+
+    def columns(self, guild_id: Optional[int], channel_id: int) -> ActivityColumns:
+        """A scope's columns with everything written to the archive so far (blocking)"""
+        key = ('guild', guild_id) if guild_id is not None else ('channel', channel_id)
+        columns = self._columns.pop(key, None)
+        if columns is None:
+            columns = ActivityColumns()
+        self._columns[key] = columns
+        while len(self._columns) > self.max_scopes:
+            self._columns.popitem(last=False)
+        columns.extend(self.archive.rows_after(guild_id, channel_id, columns.last_seq))
+        return columns
+
+    def reset(self):
+        """Forget loaded columns (after archive partitions were dropped); reloaded on next use"""
+        with self._lock:
+            self._columns.clear()
+
+    def _local(self, timestamp: int) -> datetime:
+        return datetime.fromtimestamp(int(timestamp), tz=timezone.utc).astimezone(self.tz)
+
+    def _handle(self, columns: ActivityColumns, code: int, authors: Dict[str, AuthorRecord]) -> str:
+        for handle, author in authors.items():
+            if author.id == columns.author_ids[code]:
+                return handle
+        handle = f"A{len(authors) + 1}"
+        authors[handle] = AuthorRecord(columns.author_ids[code], columns.author_names[code])
+        return handle
+
+    def _ranking(self, columns: ActivityColumns, counts: np.ndarray, ascending: bool,
+                 authors: Dict[str, AuthorRecord], unit: str, extra: Optional[np.ndarray] = None,
+                 extra_unit: str = "") -> List[str]:
+        total = int(counts.sum())
+        candidates = np.flatnonzero(counts)
+        order = candidates[np.argsort(counts[candidates] if ascending else -counts[candidates], kind='stable')]
+        lines = []
+        for rank, code in enumerate(order[:self.top_n], 1):
+            line = f"{rank}. {self._handle(columns, int(code), authors)}: {int(counts[code]):,} {unit} ({counts[code] / total:.1%})"
+            if extra is not None:
+                line += f", {int(extra[code]):,} {extra_unit}"
+            lines.append(line)
+        if len(order) > self.top_n:
+            lines.append(f"({len(order) - self.top_n} more members not listed)")
+        return lines
+
+    def _histogram(self, columns: ActivityColumns, mask: np.ndarray) -> List[str]:
+        # Local hour / weekday per distinct UTC hour (exact across DST changes, few conversions)
+        utc_hours, inverse = np.unique(columns.timestamps[mask] // HOUR, return_inverse=True)
+        local = [self._local(hour * HOUR) for hour in utc_hours]
+        hours = np.array([moment.hour for moment in local], np.int64)[inverse]
+        weekdays = np.array([moment.weekday() for moment in local], np.int64)[inverse]
+        by_hour = np.bincount(hours, minlength=24)
+        by_weekday = np.bincount(weekdays, minlength=7)
+        busiest = np.argsort(-by_hour, kind='stable')[:3]
+        return [
+            "Messages by hour of day: " + ", ".join(f"{h:02d}h={int(n)}" for h, n in enumerate(by_hour)),
+            "Messages by weekday: " + ", ".join(f"{WEEKDAYS[d]}={int(n)}" for d, n in enumerate(by_weekday)),
+            "Busiest hours: " + ", ".join(f"{int(h):02d}:00-{int(h):02d}:59 ({int(by_hour[h])})" for h in busiest),
+            f"Busiest weekday: {WEEKDAYS[int(np.argmax(by_weekday))]}",
+        ]
+
+    async def answer(self, question: AnalyticsQuestion, guild_id: Optional[int], channel_id: int,
+                     user_id: Optional[int] = None) -> Optional[AnalyticsResult]:
+        """Compute the numbers for a question; None if the archive has nothing in scope"""
+        await self.archive.flush_async()
+        return await asyncio.to_thread(self._answer, question, guild_id, channel_id, user_id)
+
+    def _answer(self, question: AnalyticsQuestion, guild_id: Optional[int], channel_id: int,
+                user_id: Optional[int]) -> Optional[AnalyticsResult]:
+        with self._lock:
+            return self._answer_locked(question, guild_id, channel_id, user_id)
+
+    def _answer_locked(self, question: AnalyticsQuestion, guild_id: Optional[int], channel_id: int,
+                       user_id: Optional[int]) -> Optional[AnalyticsResult]:
+        started = time.perf_counter()
+        columns = self.columns(guild_id, channel_id)
+        if not len(columns):
+            return None
+
+        mask = np.ones(len(columns), bool)
+        if not question.guild_wide:
+            mask &= columns.channel_ids == channel_id
+        since = None
+        if question.window:
+            since = int(time.time()) - question.window
+            mask &= columns.timestamps >= since
+        in_scope = int(mask.sum())
+        if not in_scope:
+            return None
+
+        user_code = columns.code(user_id)
+        scope = "the whole server" if question.guild_wide else "this channel"
+        first = self._local(columns.timestamps[mask].min())
+        period = f"since {first.strftime('%Y-%m-%d %H:%M %Z')}"
+        if question.window:
+            period = f"last {question.window // DAY} days" if question.window >= DAY else f"last {question.window // HOUR} hours"
+            period += f" (archive reaches back to {first.strftime('%Y-%m-%d')})"
+        header = [f"Exact statistics from the message archive: {scope}, {period}, {in_scope:,} messages from members."]
+        authors: Dict[str, AuthorRecord] = {}
+        n_authors = len(columns.author_ids)
+
+        if question.kind == 'histogram':
+            if user_code is not None:
+                mask &= columns.author_codes == user_code
+                header.append(f"Only messages from {self._handle(columns, user_code, authors)}.")
+            lines = self._histogram(columns, mask) if mask.any() else ["No messages."]
+        elif question.kind in ('rank_term', 'count_term'):
+            hits = columns.term_hits(question.term)
+            hits = hits[mask[hits]]
+            messages = np.unique(hits)
+            mentions_by_author = np.bincount(columns.author_codes[hits], minlength=n_authors)
+            messages_by_author = np.bincount(columns.author_codes[messages], minlength=n_authors)
+            header.append(
+                f'Term "{question.term}" (whole word, case-insensitive): {len(hits):,} mentions in {len(messages):,} '
+                f"messages by {int(np.count_nonzero(messages_by_author)):,} members."
+            )
+            if len(messages):
+                times = columns.timestamps[messages]
+                header.append(
+                    f"First mention {self._local(times.min()).strftime('%Y-%m-%d')}, "
+                    f"latest {self._local(times.max()).strftime('%Y-%m-%d')}."
+                )
+            lines = []
+            if user_code is not None:
+                handle = self._handle(columns, user_code, authors)
+                lines.append(f"{handle}: {int(messages_by_author[user_code]):,} messages mentioning it "
+                             f"({int(mentions_by_author[user_code]):,} mentions)")
+            if question.kind == 'rank_term' or user_code is None:
+                lines += self._ranking(columns, messages_by_author, question.ascending, authors,
+                                       "messages mentioning it", mentions_by_author, "mentions") if len(messages) else []
+        elif question.kind == 'count_user' and user_code is not None:
+            counts = np.bincount(columns.author_codes[mask], minlength=n_authors)
+            characters = np.bincount(columns.author_codes[mask], weights=columns.lengths[mask], minlength=n_authors)
+            rank = int(np.count_nonzero(counts > counts[user_code])) + 1
+            handle = self._handle(columns, user_code, authors)
+            lines = [f"{handle}: {int(counts[user_code]):,} messages ({counts[user_code] / in_scope:.1%} of all), "
+                     f"{int(characters[user_code]):,} characters, rank {rank} of {int(np.count_nonzero(counts))} members"]
+        else:
+            # rank_messages, or a count question without a member
+            counts = np.bincount(columns.author_codes[mask], minlength=n_authors)
+            characters = np.bincount(columns.author_codes[mask], weights=columns.lengths[mask], minlength=n_authors)
+            header.append(f"{int(np.count_nonzero(counts)):,} members posted.")
+            lines = self._ranking(columns, counts, question.ascending, authors, "messages", characters, "characters")
+
+        if authors:
+            header.append("Authors: " + ", ".join(f"{handle}={author.name}" for handle, author in authors.items()))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.counters['answered'] += 1
+        self.counters['total_ms'] += elapsed_ms
+        return AnalyticsResult("\n".join(header + lines), authors, in_scope, elapsed_ms)
+
+    def stats(self) -> dict:
+        answered = self.counters['answered']
+        return dict(
+            self.counters,
+            avg_ms=self.counters['total_ms'] / answered if answered else 0.0,
+            loaded_messages=sum(len(columns) for columns in list(self._columns.values())),
+            loaded_scopes=len(self._columns),
+        )
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import discord
+
+from grok_scheduler import TokenBucket
+
+logger = logging.getLogger('GrokBot')
+
+
+class BackfillCursor:
+    """Backfill position of one channel: the oldest and newest message IDs archived by the backfill"""
+
+    __slots__ = ('channel_id', 'guild_id', 'oldest_id', 'newest_id', 'complete', 'messages')
+
+    def __init__(self, channel_id: int, guild_id: Optional[int], oldest_id: Optional[int] = None,
+                 newest_id: Optional[int] = None, complete: bool = False, messages: int = 0):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.oldest_id = oldest_id
+        self.newest_id = newest_id
+        self.complete = complete  # Reached the start of the channel
+        self.messages = messages
+
+
+class ArchiveBackfill:
+    """
+    Background worker filling the message archive with channels' full history, so analytics and
+    searches can be answered locally instead of paging Discord during a request.
+
+    Each readable text channel is walked backwards one page (`page_size` messages, one REST call)
+    at a time, round-robin across channels, within a budget of `requests_per_minute`. Per-channel
+    cursors are kept in SQLite; after a restart a channel first catches up on messages sent while
+    the bot was offline (forwards from its newest backfilled message), then continues backwards from
+    its oldest. The worker pauses while `is_busy()` (e.g. interactive Grok requests queued) and for
+    `idle_seconds` after each note_interactive(), so it never competes with users' requests.
+    """
+
+    def __init__(self, archive, db_path: str, *, requests_per_minute: float = 30, page_size: int = 100,
+                 idle_seconds: float = 30, is_busy: Callable[[], bool] = lambda: False):
+        self.archive = archive
+        self.db_path = db_path
+        self.page_size = page_size
+        self.idle_seconds = idle_seconds
+        self.is_busy = is_busy
+        self.bucket = TokenBucket(requests_per_minute)
+        self._last_interactive = 0.0
+        self._caught_up = set()  # Channels whose gap since the last run has been filled
+        self._running = False
+        self.counters = {'pages': 0, 'messages': 0, 'pauses': 0, 'errors': 0}
+
+    def init_db(self):
+        """Create the backfill cursor table"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_cursors (
+                channel_id INTEGER PRIMARY KEY,
+                guild_id INTEGER,
+                oldest_id INTEGER,
+                newest_id INTEGER,
+                complete INTEGER NOT NULL DEFAULT 0,
+                messages INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def note_interactive(self):
+        """Record user-facing activity (commands, mentions); backfill holds off for idle_seconds"""
+        self._last_interactive = time.monotonic()
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() - self._last_interactive < self.idle_seconds or self.is_busy()
+
+    def cursors(self) -> Dict[int, BackfillCursor]:
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT channel_id, guild_id, oldest_id, newest_id, complete, messages FROM backfill_cursors')
+            rows = cursor.fetchall()
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error reading backfill cursors: {e}')
+            return {}
+        return {row[0]: BackfillCursor(row[0], row[1], row[2], row[3], bool(row[4]), row[5]) for row in rows}
+
+    def save_cursor(self, state: BackfillCursor):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('''
+                INSERT OR REPLACE INTO backfill_cursors
+                (channel_id, guild_id, oldest_id, newest_id, complete, messages, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (state.channel_id, state.guild_id, state.oldest_id, state.newest_id, int(state.complete),
+                  state.messages, time.time()))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error saving backfill cursor for channel {state.channel_id}: {e}')
+
+    async def _wait_turn(self):
+        """Wait until backfill may make its next REST call (not paused, within budget)"""
+        if self.paused:
+            self.counters['pauses'] += 1
+            while self.paused:
+                await asyncio.sleep(min(5.0, self.idle_seconds or 5.0))
+        delay = self.bucket.wait_time(1)
+        if delay:
+            await asyncio.sleep(delay)
+        self.bucket.consume(1)
+
+    async def step(self, channel, state: BackfillCursor) -> int:
+        """Archive one page of a channel's history; returns the number of messages fetched"""
+        if state.newest_id is not None and state.channel_id not in self._caught_up:
+            # Messages sent since the last run, oldest first
+            history = channel.history(limit=self.page_size, after=discord.Object(state.newest_id), oldest_first=True)
+            catching_up = True
+        else:
+            if state.newest_id is None:
+                # First page of a new channel starts from the newest message: nothing to catch up on
+                self._caught_up.add(state.channel_id)
+            before = discord.Object(state.oldest_id) if state.oldest_id is not None else None
+            history = channel.history(limit=self.page_size, before=before, oldest_first=False)
+            catching_up = False
+
+        fetched = 0
+        async for msg in history:
+            self.archive.add(msg)
+            fetched += 1
+            state.oldest_id = msg.id if state.oldest_id is None else min(state.oldest_id, msg.id)
+            state.newest_id = msg.id if state.newest_id is None else max(state.newest_id, msg.id)
+
+        if fetched < self.page_size:
+            if catching_up:
+                self._caught_up.add(state.channel_id)
+            else:
+                state.complete = True
+        state.messages += fetched
+        self.save_cursor(state)
+        self.counters['pages'] += 1
+        self.counters['messages'] += fetched
+        return fetched
+
+    def _pending(self, channel, state: Optional[BackfillCursor]) -> bool:
+        return state is None or not state.complete or channel.id not in self._caught_up
+
+    async def run(self, list_channels: Callable[[], Iterable]):
+        """Backfill forever (start once from on_ready); list_channels returns the readable channels"""
+        if self._running:
+            return
+        self._running = True
+        states = self.cursors()
+        logger.info(f'Archive backfill started ({sum(s.complete for s in states.values())} channels complete)')
+        while True:
+            channels = [channel for channel in list_channels() if self._pending(channel, states.get(channel.id))]
+            if not channels:
+                # Everything backfilled; live messages are archived by on_message
+                await asyncio.sleep(600)
+                continue
+            for channel in channels:
+                state = states.get(channel.id)
+                if state is None:
+                    guild = getattr(channel, 'guild', None)
+                    state = states[channel.id] = BackfillCursor(channel.id, guild.id if guild else None)
+                await self._wait_turn()
+                try:
+                    await self.step(channel, state)
+                except discord.Forbidden:
+                    # Lost access: treat as done until the cursor is reset
+                    state.complete = True
+                    self._caught_up.add(channel.id)
+                    self.save_cursor(state)
+                except Exception as e:
+                    self.counters['errors'] += 1
+                    logger.error(f'Error backfilling channel {channel.id}: {e}')
+                    await asyncio.sleep(30)
+
+    def stats(self) -> dict:
+        states = self.cursors()
+        return dict(
+            self.counters,
+            channels=len(states),
+            complete=sum(state.complete for state in states.values()),
+            paused=self.paused,
+        )
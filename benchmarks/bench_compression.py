@@ -0,0 +1,155 @@
+"""
+Benchmark: database size and read latency of plain vs compressed text columns.
+
+Builds two SQLite databases with the same synthetic data - conversations whose responses are
+drawn from recorded_responses.json (padded to typical answer lengths) and a message archive of
+chat-like messages - one stored as plain text, one through text_compression. Reports the file
+sizes, point lookups of conversations and a full archive load (MessageArchive.rows_after, as the
+activity analytics do). Reads run with a warm OS page cache, so the latency columns show the CPU
+cost of decompression and the size column what it saves in I/O and cache. No Discord connection
+or API key needed.
+
+    python benchmarks/bench_compression.py [--conversations 20000] [--messages 200000] [--min-bytes 200]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_archive import MessageArchive  # noqa: E402
+from text_compression import compress_text, decompress_text  # noqa: E402
+from time_partitions import time_snowflake  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = ("the a to and is it you that of i for in on this was with just but so have be not my are "
+         "build deploy server patch ranked python rust uv poetry pip docker grok bot channel thread "
+         "lol yeah honestly tomorrow tonight release bug fix crash logs config token api model").split()
+
+
+def make_chat_message(rng):
+    """Chat-like text: mostly short, some long paragraphs and pasted logs"""
+    roll = rng.random()
+    if roll < 0.7:
+        return " ".join(rng.choices(WORDS, k=rng.randint(2, 18)))
+    if roll < 0.95:
+        return " ".join(rng.choices(WORDS, k=rng.randint(40, 150)))
+    lines = [f"2026-10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} ERROR worker "
+             f"{rng.randint(1, 8)}: {' '.join(rng.choices(WORDS, k=8))}" for _ in range(rng.randint(10, 40))]
+    return "\n".join(lines)
+
+
+def make_response(rng, recorded):
+    """A bot answer: recorded Grok responses stitched to a typical answer length"""
+    parts = []
+    while sum(map(len, parts)) < rng.randint(400, 3000):
+        parts.append(rng.choice(recorded)['response'])
+    return "\n\n".join(parts)
+
+
+def build(path, args, compress, recorded):
+    rng = random.Random(7)
+    min_bytes = args.min_bytes if compress else None
+    now = int(time.time())
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE conversations (
+            message_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, author_id INTEGER NOT NULL,
+            user_query TEXT NOT NULL, bot_response TEXT NOT NULL, model_used TEXT NOT NULL, created_at INTEGER NOT NULL
+        )
+    ''')
+    rows = []
+    for i in range(args.conversations):
+        query = " ".join(rng.choices(WORDS, k=rng.randint(5, 60)))
+        response = make_response(rng, recorded)
+        if compress:
+            query, response = compress_text(query, min_bytes), compress_text(response, min_bytes)
+        rows.append((time_snowflake(now - i * 30) + i, 1, rng.randint(1, 500), query, response, 'grok', now - i * 30))
+    conn.executemany('INSERT INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    archive = MessageArchive(path, batch_size=5000, flush_interval=3600, compress_min_bytes=min_bytes)
+    archive.init_db()
+    guild = SimpleNamespace(id=1)
+    for i in range(args.messages):
+        ts = now - (args.messages - i) * 20
+        author = rng.randint(1, 300)
+        archive.add(SimpleNamespace(
+            id=time_snowflake(ts) + i,
+            guild=guild,
+            channel=SimpleNamespace(id=rng.randint(1, 10)),
+            author=SimpleNamespace(id=author, name=f"member{author}", bot=False),
+            created_at=datetime.fromtimestamp(ts, timezone.utc),
+            content=make_chat_message(rng),
+        ))
+    archive.flush()
+    conn = sqlite3.connect(path)
+    conn.execute('VACUUM')
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def time_lookups(path, ids, repeat):
+    ids = ids[:repeat]
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    for message_id in ids:
+        row = conn.execute('SELECT user_query, bot_response FROM conversations WHERE message_id = ?',
+                           (message_id,)).fetchone()
+        decompress_text(row[0]), decompress_text(row[1])
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed / len(ids)
+
+
+def time_archive_load(path):
+    archive = MessageArchive(path)
+    started = time.perf_counter()
+    rows = archive.rows_after(1, 0, 0)
+    return time.perf_counter() - started, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--min-bytes', type=int, default=200, help='TEXT_COMPRESSION_MIN_BYTES')
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+
+    with open(os.path.join(HERE, 'recorded_responses.json')) as f:
+        recorded = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, compress in (('plain', False), ('compressed', True)):
+            path = os.path.join(tmp, f'{label}.db')
+            started = time.perf_counter()
+            ids = build(path, args, compress, recorded)
+            build_s = time.perf_counter() - started
+            random.Random(3).shuffle(ids)
+            lookup = time_lookups(path, ids, args.lookups)
+            load_s, loaded = time_archive_load(path)
+            results[label] = (os.path.getsize(path), build_s, lookup, load_s, loaded)
+
+    print(f"{args.conversations:,} conversations, {args.messages:,} archived messages, "
+          f"compression from {args.min_bytes} bytes\n")
+    print(f"{'':<11} {'DB MiB':>8} {'build s':>8} {'lookup µs':>10} {'archive load s':>15}")
+    for label, (size, build_s, lookup, load_s, loaded) in results.items():
+        print(f"{label:<11} {size / 2**20:>8.1f} {build_s:>8.1f} {lookup * 1e6:>10.1f} {load_s:>15.2f}")
+    plain, packed = results['plain'], results['compressed']
+    print(f"\nSize {packed[0] / plain[0]:.0%} of plain; lookups {packed[2] / plain[2]:.2f}x, "
+          f"archive load ({packed[4]:,} rows) {packed[3] / plain[3]:.2f}x the plain time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Micro-benchmark: single-pass ResponsePostProcessor vs the old multi-pass regex chain.
+
+Runs both over the recorded Grok responses in recorded_responses.json against a synthetic guild.
+Member name tables are built once up front for both, so the numbers compare the text processing
+itself. The old code also rebuilt its table from guild.members on every call; that per-call cost is
+printed separately against the incrementally maintained GuildMemberIndex. No Discord connection or API key needed.
+
+The short "general" response (no citations, a few names) comes out slower than the old chain,
+about 0.6x: the old chain ran only a handful of name regexes over it against a prebuilt table,
+while the single pass tries every alternative at each candidate position. The single pass wins on
+search and history answers, where the old chain re-scanned the text once per citation / name rule.
+
+    python benchmarks/bench_postprocess.py [--members 50000] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from member_index import GuildMemberIndex  # noqa: E402
+from response_postprocess import ResponsePostProcessor  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_guild(member_count):
+    names = ['sarah_dev', 'Mike', 'Kevin', 'jordan', 'linus'] + [f'member{i}' for i in range(member_count)]
+    guild = SimpleNamespace(id=1)
+    guild.members = [
+        SimpleNamespace(id=100000000000000000 + i, name=name, display_name=name.title(),
+                        mention=f'<@{100000000000000000 + i}>', guild=guild)
+        for i, name in enumerate(names)
+    ]
+    return guild
+
+
+def make_number_map(guild, count=1000):
+    channel = SimpleNamespace(id=2)
+    authors = guild.members[:6]
+    return {
+        n: SimpleNamespace(
+            id=900000000000000000 + n,
+            author=authors[n % len(authors)],
+            channel=channel,
+            jump_url=f'https://discord.com/channels/{guild.id}/{channel.id}/{900000000000000000 + n}',
+        )
+        for n in range(1, count + 1)
+    }
+
+
+# --- The previous implementation, kept here as the baseline ---
+
+def legacy_username_map(guild):
+    username_map = {}
+    for member in guild.members:
+        username_map[member.name.lower()] = member
+        username_map[member.display_name.lower()] = member
+        if '#' in member.name:
+            username_map[member.name.split('#')[0].lower()] = member
+    return username_map
+
+
+def legacy_convert_usernames_to_mentions(text, username_map):
+    lookup = lambda m: f"<@{username_map[m.group(1).lower()].id}>" if m.group(1).lower() in username_map else m.group(0)
+    for pattern in (r'(?<!<)@([a-zA-Z0-9_]{2,32})(?!>)', r'"([a-zA-Z0-9_]{2,32})"',
+                    r'(?<=\s)([A-Z][a-zA-Z0-9_]{1,31})(?=[\s,.\'])'):
+        text = re.sub(pattern, lookup, text)
+    return text
+
+
+def legacy_search(response, number_map, authors, username_map):
+    response = re.sub(r'#(\d+)\([^)]*\)', r'#\1', response)
+    response = re.sub(r'(?<!\[)#(\d+(?:-#?\d+)+)(?!\])', r'[#\1]', response)
+    response = re.sub(r'(?<!\[)#(\d+)(?![\d\-\)\]])', r'[#\1]', response)
+    cited = set()
+    for match in re.finditer(r'\[#(\d+)\]', response):
+        if match.start() > 0 and response[match.start() - 1] in '-]':
+            continue
+        cited.add(int(match.group(1)))
+    for match in re.finditer(r'\[#(\d+)-#?(\d+)\]', response):
+        cited.update(range(int(match.group(1)), int(match.group(2)) + 1))
+
+    def replace_range(match):
+        links = []
+        for num in range(int(match.group(1)), int(match.group(2)) + 1):
+            msg = number_map.get(num)
+            links.append(f"[#{num}]({msg.jump_url})" if msg else f"[#{num}]")
+        return "-".join(links) if links else match.group(0)
+
+    def replace_citation(match):
+        after = match.end()
+        if response[after:after + 2] == '](' or response[after:after + 1] == '-':
+            return match.group(0)
+        if match.start() > 0 and response[match.start() - 1] == '-':
+            return match.group(0)
+        msg = number_map.get(int(match.group(1)))
+        return f"[#{match.group(1)}]({msg.jump_url})" if msg else match.group(0)
+
+    response = re.sub(r'\[#(\d+)-#?(\d+)\]', replace_range, response)
+    response = re.sub(r'\[#(\d+)\]', replace_citation, response)
+    response = re.sub(r'<(a?):([^:]+):(\d+)>', lambda m: f"<{m.group(1)}:{m.group(2)}:{m.group(3)}>", response)
+    response = re.sub(r'(?<![\w<@#])A(\d+)\b', lambda m: authors[m.group(0)].mention if m.group(0) in authors else m.group(0), response)
+    return legacy_convert_usernames_to_mentions(response, username_map)
+
+
+def legacy_history_analysis(answer, number_map, authors, username_map, bot_mention):
+    answer = re.sub(r'\[#(\d+)\]', lambda m: f"[#{m.group(1)}](<{number_map[int(m.group(1))].jump_url}>)"
+                    if int(m.group(1)) in number_map else m.group(0), answer)
+    answer = re.sub(r'(\]\[)', '] [', answer)
+    user_ids = {}
+    usernames = {}
+    for num in re.findall(r'\[#(\d+)\]', answer):
+        msg = number_map.get(int(num))
+        if msg:
+            user_ids[str(msg.author.id)] = f'<@{msg.author.id}>'
+            usernames[msg.author.name] = f'<@{msg.author.id}>'
+            usernames[msg.author.display_name] = f'<@{msg.author.id}>'
+    answer = re.sub(r'(?<!<@)@?gronk(?!>)', bot_mention, answer, flags=re.IGNORECASE)
+    for uid, mention in user_ids.items():
+        answer = answer.replace(uid, mention)
+    for name, mention in usernames.items():
+        if name.lower() != 'gronk':
+            answer = re.sub(rf'(?<!<@){re.escape(name)}(?!>)', mention, answer)
+    answer = re.sub(r'(?<![\w<@#])A(\d+)\b', lambda m: authors[m.group(0)].mention if m.group(0) in authors else m.group(0), answer)
+    answer = legacy_convert_usernames_to_mentions(answer, username_map)
+    answer = re.sub(r'(\<@!?\d+\>) ?\(user ID \1\)', r'\1', answer)
+    answer = re.sub(r'(\<@!?\d+\>) ?\(which is \1\)', r'\1', answer)
+    answer = re.sub(r'(\<@!?\d+\>) ?\(user ID @\d+\)', r'\1', answer)
+    answer = re.sub(r'(@\d+) ?\(which is \<@!?\d+\>\)', r'\1', answer)
+    return answer
+
+
+# --- Current implementation ---
+
+def single_pass(kind, response, number_map, authors, name_lookup, bot_mention):
+    if kind == 'general':
+        return ResponsePostProcessor(name_lookup=name_lookup).process(response)
+    return ResponsePostProcessor(
+        number_map,
+        link_format="[#{num}](<{link}>)" if kind == 'history_analysis' else "[#{num}]({link})",
+        authors=authors,
+        bot_mention=bot_mention if kind == 'history_analysis' else None,
+        name_lookup=name_lookup,
+    ).process(response)
+
+
+def legacy(kind, response, number_map, authors, username_map, bot_mention):
+    if kind == 'search':
+        return legacy_search(response, number_map, authors, username_map)
+    if kind == 'history_analysis':
+        return legacy_history_analysis(response, number_map, authors, username_map, bot_mention)
+    return legacy_convert_usernames_to_mentions(response, username_map)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=5000, help='synthetic guild size')
+    parser.add_argument('--repeat', type=int, default=2000, help='runs per response')
+    parser.add_argument('--show', action='store_true', help='print both outputs for each response')
+    args = parser.parse_args()
+
+    with open(os.path.join(HERE, 'recorded_responses.json'), encoding='utf-8') as f:
+        recorded = json.load(f)
+
+    guild = make_guild(args.members)
+    number_map = make_number_map(guild)
+    authors = {f'A{i + 1}': member for i, member in enumerate(guild.members[:6])}
+    bot_mention = '<@999999999999999999>'
+    username_map = legacy_username_map(guild)
+    member_index = GuildMemberIndex()
+    member_index.index_guild(guild)
+    name_lookup = member_index.lookup(guild)
+
+    print(f"{len(recorded)} recorded responses, {len(guild.members):,} members, {args.repeat} runs each")
+    build_old = timeit.timeit(lambda: legacy_username_map(guild), number=5) / 5
+    build_new = timeit.timeit(lambda: member_index.lookup(guild), number=1000) / 1000
+    print(f"Name table per call: legacy rebuild {build_old * 1e6:.0f} µs, member index {build_new * 1e6:.2f} µs\n")
+    print(f"{'#':>2}  {'kind':<17} {'legacy µs':>10} {'single µs':>10} {'speedup':>8}")
+    totals = [0.0, 0.0]
+    for i, item in enumerate(recorded, 1):
+        old_args = (item['kind'], item['response'], number_map, authors, username_map, bot_mention)
+        new_args = (item['kind'], item['response'], number_map, authors, name_lookup, bot_mention)
+        old = timeit.timeit(lambda: legacy(*old_args), number=args.repeat) / args.repeat
+        new = timeit.timeit(lambda: single_pass(*new_args), number=args.repeat) / args.repeat
+        totals[0] += old
+        totals[1] += new
+        print(f"{i:>2}  {item['kind']:<17} {old * 1e6:>10.1f} {new * 1e6:>10.1f} {old / new:>7.1f}x")
+        if args.show:
+            print(f"    legacy: {legacy(*old_args)}\n    single: {single_pass(*new_args)}\n")
+    print(f"\n    {'total':<17} {totals[0] * 1e6:>10.1f} {totals[1] * 1e6:>10.1f} {totals[0] / totals[1]:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger('GrokBot')
+
+# Citations inside one bracket group: [#3], [#3-#7], [#3, #9]
+CITATION_GROUP_PATTERN = re.compile(r"\[#\d+(?:\s*(?:,|-|–|and)\s*#?\d+)*\]")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def is_block_boundary(message_id: int, block_size: int) -> bool:
+    """Whether a block ends after this message - decided by the message ID alone, so boundaries never move"""
+    digest = hashlib.blake2b(message_id.to_bytes(8, 'big'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % block_size == 0
+
+
+def split_blocks(messages: list, block_size: int = 200) -> List[Tuple[int, int]]:
+    """
+    Split messages (oldest to newest) into [start, end) blocks of about block_size.
+
+    Blocks end after messages whose ID hashes to a boundary (or at twice block_size), so the same
+    messages fall into the same blocks whatever window of the channel is scanned; only the blocks at
+    either end of the window differ from one scan to the next.
+    """
+    blocks = []
+    start = 0
+    for i, msg in enumerate(messages):
+        if is_block_boundary(msg.id, block_size) or i + 1 - start >= 2 * block_size:
+            blocks.append((start, i + 1))
+            start = i + 1
+    if start < len(messages):
+        blocks.append((start, len(messages)))
+    return blocks
+
+
+def make_block_key(messages: Iterable, model: str, prompt_version: int) -> str:
+    """Content address of a block summary: model, prompt version and every message's ID, author and text"""
+    h = hashlib.sha256(f"{model}\x1f{prompt_version}".encode())
+    for msg in messages:
+        h.update(f"\x1e{msg.id}\x1f{msg.author.id}\x1f{msg.author.name}\x1f{msg.content}".encode())
+    return h.hexdigest()
+
+
+def renumber_citations(text: str, offset: int) -> str:
+    """Shift block-local [#N] citations by offset to the numbers of the full history"""
+    return CITATION_GROUP_PATTERN.sub(
+        lambda group: NUMBER_PATTERN.sub(lambda n: str(int(n.group()) + offset), group.group()),
+        text
+    )
+
+
+class BlockSummaryStore:
+    """
+    Content-addressed summaries of message blocks in the conversation SQLite DB.
+
+    A block's summary is written once, independent of any question, and keyed by make_block_key,
+    so every later analysis that covers the same messages reuses it; an edited message or a new
+    model / prompt version gives a new key. The least recently used beyond max_entries are dropped.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 20000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.counters = {'hits': 0, 'misses': 0, 'stored': 0}
+
+    def init_db(self):
+        """Create the block summary table"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS block_summaries (
+                block_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_block_summaries_last_used ON block_summaries(last_used)
+        ''')
+        conn.commit()
+        conn.close()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Cached summaries for the given keys ({key: summary}, missing keys left out)"""
+        found = {}
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f'SELECT block_key, summary FROM block_summaries WHERE block_key IN ({placeholders})', chunk)
+                found.update(cursor.fetchall())
+            if found:
+                cursor.executemany('UPDATE block_summaries SET last_used = ? WHERE block_key = ?',
+                                   [(time.time(), key) for key in found])
+                conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error reading block summaries: {e}')
+        self.counters['hits'] += len(found)
+        self.counters['misses'] += len(set(keys)) - len(found)
+        return found
+
+    def put(self, key: str, model: str, prompt_version: int, first_message_id: int, last_message_id: int,
+            message_count: int, summary: str):
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('''
+                INSERT OR REPLACE INTO block_summaries
+                (block_key, model, prompt_version, first_message_id, last_message_id, message_count, summary,
+                 created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, model, prompt_version, first_message_id, last_message_id, message_count, summary, now, now))
+            conn.commit()
+            conn.close()
+            self.counters['stored'] += 1
+        except Exception as e:
+            logger.error(f'Error storing block summary: {e}')
+
+    def evict(self):
+        """Drop the least recently used summaries beyond max_entries"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM block_summaries WHERE block_key IN (
+                    SELECT block_key FROM block_summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            overflow = cursor.rowcount
+            conn.commit()
+            conn.close()
+            if overflow:
+                logger.info(f'Block summary store evicted {overflow} least recently used summaries')
+        except Exception as e:
+            logger.error(f'Error evicting block summaries: {e}')
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
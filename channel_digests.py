@@ -0,0 +1,383 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from grok_scheduler import PRIORITY_BULK
+from history_pipeline import MessageCompactor
+from prompt_assembly import assemble_messages, digest_system_prefix, encode_history
+
+logger = logging.getLogger('GrokBot')
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# "summarize the last week", "what happened in the channel today?", "recap the past 3 days" - a
+# summary of everything in a time window, with no topic or user filter
+SUMMARY_WINDOW_PATTERN = re.compile(
+    r"^(?:hey |yo )?(?:can you |could you |please |pls )*"
+    r"(?:(?:summari[sz]e|give (?:me |us )?a (?:summary|recap)(?: of)?|recap|tl;?dr|catch (?:me|us) up(?: on)?)"
+    r"(?: what(?: happened|(?:'s| has) been (?:going on|happening)| was said))?"
+    r"|what happened|what(?:'s| has) been (?:going on|happening)|what did (?:i|we) miss)"
+    r"(?: (?:in|on|of|from|for|over|during|to))?(?: (?:the|this|our))?"
+    r"(?: (?:chat|channel|server|here|everything|things|stuff|conversations?|discussions?))?"
+    r"(?: (?:in|on|of|from|for|over|during))?(?: (?:the|this))?"
+    r" (?P<window>(?:last|past) (?:(?P<count>\d+|few|couple(?: of)?) )?(?P<unit>hour|day|week|month)s?"
+    r"|24 hours|today|yesterday|recently|this week|this month)"
+    r"[\s?!.]*$"
+)
+
+UNIT_SECONDS = {'hour': HOUR, 'day': DAY, 'week': 7 * DAY, 'month': 30 * DAY}
+FIXED_WINDOWS = {'24 hours': DAY, 'today': DAY, 'yesterday': 2 * DAY, 'recently': DAY,
+                 'this week': 7 * DAY, 'this month': 30 * DAY}
+
+
+def parse_summary_window(query: str) -> Optional[int]:
+    """Seconds covered by a plain "summarize the last <period>" question, or None for any other question"""
+    match = SUMMARY_WINDOW_PATTERN.match(" ".join(query.lower().split()))
+    if not match:
+        return None
+    window = match.group('window')
+    if window in FIXED_WINDOWS:
+        return FIXED_WINDOWS[window]
+    count = match.group('count')
+    if count is None:
+        count = 1
+    elif not count.isdigit():
+        count = 3 if count == 'few' else 2
+    return int(count) * UNIT_SECONDS[match.group('unit')]
+
+
+def utc(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def local_day_start(timestamp: int, tz) -> int:
+    """Epoch seconds of the local midnight starting the day that contains timestamp"""
+    local = datetime.fromtimestamp(timestamp, tz)
+    start = timestamp - (local.hour * HOUR + local.minute * 60 + local.second)
+    # On a DST change the wall clock since midnight is off by the shift
+    hour = datetime.fromtimestamp(start, tz).hour
+    if hour:
+        start -= hour * HOUR if hour < 12 else (hour - 24) * HOUR
+    return start
+
+
+class Digest:
+    """Summary of one channel's messages in one hour or day window"""
+
+    __slots__ = ('granularity', 'window_start', 'window_end', 'first_message_id', 'last_message_id',
+                 'message_count', 'summary')
+
+    def __init__(self, granularity: str, window_start: int, window_end: int, first_message_id: int,
+                 last_message_id: int, message_count: int, summary: str):
+        self.granularity = granularity  # 'hour' or 'day'
+        self.window_start = window_start  # Epoch seconds (UTC)
+        self.window_end = window_end
+        self.first_message_id = first_message_id
+        self.last_message_id = last_message_id
+        self.message_count = message_count
+        self.summary = summary
+
+
+class DigestState:
+    """How far a channel's digests reach: [covered_from, covered_until) and the newest message digested"""
+
+    __slots__ = ('covered_from', 'covered_until', 'last_message_id')
+
+    def __init__(self, covered_from: int, covered_until: int, last_message_id: Optional[int]):
+        self.covered_from = covered_from
+        self.covered_until = covered_until
+        self.last_message_id = last_message_id
+
+
+class DigestStore:
+    """Hourly and daily channel digests in the conversation SQLite DB"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def init_db(self):
+        """Create the digest tables"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_digests (
+                channel_id INTEGER NOT NULL,
+                granularity TEXT NOT NULL,
+                window_start INTEGER NOT NULL,
+                window_end INTEGER NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                model TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (channel_id, granularity, window_start)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_digest_state (
+                channel_id INTEGER PRIMARY KEY,
+                covered_from INTEGER NOT NULL,
+                covered_until INTEGER NOT NULL,
+                last_message_id INTEGER
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def put(self, channel_id: int, digest: Digest, model: str):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT OR REPLACE INTO channel_digests
+            (channel_id, granularity, window_start, window_end, first_message_id, last_message_id,
+             message_count, summary, model, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (channel_id, digest.granularity, digest.window_start, digest.window_end, digest.first_message_id,
+              digest.last_message_id, digest.message_count, digest.summary, model, time.time()))
+        conn.commit()
+        conn.close()
+
+    def digests(self, channel_id: int, granularity: str, start: int = 0, end: Optional[int] = None) -> List[Digest]:
+        """Digests of one granularity overlapping [start, end), oldest first"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT granularity, window_start, window_end, first_message_id, last_message_id, message_count, summary
+            FROM channel_digests
+            WHERE channel_id = ? AND granularity = ? AND window_end > ? AND window_start < ?
+            ORDER BY window_start
+        ''', (channel_id, granularity, start, end if end is not None else 2 ** 62))
+        rows = cursor.fetchall()
+        conn.close()
+        return [Digest(*row) for row in rows]
+
+    def get_state(self, channel_id: int) -> Optional[DigestState]:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT covered_from, covered_until, last_message_id FROM channel_digest_state WHERE channel_id = ?
+        ''', (channel_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return DigestState(*row) if row else None
+
+    def set_state(self, channel_id: int, state: DigestState):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT OR REPLACE INTO channel_digest_state (channel_id, covered_from, covered_until, last_message_id)
+            VALUES (?, ?, ?, ?)
+        ''', (channel_id, state.covered_from, state.covered_until, state.last_message_id))
+        conn.commit()
+        conn.close()
+
+    def cover(self, channel_id: int, start: int) -> Optional[Tuple[List[Digest], DigestState]]:
+        """
+        Digests covering everything from start up to the channel's last digested hour: whole days
+        first, then the hours after the newest day. None if the digests don't reach back to start.
+        """
+        state = self.get_state(channel_id)
+        if state is None or state.covered_from > start + HOUR:
+            return None
+        days = self.digests(channel_id, 'day', start)
+        hours_from = days[-1].window_end if days else start - start % HOUR
+        hours = self.digests(channel_id, 'hour', hours_from)
+        return days + hours, state
+
+    def cleanup(self, hourly_retention: int, daily_retention: int):
+        """Drop hourly digests already rolled up into days past hourly_retention, and old days"""
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM channel_digests
+                WHERE granularity = 'hour' AND window_end < ? AND EXISTS (
+                    SELECT 1 FROM channel_digests AS day
+                    WHERE day.channel_id = channel_digests.channel_id AND day.granularity = 'day'
+                      AND day.window_start <= channel_digests.window_start
+                      AND day.window_end >= channel_digests.window_end
+                )
+            ''', (now - hourly_retention,))
+            hourly = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM channel_digests WHERE granularity = 'day' AND window_end < ?
+            ''', (now - daily_retention,))
+            daily = cursor.rowcount
+            # Coverage now starts where the oldest remaining digest does
+            cursor.execute('''
+                UPDATE channel_digest_state SET covered_from = MAX(covered_from, ?)
+            ''', (int(now - daily_retention),))
+            conn.commit()
+            conn.close()
+            if hourly or daily:
+                logger.info(f'Digest cleanup removed {hourly} hourly and {daily} daily digests')
+        except Exception as e:
+            logger.error(f'Error cleaning up channel digests: {e}')
+
+    def stats(self) -> dict:
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT granularity, COUNT(*) FROM channel_digests GROUP BY granularity')
+            counts = dict(cursor.fetchall())
+            cursor.execute('SELECT COUNT(*) FROM channel_digest_state')
+            channels = cursor.fetchone()[0]
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error reading digest stats: {e}')
+            counts, channels = {}, 0
+        return {'channels': channels, 'hourly': counts.get('hour', 0), 'daily': counts.get('day', 0)}
+
+
+class DigestBuilder:
+    """
+    Background builder of hourly and daily digests for channels with new messages.
+
+    on_message marks channels active; every `interval` seconds each active channel's complete
+    hours since its last digest are fetched once, and every hour that has messages gets a digest
+    (bulk priority, through the shared scheduler). Local days (bot timezone) whose hours are all in
+    are rolled up into a daily digest from the hourly ones. A channel seen for the first time is digested back
+    `lookback_hours`.
+    """
+
+    def __init__(self, store: DigestStore, complete, model: str, tz, interval: int = 900,
+                 lookback_hours: int = 48, max_messages: int = 20000, max_window_messages: int = 500):
+        self.store = store
+        self.complete = complete  # grok_complete(request_params, *, priority, guild_id, request_type)
+        self.model = model
+        self.tz = tz
+        self.interval = interval
+        self.lookback_hours = lookback_hours
+        self.max_messages = max_messages  # Per channel per run
+        self.max_window_messages = max_window_messages  # Newest messages digested per hour
+        self._active: Dict[int, float] = {}  # {channel_id: newest message timestamp}
+        self.counters = {'hourly_built': 0, 'daily_built': 0, 'failures': 0}
+
+    def mark_active(self, channel_id: int, timestamp: float):
+        self._active[channel_id] = max(timestamp, self._active.get(channel_id, 0))
+
+    async def run(self, get_channel):
+        """Build digests forever (start once from on_ready)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            for channel_id, newest in list(self._active.items()):
+                channel = get_channel(channel_id)
+                if channel is None:
+                    self._active.pop(channel_id, None)
+                    continue
+                try:
+                    await self.build_channel(channel)
+                except Exception as e:
+                    self.counters['failures'] += 1
+                    logger.error(f'Error building digests for channel {channel_id}: {e}')
+                    continue
+                # Keep the channel active until the hour of its newest message has been digested
+                state = self.store.get_state(channel_id)
+                if state and newest < state.covered_until and self._active.get(channel_id) == newest:
+                    del self._active[channel_id]
+
+    async def _summarize(self, history: str, query: str, guild_id: Optional[int]) -> str:
+        completion = await self.complete(
+            {"model": self.model, "messages": assemble_messages(digest_system_prefix(), query, history=history)},
+            priority=PRIORITY_BULK,
+            guild_id=guild_id,
+            request_type='digest'
+        )
+        return completion.choices[0].message.content.strip()
+
+    async def build_channel(self, channel) -> int:
+        """Digest the channel's complete hours since its last run; returns the number of digests written"""
+        until = int(time.time()) // HOUR * HOUR
+        state = self.store.get_state(channel.id)
+        if state is None:
+            since = until - self.lookback_hours * HOUR
+            state = DigestState(since, since, None)
+        if state.covered_until >= until:
+            return 0
+        guild_id = channel.guild.id if getattr(channel, 'guild', None) else None
+
+        # One pass over the new messages, bucketed by hour
+        compact = MessageCompactor(channel)
+        buckets = {}  # {hour_start: [MessageRecord, ...]} oldest first
+        fetched = 0
+        async for msg in channel.history(limit=self.max_messages, after=utc(state.covered_until),
+                                         before=utc(until), oldest_first=True):
+            fetched += 1
+            if msg.author.bot or not msg.content.strip():
+                continue
+            hour = int(msg.created_at.timestamp()) // HOUR * HOUR
+            buckets.setdefault(hour, []).append(compact(msg))
+        if fetched >= self.max_messages and buckets:
+            # Hit the per-run cap: the newest hour may be incomplete, so leave it for the next run
+            until = max(buckets)
+            del buckets[until]
+
+        built = 0
+        for hour, records in sorted(buckets.items()):
+            local = utc(hour).astimezone(self.tz)
+            encoded = encode_history(records[-self.max_window_messages:], self.tz,
+                                     f"Channel messages {local.strftime('%Y-%m-%d %H:00 %Z')} (one hour):")
+            try:
+                summary = await self._summarize(encoded.text, "Write the digest for this hour.", guild_id)
+            except Exception:
+                # Stop here; the next run resumes from this hour
+                self.store.set_state(channel.id, DigestState(state.covered_from, hour, state.last_message_id))
+                raise
+            self.store.put(channel.id, Digest('hour', hour, hour + HOUR, records[0].id, records[-1].id,
+                                              len(records), summary), self.model)
+            state.last_message_id = records[-1].id
+            self.counters['hourly_built'] += 1
+            built += 1
+
+        self.store.set_state(channel.id, DigestState(state.covered_from, until, state.last_message_id))
+        built += await self._roll_up_days(channel.id, min(state.covered_until, until - 3 * DAY), until, guild_id)
+        if built:
+            logger.info(f'Built {built} digests for channel {channel.id}')
+        return built
+
+    async def _roll_up_days(self, channel_id: int, since: int, until: int, guild_id: Optional[int]) -> int:
+        """Combine the hourly digests of each finished local day since `since` without a daily digest yet"""
+        since = local_day_start(since, self.tz)
+        done_days = {digest.window_start for digest in self.store.digests(channel_id, 'day', since)}
+        by_day = {}
+        for digest in self.store.digests(channel_id, 'hour', since, until):
+            day = local_day_start(digest.window_start, self.tz)
+            if day not in done_days and local_day_start(day + 26 * HOUR, self.tz) <= until:
+                by_day.setdefault(day, []).append(digest)
+
+        built = 0
+        for day, hours in sorted(by_day.items()):
+            if len(hours) == 1:
+                summary = hours[0].summary
+            else:
+                local_day = utc(day).astimezone(self.tz)
+                lines = [
+                    f"[{utc(h.window_start).astimezone(self.tz).strftime('%H:00')}, {h.message_count} messages] {h.summary}"
+                    for h in hours
+                ]
+                history = "\n".join([f"Hourly digests for {local_day.strftime('%Y-%m-%d')} (times {local_day.strftime('%Z')}):", *lines])
+                summary = await self._summarize(history, "Combine these hourly digests into one digest of the day.", guild_id)
+            day_end = local_day_start(day + 26 * HOUR, self.tz)
+            self.store.put(channel_id, Digest('day', day, day_end, hours[0].first_message_id, hours[-1].last_message_id,
+                                              sum(h.message_count for h in hours), summary), self.model)
+            self.counters['daily_built'] += 1
+            built += 1
+        return built
+
+    def stats(self) -> dict:
+        return dict(self.counters, active_channels=len(self._active), **self.store.stats())
+
+
+def digest_history_block(digests: List[Digest], tz) -> str:
+    """Digests as prompt lines: "[2025-01-06 (day), 812 messages] summary" / "[2025-01-07 14:00, 40 messages] ..." """
+    lines = ["Digests:"]
+    for digest in digests:
+        local = utc(digest.window_start).astimezone(tz)
+        when = local.strftime('%Y-%m-%d') + " (day)" if digest.granularity == 'day' else local.strftime('%Y-%m-%d %H:00')
+        lines.append(f"[{when}, {digest.message_count} messages] {digest.summary}")
+    return "\n".join(lines)
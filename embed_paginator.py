@@ -0,0 +1,126 @@
+import logging
+import re
+from typing import Callable, List, Optional
+
+import discord
+
+logger = logging.getLogger('GrokBot')
+
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_TOTAL_LIMIT = 6000  # title + description + footer + author + fields
+
+# Spans a page break must never fall inside: markdown links, mentions / custom emoji, bare URLs
+UNBREAKABLE_PATTERN = re.compile(r'\[[^\]\n]*\]\(<?[^)\s]*>?\)|<[^<>\s]*>|https?://\S+')
+
+# Preferred break points, best first (the break goes after the separator)
+BREAK_SEPARATORS = ('\n\n', '\n', '. ', ' ')
+
+BuildEmbed = Callable[[str, int, int], discord.Embed]
+
+
+def paginate_text(text: str, limit: int) -> List[str]:
+    """
+    Split text into pages of at most `limit` characters in one pass.
+
+    Pages break at the latest paragraph, line, sentence or word boundary in the back half of the
+    page, and never inside a markdown link, mention or URL (unless one is longer than a page).
+    """
+    text = text.strip()
+    if len(text) <= limit:
+        return [text] if text else []
+
+    spans = [match.span() for match in UNBREAKABLE_PATTERN.finditer(text)]
+    span_index = 0
+    pages = []
+    start = 0
+    while len(text) - start > limit:
+        end = start + limit
+        cut = -1
+        for separator in BREAK_SEPARATORS:
+            found = text.rfind(separator, start + limit // 2, end)
+            if found != -1:
+                cut = found + len(separator)
+                break
+        if cut == -1:
+            cut = end
+
+        # Move the break in front of any link / mention / URL it would split
+        while span_index < len(spans) and spans[span_index][1] <= start:
+            span_index += 1
+        i = span_index
+        while i < len(spans) and spans[i][0] < cut:
+            span_start, span_end = spans[i]
+            if span_start < cut < span_end and span_start > start:
+                cut = span_start
+                break
+            i += 1
+
+        page = text[start:cut].strip()
+        if page:
+            pages.append(page)
+        start = cut
+    tail = text[start:].strip()
+    if tail:
+        pages.append(tail)
+    return pages
+
+
+class EmbedPaginator(discord.ui.View):
+    """One message with previous/next buttons; each page's embed is built only when shown"""
+
+    def __init__(self, pages: List[str], build_embed: BuildEmbed, timeout: float = 900):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.build_embed = build_embed
+        self.page = 0
+        self.message: Optional[discord.Message] = None
+        self._sync_buttons()
+
+    def render(self) -> discord.Embed:
+        return self.build_embed(self.pages[self.page], self.page + 1, len(self.pages))
+
+    def _sync_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, len(self.pages) - 1))
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        # Drop the buttons once nobody can use them any more
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+
+async def send_paginated(reply, text: str, build_embed: BuildEmbed) -> discord.Message:
+    """
+    Send text as a single embed message, paged behind buttons if it doesn't fit in one embed.
+
+    reply: coroutine function that sends the message (e.g. message.reply or ctx.reply)
+    build_embed(description, page, pages): builds the embed for one page
+    """
+    # Measure everything but the description with the widest possible page indicator
+    overhead = len(build_embed("", 99, 99))
+    limit = min(EMBED_DESCRIPTION_LIMIT, EMBED_TOTAL_LIMIT - overhead)
+    pages = paginate_text(text, limit) or [""]
+
+    if len(pages) == 1:
+        return await reply(embed=build_embed(pages[0], 1, 1))
+
+    logger.info(f'Response paginated into {len(pages)} pages ({len(text)} chars)')
+    view = EmbedPaginator(pages, build_embed)
+    view.message = await reply(embed=view.render(), view=view)
+    return view.message
@@ -0,0 +1,89 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from block_summaries import CITATION_GROUP_PATTERN, NUMBER_PATTERN
+from history_pipeline import MessageRecord
+
+# "[N] ..." message lines of a history block
+LINE_NUMBER_PATTERN = re.compile(r"^\[(\d+)\]", re.MULTILINE)
+# "#3-#7" inside a citation group
+RANGE_PATTERN = re.compile(r"(\d+)\s*[-–]\s*#?(\d+)")
+MAX_RANGE = 200  # Longer cited ranges keep only their ends
+
+
+def numbers_in_history(history: str) -> set:
+    """Message numbers a history block shows or cites (message lines, or [#N] citations in map-reduce notes)"""
+    numbers = {int(n) for n in LINE_NUMBER_PATTERN.findall(history)}
+    for group in CITATION_GROUP_PATTERN.findall(history):
+        numbers.update(int(n) for n in NUMBER_PATTERN.findall(group))
+        for first, last in RANGE_PATTERN.findall(group):
+            if 0 < int(last) - int(first) <= MAX_RANGE:
+                numbers.update(range(int(first), int(last) + 1))
+    return numbers
+
+
+class SearchContext:
+    """What a !search result was based on, kept so replies to it can be answered without rescanning"""
+
+    __slots__ = ('channel_id', 'searched_user_id', 'query', 'history', 'number_map', 'authors', 'created_at')
+
+    def __init__(self, channel_id: int, searched_user_id: Optional[int], query: str, history: str,
+                 number_map: Dict[int, MessageRecord], authors: dict):
+        self.channel_id = channel_id
+        self.searched_user_id = searched_user_id
+        self.query = query
+        self.history = history  # The history block exactly as the search prompt had it
+        # Only the messages that block shows or cites, for resolving the follow-up's citations
+        shown = numbers_in_history(history)
+        self.number_map = {number: record for number, record in number_map.items() if number in shown}
+        self.authors = authors  # {'A1': author} legend of the block
+        self.created_at = time.monotonic()
+
+
+class FollowUpStore:
+    """
+    Compact follow-up context for search results, keyed by the bot's result message ID.
+
+    The history block sent to Grok is kept as it was, so a follow-up prompt repeats it byte for byte,
+    with the scan's MessageRecords (text already cut to 300 characters) of the messages it shows or
+    cites. Entries expire `ttl` seconds after the search and the least recently
+    used are evicted beyond `max_entries`, so memory stays bounded in a long-running process.
+    """
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 200):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {result_message_id: SearchContext}
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+
+    def put(self, result_message_id: int, context: SearchContext):
+        """Attach a context to a result message (several results, e.g. cached repeats, may share one)"""
+        self._entries[result_message_id] = context
+        self._entries.move_to_end(result_message_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evicted'] += 1
+
+    def get(self, result_message_id: int) -> Optional[SearchContext]:
+        context = self._entries.get(result_message_id)
+        if context is None:
+            self.counters['misses'] += 1
+            return None
+        if time.monotonic() - context.created_at > self.ttl:
+            del self._entries[result_message_id]
+            self.counters['expired'] += 1
+            self.counters['misses'] += 1
+            return None
+        self._entries.move_to_end(result_message_id)
+        self.counters['hits'] += 1
+        return context
+
+    def stats(self) -> dict:
+        contexts = {id(context): context for context in self._entries.values()}
+        return dict(
+            self.counters,
+            entries=len(self._entries),
+            messages=sum(len(context.number_map) for context in contexts.values()),
+        )
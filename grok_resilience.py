@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import openai
+
+logger = logging.getLogger('GrokBot')
+
+# HTTP statuses worth retrying (timeouts, conflicts, rate limits, server errors)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when Grok calls are short-circuited after repeated failures"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for transient Grok errors (rate limits, timeouts, connection drops, 5xx)"""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError,
+                          openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the server's Retry-After hint (seconds or milliseconds) from an API error"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker: closed -> open after `threshold` consecutive transient
+    failures, half-open after `cooldown` seconds (one probe request), closed again on success.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        state = self.state
+        if state == 'open':
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(f"Grok is temporarily unavailable (retrying in {remaining:.0f}s)")
+        if state == 'half-open':
+            if self._probe_in_flight:
+                raise CircuitOpenError("Grok is temporarily unavailable (recovery check in progress)")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Let another request probe if the half-open probe was abandoned"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logger.warning(f'Grok circuit breaker opened after {self.failures} consecutive failures')
+            self.opened_at = time.monotonic()
+
+
+class AttemptTimer:
+    """
+    Times one attempt from when its request actually goes upstream, not from when it was queued.
+    The attempt calls mark_dispatched() as it leaves the scheduler's queue; an attempt that never
+    does is timed from its start.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.dispatched = asyncio.Event()
+
+    def mark_dispatched(self):
+        self.started = time.monotonic()
+        self.dispatched.set()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+class LatencyTracker:
+    """Rolling window of successful upstream call latencies (queue wait excluded)"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class GrokResilience:
+    """
+    Retry / circuit breaker / hedging wrapper around a Grok call.
+
+    - Transient errors are retried with full-jitter exponential backoff, never sooner
+      than the server's Retry-After
+    - A circuit breaker fails fast while Grok is down instead of piling up requests
+    - Hedged requests: for latency-critical calls, a duplicate is sent once the first
+      attempt has been upstream longer than the recent p95 latency; the first answer wins
+
+    attempt_fn is called with an on_dispatch callback to call when the request leaves any queue
+    and goes upstream, so latency samples and the hedging timer don't count queue wait. Rate limits
+    (handled by pausing the scheduler) and caller-side errors don't move the circuit breaker.
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 20.0,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0,
+                 hedge_enabled: bool = True, hedge_min_samples: int = 20,
+                 on_rate_limited: Optional[Callable[[float], None]] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.latency = LatencyTracker()
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.on_rate_limited = on_rate_limited
+        self.counters = {
+            'calls': 0,
+            'retries': 0,
+            'success_after_retry': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'hedges_sent': 0,
+            'hedges_won': 0,
+        }
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def call(self, attempt_fn: Callable[[Callable[[], None]], Awaitable], *, hedge: bool = False):
+        """Run attempt_fn(on_dispatch) (a coroutine factory) with retries, circuit breaking and optional hedging"""
+        self.counters['calls'] += 1
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.counters['short_circuited'] += 1
+                raise
+            try:
+                if hedge and self.hedge_enabled:
+                    result, elapsed = await self._hedged(attempt_fn)
+                else:
+                    timer = AttemptTimer()
+                    result = await attempt_fn(timer.mark_dispatched)
+                    elapsed = timer.elapsed
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Caller-side errors (bad request, auth) say nothing about Grok's health
+                    self.breaker.release_probe()
+                    self.counters['failures'] += 1
+                    raise
+                if isinstance(e, openai.RateLimitError) or getattr(e, 'status_code', None) == 429:
+                    # Our own request rate, not Grok's health: the scheduler pauses instead
+                    self.breaker.release_probe()
+                    if self.on_rate_limited:
+                        self.on_rate_limited(retry_after_seconds(e) or self.base_delay)
+                else:
+                    self.breaker.record_failure()
+                if attempt >= self.max_retries or self.breaker.state != 'closed':
+                    self.counters['failures'] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.counters['retries'] += 1
+                logger.warning(f'Transient Grok error ({e.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s')
+                await asyncio.sleep(delay)
+                continue
+
+            self.latency.record(elapsed)
+            self.breaker.record_success()
+            if attempt > 0:
+                self.counters['success_after_retry'] += 1
+                logger.info(f'Grok call succeeded after {attempt} retr{"y" if attempt == 1 else "ies"}')
+            return result
+
+    async def _hedged(self, attempt_fn: Callable[[Callable[[], None]], Awaitable]):
+        """Returns (result, upstream seconds of the attempt that answered)"""
+        primary_timer = AttemptTimer()
+        threshold = self.latency.percentile(0.95)
+        if threshold is None or len(self.latency.samples) < self.hedge_min_samples:
+            result = await attempt_fn(primary_timer.mark_dispatched)
+            return result, primary_timer.elapsed
+
+        primary = asyncio.ensure_future(attempt_fn(primary_timer.mark_dispatched))
+        # The hedge timer starts once the request is upstream, not while it waits in the queue
+        dispatched = asyncio.ensure_future(primary_timer.dispatched.wait())
+        await asyncio.wait({primary, dispatched}, return_when=asyncio.FIRST_COMPLETED)
+        dispatched.cancel()
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result(), primary_timer.elapsed
+
+        self.counters['hedges_sent'] += 1
+        logger.info(f'Grok call exceeded p95 latency ({threshold:.2f}s), sending hedged request')
+        backup_timer = AttemptTimer()
+        backup = asyncio.ensure_future(attempt_fn(backup_timer.mark_dispatched))
+        timers = {primary: primary_timer, backup: backup_timer}
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is backup:
+                        self.counters['hedges_won'] += 1
+                    return task.result(), timers[task].elapsed
+                error = task.exception()
+        raise error
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(0.95)
+        return dict(self.counters, breaker=self.breaker.state, latency_p95=p95 or 0.0)
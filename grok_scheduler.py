@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+logger = logging.getLogger('GrokBot')
+
+# Request priorities (lower value = dispatched first)
+PRIORITY_INTERACTIVE = 0  # Mentions, replies, classification - a user is waiting on a short answer
+PRIORITY_BULK = 1  # History analysis over hundreds of messages
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+
+def estimate_request_tokens(request_params: dict, default_output_tokens: int = 1000) -> int:
+    """Rough token estimate for a chat request (~4 characters per token plus expected output)"""
+    chars = 0
+    for msg in request_params.get('messages', []):
+        content = msg.get('content', '')
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'text':
+                    chars += len(part.get('text', ''))
+                else:
+                    chars += 4000  # Images cost roughly a thousand tokens each
+    return chars // 4 + request_params.get('max_tokens', default_output_tokens)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Take `amount` units; the balance may go negative, which delays later requests"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Correct the balance once the real cost of a request is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def drain(self, seconds: float):
+        """Empty the bucket so nothing is available for `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class _Job:
+    __slots__ = ('request_params', 'priority', 'guild_id', 'request_type', 'tokens', 'future', 'enqueued_at',
+                 'on_dispatch')
+
+    def __init__(self, request_params, priority, guild_id, request_type, tokens, future, on_dispatch=None):
+        self.request_params = request_params
+        self.priority = priority
+        self.guild_id = guild_id
+        self.request_type = request_type
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.on_dispatch = on_dispatch  # Called when the request leaves the queue and goes upstream
+
+
+class GrokScheduler:
+    """
+    Central scheduler for all Grok chat completions.
+
+    - Token buckets limit requests per minute and tokens per minute
+    - Interactive requests are dispatched before bulk history analysis
+      (bulk requests waiting longer than bulk_max_wait are promoted so they never starve)
+    - Within a priority, guilds are served round-robin so one busy guild cannot
+      push everyone else to the back of the line
+    - The blocking OpenAI client runs in worker threads, keeping the event loop free
+    """
+
+    def __init__(self, client, requests_per_minute: int = 120, tokens_per_minute: int = 1_000_000,
+                 max_concurrency: int = 8, bulk_max_wait: float = 30.0):
+        self.client = client
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.bulk_max_wait = bulk_max_wait
+        # {priority: OrderedDict({guild_id: deque([_Job])})}
+        self._queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_BULK: OrderedDict()}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._wait_times = {p: deque(maxlen=200) for p in self._queues}
+        self._completed = 0
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+            logger.info(f'Grok scheduler started (max {self.max_concurrency} concurrent requests)')
+
+    async def submit(self, request_params: dict, *, priority: int = PRIORITY_INTERACTIVE,
+                     guild_id: Optional[int] = None, request_type: str = 'general',
+                     on_dispatch: Optional[Callable[[], None]] = None):
+        """Queue a chat completion and wait for its result (on_dispatch is called when it goes upstream)"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(request_params, priority, guild_id, request_type,
+                   estimate_request_tokens(request_params), future, on_dispatch)
+        guild_queues = self._queues[priority]
+        if guild_id not in guild_queues:
+            guild_queues[guild_id] = deque()
+        guild_queues[guild_id].append(job)
+        self._wakeup.set()
+        return await future
+
+    def _next_priority(self) -> Optional[int]:
+        interactive = self._queues[PRIORITY_INTERACTIVE]
+        bulk = self._queues[PRIORITY_BULK]
+        if bulk:
+            oldest_bulk = min(q[0].enqueued_at for q in bulk.values())
+            if time.monotonic() - oldest_bulk > self.bulk_max_wait:
+                return PRIORITY_BULK
+        if interactive:
+            return PRIORITY_INTERACTIVE
+        if bulk:
+            return PRIORITY_BULK
+        return None
+
+    def _peek(self) -> Optional[_Job]:
+        priority = self._next_priority()
+        if priority is None:
+            return None
+        guild_queues = self._queues[priority]
+        return guild_queues[next(iter(guild_queues))][0]
+
+    def _pop(self) -> Optional[_Job]:
+        priority = self._next_priority()
+        if priority is None:
+            return None
+        guild_queues = self._queues[priority]
+        guild_id = next(iter(guild_queues))
+        jobs = guild_queues[guild_id]
+        job = jobs.popleft()
+        # Round-robin: the guild just served goes to the back of the line
+        if jobs:
+            guild_queues.move_to_end(guild_id)
+        else:
+            del guild_queues[guild_id]
+        return job
+
+    def _drop_cancelled(self):
+        for guild_queues in self._queues.values():
+            for guild_id in list(guild_queues):
+                jobs = guild_queues[guild_id]
+                while jobs and jobs[0].future.done():
+                    jobs.popleft()
+                if not jobs:
+                    del guild_queues[guild_id]
+
+    async def _dispatch_loop(self):
+        while True:
+            self._drop_cancelled()
+            job = self._peek()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(job.tokens))
+            if wait > 0:
+                # Re-evaluate early if a new (possibly higher priority) job arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            self._drop_cancelled()
+            job = self._pop()
+            if job is None:
+                self._slots.release()
+                continue
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(job.tokens)
+            self._wait_times[job.priority].append(time.monotonic() - job.enqueued_at)
+            self._in_flight += 1
+            asyncio.create_task(self._run(job))
+
+    async def _run(self, job: _Job):
+        try:
+            if job.on_dispatch:
+                job.on_dispatch()
+            completion = await asyncio.to_thread(self.client.chat.completions.create, **job.request_params)
+            usage = getattr(completion, 'usage', None)
+            if usage and getattr(usage, 'total_tokens', None):
+                self.token_bucket.adjust(usage.total_tokens - job.tokens)
+            if not job.future.done():
+                job.future.set_result(completion)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._slots.release()
+
+    def pause(self, seconds: float):
+        """Hold back all dispatching for `seconds` (e.g. after a 429 with Retry-After)"""
+        self.request_bucket.drain(seconds)
+        logger.warning(f'Grok scheduler paused for {seconds:.1f}s after rate limit')
+
+    def queue_depth(self, priority: Optional[int] = None) -> int:
+        """Number of requests waiting to be dispatched"""
+        priorities = [priority] if priority is not None else list(self._queues)
+        return sum(len(jobs) for p in priorities for jobs in self._queues[p].values())
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight count and wait times (avg / p95 seconds) per priority"""
+        result = {
+            'in_flight': self._in_flight,
+            'completed': self._completed,
+            'queued_guilds': len({g for q in self._queues.values() for g in q}),
+        }
+        for priority, name in PRIORITY_NAMES.items():
+            waits = sorted(self._wait_times[priority])
+            result[f'{name}_queued'] = self.queue_depth(priority)
+            result[f'{name}_wait_avg'] = sum(waits) / len(waits) if waits else 0.0
+            result[f'{name}_wait_p95'] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return result
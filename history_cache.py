@@ -0,0 +1,107 @@
+import bisect
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from response_cache import normalize_prompt
+
+logger = logging.getLogger('GrokBot')
+
+
+class ChannelActivityTracker:
+    """Recent (non-bot) message IDs per channel, fed from on_message"""
+
+    def __init__(self, per_channel: int = 1000):
+        self.per_channel = per_channel
+        self._recent = {}  # {channel_id: deque([message_id, ...])} in ascending order
+
+    def record(self, channel_id: int, message_id: int):
+        ids = self._recent.get(channel_id)
+        if ids is None:
+            ids = self._recent[channel_id] = deque(maxlen=self.per_channel)
+        if not ids or message_id > ids[-1]:
+            ids.append(message_id)
+
+    def messages_since(self, channel_id: int, message_id: int) -> int:
+        """How many messages arrived in the channel after message_id (capped at per_channel)"""
+        ids = self._recent.get(channel_id)
+        if not ids:
+            return 0
+        return len(ids) - bisect.bisect_right(ids, message_id)
+
+
+class HistoryAnalysis:
+    """A finished history analysis, ready to be re-sent without scanning or prompting again"""
+
+    __slots__ = ('title', 'text', 'usage_text', 'channel_id', 'newest_message_id', 'messages_found',
+                 'messages_analyzed', 'followup', 'created_at')
+
+    def __init__(self, title: str, text: str, usage_text: str, channel_id: int, newest_message_id: int,
+                 messages_found: int, messages_analyzed: int, followup=None):
+        self.title = title
+        self.text = text
+        self.usage_text = usage_text
+        self.channel_id = channel_id
+        self.newest_message_id = newest_message_id
+        self.messages_found = messages_found
+        self.messages_analyzed = messages_analyzed
+        self.followup = followup  # Optional SearchContext for answering replies to the result
+        self.created_at = time.monotonic()
+
+
+def make_history_cache_key(kind: str, channel_id: int, target_user_id: Optional[int], query: str,
+                           keyword_filter: Optional[str], limit: Optional[int]) -> tuple:
+    """Key a history analysis by channel, target user, normalized query, keyword filter and scan size"""
+    return (
+        kind,
+        channel_id,
+        target_user_id,
+        normalize_prompt(query),
+        keyword_filter.lower() if keyword_filter else None,
+        limit,
+    )
+
+
+class HistoryResultCache:
+    """
+    LRU cache of history analysis results.
+
+    An entry is served while fewer than `stale_after_messages` new messages have arrived in its
+    channel after the newest message the analysis included, and it is younger than `max_age`.
+    """
+
+    def __init__(self, tracker: ChannelActivityTracker, stale_after_messages: int = 25,
+                 max_age: int = 3600, max_entries: int = 500):
+        self.tracker = tracker
+        self.stale_after_messages = stale_after_messages
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {key: HistoryAnalysis}
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def get(self, key: tuple) -> Optional[HistoryAnalysis]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters['misses'] += 1
+            return None
+        new_messages = self.tracker.messages_since(entry.channel_id, entry.newest_message_id)
+        if new_messages > self.stale_after_messages or time.monotonic() - entry.created_at > self.max_age:
+            del self._entries[key]
+            self.counters['stale'] += 1
+            self.counters['misses'] += 1
+            logger.info(f'History cache entry stale ({new_messages} new messages since analysis)')
+            return None
+        self._entries.move_to_end(key)
+        self.counters['hits'] += 1
+        logger.info(f'History cache hit ({new_messages} new messages since analysis)')
+        return entry
+
+    def put(self, key: tuple, entry: HistoryAnalysis):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return dict(self.counters, entries=len(self._entries))
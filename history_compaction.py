@@ -0,0 +1,134 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+DROP = -1  # HistoryCompactor.admit verdict for a message left out of the prompt
+
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:\d+>")
+URL_PATTERN = re.compile(r"https?://\S+")
+MENTION_PATTERN = re.compile(r"<[@#][!&]?\d+>")
+STOCK_REACTION_PATTERN = re.compile(
+    r"^(?:(?:lol|lmao|lmfao|rofl|ha(?:ha)+|he(?:he)+|xd+|ok(?:ay)?|k+|ty|thx|thanks|yes|yeah|yep|ya|no|nope|nah|same|"
+    r"true|fr|\+1|this|based|w|l|gg|wow|nice|damn|bruh|omg|wtf|rip|f|lfg|real|oof|ikr|mood|facts)\W*)+$"
+)
+NORMALIZE_PATTERN = re.compile(r"[^\w\s:/.]")
+
+DROP_RULES = ('reactions', 'short', 'links', 'mentions')
+
+# MinHash parameters: NUM_HASHES permutations in BANDS bands for LSH candidate lookup
+NUM_HASHES = 32
+BANDS = 8
+SHINGLE = 5
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, MERSENNE_PRIME, NUM_HASHES, dtype=np.uint64)
+_B = _rng.integers(0, MERSENNE_PRIME, NUM_HASHES, dtype=np.uint64)
+
+
+def shingles(text: str) -> frozenset:
+    """Character shingles of a normalized text"""
+    return frozenset(text[i:i + SHINGLE] for i in range(max(1, len(text) - SHINGLE + 1)))
+
+
+def minhash(shingles: frozenset) -> np.ndarray:
+    """MinHash signature of a set of shingles"""
+    hashes = np.fromiter((hash(shingle) & 0xFFFFFFFF for shingle in shingles), np.uint64, count=len(shingles))
+    # (a * h + b) mod p for every permutation / shingle pair; 32-bit hashes keep the product in 64 bits
+    return ((np.outer(_A & np.uint64(0xFFFFFFFF), hashes) + _B[:, None]) % np.uint64(MERSENNE_PRIME)).min(axis=1)
+
+
+class CompactionPolicy:
+    """
+    How histories are compacted before prompting: near-duplicates at or above `fold_threshold`
+    Jaccard similarity of character shingles are folded into one line, and messages matching
+    the `drop` rules are left out:
+      reactions - stock one-word reactions (lol, +1, same, ...) and emoji-only messages
+      short     - fewer than `min_chars` letters / digits
+      links     - nothing but links
+      mentions  - nothing but user / channel / role mentions
+    """
+
+    def __init__(self, fold_threshold: float = 0.8, drop: Iterable[str] = ('reactions',), min_chars: int = 3,
+                 enabled: bool = True):
+        self.fold_threshold = fold_threshold
+        self.drop = frozenset(rule for rule in drop if rule in DROP_RULES)
+        self.min_chars = min_chars
+        self.enabled = enabled
+        self.counters = {'histories': 0, 'folded': 0, 'dropped': 0}
+
+    def compactor(self, drop_low_information: bool = True) -> Optional['HistoryCompactor']:
+        """A compactor for one history (None when compaction is disabled)"""
+        if not self.enabled:
+            return None
+        self.counters['histories'] += 1
+        return HistoryCompactor(self, self.drop if drop_low_information else frozenset())
+
+    def is_low_information(self, content: str, rules: frozenset) -> bool:
+        if not rules:
+            return False
+        bare = CUSTOM_EMOJI_PATTERN.sub(" ", content)
+        if 'links' in rules and not URL_PATTERN.sub("", bare).strip():
+            return bool(content.strip())
+        if 'mentions' in rules and not MENTION_PATTERN.sub("", bare).strip():
+            return bool(content.strip())
+        words = sum(ch.isalnum() for ch in URL_PATTERN.sub("", MENTION_PATTERN.sub("", bare)))
+        if 'reactions' in rules and (words == 0 or STOCK_REACTION_PATTERN.match(bare.strip().lower())):
+            return True
+        return 'short' in rules and words < self.min_chars
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+
+class HistoryCompactor:
+    """
+    Near-duplicate / low-information filter for one history, fed messages as the encoder gets them.
+    Exact repeats (after normalization) are found by lookup; near-duplicates by MinHash LSH over the
+    kept messages, each candidate confirmed by the exact Jaccard similarity of the shingle sets.
+    """
+
+    def __init__(self, policy: CompactionPolicy, drop: frozenset):
+        self.policy = policy
+        self.drop = drop
+        self._exact: Dict[str, int] = {}  # {normalized text: entry index}
+        self._bands: List[Dict[bytes, int]] = [{} for _ in range(BANDS)]
+        self._shingles: Dict[int, frozenset] = {}
+        self.counters = {'folded': 0, 'dropped': 0}
+
+    def _count(self, outcome: str):
+        self.counters[outcome] += 1
+        self.policy.counters[outcome] += 1
+
+    def admit(self, content: str, index: int) -> Optional[int]:
+        """
+        Decide on a message that would become entry `index`: None to keep it, DROP to leave it
+        out, or the index of the kept entry it is a near-duplicate of
+        """
+        if self.policy.is_low_information(content, self.drop):
+            self._count('dropped')
+            return DROP
+        normalized = " ".join(NORMALIZE_PATTERN.sub("", content.lower()).split())
+        if not normalized:
+            return None
+        match = self._exact.get(normalized)
+        if match is not None:
+            self._count('folded')
+            return match
+
+        text_shingles = shingles(normalized)
+        signature = minhash(text_shingles)
+        rows = NUM_HASHES // BANDS
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(BANDS)]
+        candidates = {self._bands[band][key] for band, key in enumerate(keys) if key in self._bands[band]}
+        for candidate in sorted(candidates):
+            other = self._shingles[candidate]
+            if len(text_shingles & other) >= self.policy.fold_threshold * len(text_shingles | other):
+                self._count('folded')
+                return candidate
+
+        self._exact[normalized] = index
+        self._shingles[index] = text_shingles
+        for band, key in enumerate(keys):
+            self._bands[band].setdefault(key, index)
+        return None
@@ -0,0 +1,122 @@
+from datetime import datetime, timezone
+from typing import Callable, Collection, Optional
+
+
+class AuthorRecord:
+    """Author of scanned messages (one shared instance per author per scan)"""
+
+    __slots__ = ('id', 'name')
+
+    def __init__(self, author_id: int, name: str):
+        self.id = author_id
+        self.name = name
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+class MessageRecord:
+    """
+    Compact stand-in for a discord.Message: ID, author, timestamp and truncated text.
+    Has the attributes HistoryEncoder and ResponsePostProcessor read (created_at, author, content, jump_url).
+    """
+
+    __slots__ = ('id', 'author', 'timestamp', 'content', 'link_prefix')
+
+    def __init__(self, message_id: int, author: AuthorRecord, timestamp: float, content: str, link_prefix: str):
+        self.id = message_id
+        self.author = author
+        self.timestamp = timestamp
+        self.content = content
+        self.link_prefix = link_prefix  # Shared per channel: https://discord.com/channels/<guild>/<channel>
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp, tz=timezone.utc)
+
+    @property
+    def jump_url(self) -> str:
+        return f"{self.link_prefix}/{self.id}"
+
+
+class MessageCompactor:
+    """Projects discord.Message objects from one channel to MessageRecords, sharing author records"""
+
+    def __init__(self, channel, max_content: int = 300):
+        guild_id = channel.guild.id if getattr(channel, 'guild', None) else '@me'
+        self.link_prefix = f"https://discord.com/channels/{guild_id}/{channel.id}"
+        self.max_content = max_content
+        self._authors = {}  # {author_id: AuthorRecord}
+
+    def __call__(self, msg) -> MessageRecord:
+        author = self._authors.get(msg.author.id)
+        if author is None:
+            author = self._authors[msg.author.id] = AuthorRecord(msg.author.id, msg.author.name)
+        content = " ".join(msg.content.split())
+        if len(content) > self.max_content:
+            content = content[:self.max_content] + "..."
+        return MessageRecord(msg.id, author, msg.created_at.timestamp(), content, self.link_prefix)
+
+
+class HistoryScan:
+    """
+    Streaming channel history scan: fetch -> filter -> project -> format.
+
+    Messages arrive newest first and flow through one generator chain. Matches are projected to
+    MessageRecords and formatted by the encoder (a prompt_assembly.HistoryEncoder) as they arrive,
+    so no discord.Message outlives its loop iteration. Only the encoder's window of the newest
+    matches is kept; further matches are just counted. With `stop_after`, fetching stops once that
+    many messages have matched. With `after` (a message or discord.Object), only newer messages are scanned.
+    Messages whose ID is in `skip_ids` (the requests' own command messages; the set may grow while
+    the scan runs) are passed over. Every other fetched message is also handed to `archive` (a
+    message_archive.MessageArchive) if given.
+    """
+
+    def __init__(self, channel, *, limit: int, matches: Callable[[object], bool], encoder,
+                 skip_ids: Collection[int] = (), stop_after: Optional[int] = None, progress=None,
+                 max_content: int = 300, after=None, archive=None):
+        self.channel = channel
+        self.limit = limit
+        self.after = after
+        self.archive = archive
+        self.matches = matches
+        self.encoder = encoder
+        self.skip_ids = skip_ids
+        self.stop_after = stop_after
+        self.progress = progress  # Optional ScanProgress
+        self.compact = MessageCompactor(channel, max_content)
+        self.scanned = 0
+        self.found = 0
+
+    async def _fetch(self):
+        # discord.py switches to oldest first when `after` is given; keep newest first
+        async for msg in self.channel.history(limit=self.limit, after=self.after, oldest_first=False):
+            if msg.id in self.skip_ids:
+                continue
+            self.scanned += 1
+            if self.archive is not None:
+                self.archive.add(msg)
+            if self.progress:
+                self.progress.update(self.scanned, self.found)
+            yield msg
+
+    async def _filter(self):
+        async for msg in self._fetch():
+            if self.matches(msg):
+                self.found += 1
+                yield msg
+
+    async def _project(self):
+        async for msg in self._filter():
+            # Past the window, matches are only counted
+            yield None if self.encoder.full else self.compact(msg)
+
+    async def run(self):
+        """Scan and return the encoder's EncodedHistory, or None if nothing matched"""
+        async for record in self._project():
+            if record is not None:
+                self.encoder.add(record)
+            if self.stop_after and self.found >= self.stop_after:
+                break
+        return self.encoder.finish() if len(self.encoder) else None
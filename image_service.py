@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger('GrokBot')
+
+IMAGE_GENERATION_URL = "https://api.x.ai/v1/images/generations"
+
+
+class ImageGenerationError(Exception):
+    """Raised when Grok image generation fails or returns no images"""
+
+
+class ImageQueueFullError(ImageGenerationError):
+    """Raised when the image generation queue is at capacity"""
+
+
+def normalize_image_prompt(prompt: str) -> str:
+    """Normalize a prompt so trivially different spellings share a cache entry"""
+    return " ".join(prompt.lower().split())
+
+
+class ImageGenerationService:
+    """
+    Shared image generation service for !imagine and the "Generate More Versions" button.
+
+    - One aiohttp session reused for every request
+    - Bounded job queue drained by a fixed number of workers (concurrency limit)
+    - Identical prompts already in flight share a single generation (single-flight)
+    - Generated URLs are cached per prompt for a short TTL
+    """
+
+    def __init__(self, api_key: Optional[str], model: str, concurrency: int = 2,
+                 queue_size: int = 20, cache_ttl: int = 600):
+        self.api_key = api_key
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.cache_ttl = cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._flights = SingleFlight('image generation')
+        self._cache = {}  # {(prompt, n): (expires_at, [urls])}
+        self._active = 0
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self):
+        """Create the shared session and worker tasks (safe to call more than once)"""
+        if self.started:
+            return
+        self._session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            timeout=aiohttp.ClientTimeout(total=120)
+        )
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f'Image generation service started ({self.concurrency} workers, queue size {self.queue_size})')
+
+    async def close(self):
+        """Stop workers and close the shared session"""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_cached(self, key):
+        entry = self._cache.get(key)
+        if not entry:
+            return None
+        expires_at, urls = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        return urls
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._cache.items() if expires_at < now]:
+            del self._cache[key]
+
+    async def generate(self, prompt: str, n: int = 1,
+                       on_queued: Optional[Callable[[int], Awaitable[None]]] = None, use_cache: bool = True) -> list:
+        """
+        Generate n images for a prompt and return their URLs.
+
+        on_queued is awaited with the job's queue position when it has to wait for a worker.
+        With use_cache=False (new versions of a prompt) recent results aren't reused, but identical
+        requests in flight are still shared.
+        Raises ImageQueueFullError if the queue is full, ImageGenerationError on API failure.
+        """
+        if not self.api_key:
+            raise ImageGenerationError("XAI_API_KEY not set in environment.")
+        await self.start()
+
+        key = (normalize_image_prompt(prompt), n)
+        cached = self._get_cached(key) if use_cache else None
+        if cached:
+            logger.info(f'Image cache hit for prompt "{prompt}" (n={n})')
+            return list(cached)
+
+        # Identical generations already queued or running are shared
+        return list(await self._flights.do(key, lambda: self._enqueue(key, prompt, n, on_queued)))
+
+    async def _enqueue(self, key, prompt: str, n: int, on_queued):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((key, prompt, n, future))
+        except asyncio.QueueFull:
+            raise ImageQueueFullError("Image generation queue is full. Please try again in a few moments.")
+
+        # Jobs ahead of this one that are still waiting for a free worker
+        position = self._queue.qsize() + self._active - self.concurrency
+        if on_queued and position > 0:
+            try:
+                await on_queued(position)
+            except Exception as e:
+                logger.debug(f'Queue position notification failed: {e}')
+
+        return await future
+
+    async def _worker(self, worker_id: int):
+        while True:
+            key, prompt, n, future = await self._queue.get()
+            self._active += 1
+            try:
+                urls = await self._request(prompt, n)
+                self._purge_expired()
+                self._cache[key] = (time.monotonic() + self.cache_ttl, urls)
+                if not future.done():
+                    future.set_result(urls)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+    async def _request(self, prompt: str, n: int) -> list:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "response_format": "url"
+        }
+        if n > 1:
+            payload["n"] = n
+        async with self._session.post(IMAGE_GENERATION_URL, json=payload) as resp:
+            if resp.status != 200:
+                err = await resp.text()
+                raise ImageGenerationError(f"Grok image API error: {resp.status} {err}")
+            data = await resp.json()
+        # Per docs, each entry in data[] carries the generated image url
+        if isinstance(data, dict) and isinstance(data.get('data'), list):
+            urls = [img.get('url') for img in data['data'] if img.get('url')]
+        else:
+            urls = []
+        if not urls:
+            raise ImageGenerationError("No image URL returned by Grok.")
+        logger.info(f'Generated {len(urls)} image(s) for prompt "{prompt}"')
+        return urls
+
+    def stats(self) -> dict:
+        """Current queue depth, active generations and cache size"""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'active': self._active,
+            'inflight_prompts': self._flights.stats()['in_flight'],
+            'coalesced': self._flights.counters['coalesced'],
+            'cached_prompts': len(self._cache),
+        }
@@ -15,12 +15,39 @@ except ImportError:
 from transformers import pipeline
 import re
 from typing import Optional
-from datetime import timezone, datetime, timedelta
+from datetime import timezone, datetime
 import pytz
 import sqlite3
 import json
 import aiohttp
 import tempfile
+from image_service import ImageGenerationService, ImageGenerationError
+from grok_scheduler import GrokScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK, estimate_request_tokens
+from grok_resilience import GrokResilience, CircuitOpenError
+from response_cache import ResponseCache, make_response_cache_key, is_time_sensitive, hash_bytes, normalize_url
+from history_cache import ChannelActivityTracker, HistoryResultCache, HistoryAnalysis, make_history_cache_key
+from singleflight import SingleFlight
+from prompt_assembly import (
+    DIGEST_NOTE, PromptCacheTelemetry, CLASSIFICATION_SYSTEM_PREFIX, HistoryEncoder, analytics_system_prefix,
+    assemble_messages, history_analysis_system_prefix, search_system_prefix
+)
+from response_postprocess import ResponsePostProcessor
+from embed_paginator import send_paginated
+from scan_progress import ScanProgress, ScanWaiters
+from followup_store import FollowUpStore, SearchContext
+from history_pipeline import HistoryScan
+from history_compaction import CompactionPolicy
+from map_reduce import MapReduceAnalyzer
+from block_summaries import BlockSummaryStore
+from message_archive import MessageArchive
+from time_partitions import TimePartitions, snowflake_time
+from text_compression import compress_columns, compress_text, decompress_text
+from memory_bank import HashingEmbedder, MemoryBank, TransformerEmbedder
+from archive_backfill import ArchiveBackfill
+from activity_analytics import ActivityAnalytics, parse_analytics_question
+from term_sketches import TermSketches
+from channel_digests import DigestBuilder, DigestStore, digest_history_block, parse_summary_window
+from member_index import GuildMemberIndex
 
 bot = commands.Bot(command_prefix='!', intents=discord.Intents.all())
 
@@ -30,38 +57,28 @@ async def imagine(ctx, *, prompt: str):
     Generate an image from a text prompt using Grok image generation API.
     """
     try:
-        XAI_KEY = os.getenv('XAI_API_KEY')
-        GROK_IMAGE_MODEL = os.getenv('GROK_IMAGE_MODEL', 'grok-2-image-latest')
-        GROK_IMAGE_OUTPUT_COST = float(os.getenv('GROK_IMAGE_OUTPUT_COST', '0.50'))  # $/image default, update as needed
         if not XAI_KEY:
             await ctx.reply("❌ XAI_API_KEY not set in environment.")
             return
         await ctx.trigger_typing()
-        # Call Grok image generation API
-        url = "https://api.x.ai/v1/images/generations"
-        headers = {"Authorization": f"Bearer {XAI_KEY}", "Content-Type": "application/json"}
-        payload = {
-            "model": GROK_IMAGE_MODEL,
-            "prompt": prompt,
-            "response_format": "url"
-        }
-        image_url = None
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    # Per docs, always use data[0].url for the first image
-                    if isinstance(data, dict) and 'data' in data and isinstance(data['data'], list) and data['data']:
-                        image_url = data['data'][0].get('url')
-                    else:
-                        image_url = None
-                    if not image_url:
-                        await ctx.reply("❌ No image URL returned by Grok.")
-                        return
-                else:
-                    err = await resp.text()
-                    await ctx.reply(f"❌ Grok image API error: {resp.status} {err}")
-                    return
+        queued_msg = None
+
+        async def notify_queued(position):
+            nonlocal queued_msg
+            queued_msg = await ctx.reply(f"⏳ Image request queued (position {position})...")
+
+        try:
+            image_urls = await image_service.generate(prompt, n=1, on_queued=notify_queued)
+        except ImageGenerationError as e:
+            await ctx.reply(f"❌ {e}")
+            return
+        finally:
+            if queued_msg:
+                try:
+                    await queued_msg.delete()
+                except Exception:
+                    pass
+        image_url = image_urls[0]
         # Pricing info (update as needed)
         usage_text = f"💵 ${GROK_IMAGE_OUTPUT_COST:.2f} (est.)"
         embed = discord.Embed(
@@ -82,29 +99,13 @@ async def imagine(ctx, *, prompt: str):
             async def more_versions(self, interaction: Interaction, button: ui.Button):
                 await interaction.response.defer(thinking=True)
                 try:
-                    XAI_KEY = os.getenv('XAI_API_KEY')
-                    GROK_IMAGE_MODEL = os.getenv('GROK_IMAGE_MODEL', 'grok-2-image-latest')
-                    url = "https://api.x.ai/v1/images/generations"
-                    headers = {"Authorization": f"Bearer {XAI_KEY}", "Content-Type": "application/json"}
-                    payload = {
-                        "model": GROK_IMAGE_MODEL,
-                        "prompt": self.prompt,
-                        "response_format": "url",
-                        "n": 4
-                    }
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(url, headers=headers, json=payload) as resp:
-                            if resp.status == 200:
-                                data = await resp.json()
-                                if isinstance(data, dict) and 'data' in data and isinstance(data['data'], list) and data['data']:
-                                    image_urls = [img.get('url') for img in data['data'] if img.get('url')]
-                                else:
-                                    image_urls = []
-                            else:
-                                await interaction.followup.send(f"❌ Grok image API error: {resp.status}", ephemeral=True)
-                                return
-                    if not image_urls:
-                        await interaction.followup.send("❌ No image URLs returned by Grok.", ephemeral=True)
+                    async def notify_queued(position):
+                        await interaction.followup.send(f"⏳ Image request queued (position {position})...", ephemeral=True)
+
+                    try:
+                        image_urls = await image_service.generate(self.prompt, n=4, on_queued=notify_queued, use_cache=False)
+                    except ImageGenerationError as e:
+                        await interaction.followup.send(f"❌ {e}", ephemeral=True)
                         return
                     # Show all 4 images as separate embeds in a single message (Discord best practice)
                     embeds = []
@@ -158,10 +159,11 @@ except Exception as e:
     # Use print here in case logger is not yet defined
     print(f'Intent classifier not loaded: {e}')
 
-def advanced_nlp_parse(text):
+def advanced_nlp_parse(text, classify_intent=True):
     """
     Use spaCy and transformers to extract entities, topics, and intent from user queries.
     Returns dict with entities, topics, and intent (if available).
+    classify_intent=False skips the (slow) zero-shot intent model, e.g. for bulk term extraction.
     """
     doc = nlp_spacy(text)
     entities = [(ent.text, ent.label_) for ent in doc.ents]
@@ -170,7 +172,7 @@ def advanced_nlp_parse(text):
 
     # Use Hugging Face zero-shot for intent if available
     intent = None
-    if intent_classifier:
+    if intent_classifier and classify_intent:
         candidate_labels = [
             "discord_history_query",
             "general_knowledge_query",
@@ -190,7 +192,7 @@ def advanced_nlp_parse(text):
     }
 import re
 from typing import Optional
-from datetime import timezone, datetime, timedelta
+from datetime import timezone, datetime
 import pytz
 import sqlite3
 import json
@@ -234,6 +236,12 @@ TIMEZONE = pytz.timezone(os.getenv('TIMEZONE', 'America/Chicago'))
 # Model configuration (with defaults)
 GROK_TEXT_MODEL = os.getenv('GROK_TEXT_MODEL', 'grok-4-fast')
 GROK_VISION_MODEL = os.getenv('GROK_VISION_MODEL', 'grok-2-vision-1212')
+GROK_IMAGE_MODEL = os.getenv('GROK_IMAGE_MODEL', 'grok-2-image-latest')
+
+# Image generation configuration (with defaults)
+IMAGE_GEN_CONCURRENCY = int(os.getenv('IMAGE_GEN_CONCURRENCY', '2'))  # Max image generations running at once
+IMAGE_GEN_QUEUE_SIZE = int(os.getenv('IMAGE_GEN_QUEUE_SIZE', '20'))  # Max image requests waiting for a worker
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv('IMAGE_CACHE_TTL_SECONDS', '600'))  # How long generated URLs are reused per prompt
 
 # Search configuration (with defaults)
 ENABLE_WEB_SEARCH = os.getenv('ENABLE_WEB_SEARCH', 'true').lower() == 'true'
@@ -242,6 +250,38 @@ MAX_KEYWORD_SCAN = int(os.getenv('MAX_KEYWORD_SCAN', '10000'))
 ENABLE_NL_HISTORY_SEARCH = os.getenv('ENABLE_NL_HISTORY_SEARCH', 'true').lower() == 'true'
 MAX_MESSAGES_ANALYZED = int(os.getenv('MAX_MESSAGES_ANALYZED', '500'))  # Max messages sent to Grok for analysis
 DEFAULT_SEARCH_LIMIT = int(os.getenv('DEFAULT_SEARCH_LIMIT', '5000'))  # Default messages to scan when no limit specified
+HISTORY_CACHE_STALE_MESSAGES = int(os.getenv('HISTORY_CACHE_STALE_MESSAGES', '25'))  # New channel messages before a cached analysis is redone
+HISTORY_CACHE_MAX_AGE_SECONDS = int(os.getenv('HISTORY_CACHE_MAX_AGE_SECONDS', '3600'))  # Hard age limit for cached analyses
+FOLLOWUP_CONTEXT_TTL_SECONDS = int(os.getenv('FOLLOWUP_CONTEXT_TTL_SECONDS', '3600'))  # How long replies to a search result can follow up on it
+FOLLOWUP_CONTEXT_MAX_ENTRIES = int(os.getenv('FOLLOWUP_CONTEXT_MAX_ENTRIES', '200'))  # Search results kept for follow-ups (least recently used dropped)
+MAP_REDUCE_ENABLED = os.getenv('MAP_REDUCE_ENABLED', 'true').lower() == 'true'  # Analyze more matches than fit in one prompt in parts
+MAP_REDUCE_MAX_MESSAGES = int(os.getenv('MAP_REDUCE_MAX_MESSAGES', '10000'))  # Max matches analyzed with map-reduce
+MAP_REDUCE_SHARD_TOKENS = int(os.getenv('MAP_REDUCE_SHARD_TOKENS', '24000'))  # Estimated prompt tokens per shard
+MAP_REDUCE_MAX_SHARDS = int(os.getenv('MAP_REDUCE_MAX_SHARDS', '16'))  # Max shard requests per analysis
+BLOCK_SUMMARIES_ENABLED = os.getenv('BLOCK_SUMMARIES_ENABLED', 'true').lower() == 'true'  # Map step reuses stored summaries of message blocks
+BLOCK_SUMMARY_SIZE = int(os.getenv('BLOCK_SUMMARY_SIZE', '200'))  # Average messages per summarized block
+BLOCK_SUMMARY_MAX_ENTRIES = int(os.getenv('BLOCK_SUMMARY_MAX_ENTRIES', '20000'))  # Stored block summaries (least recently used dropped)
+HISTORY_COMPACTION_ENABLED = os.getenv('HISTORY_COMPACTION_ENABLED', 'true').lower() == 'true'  # Fold near-duplicate messages before prompting
+HISTORY_FOLD_SIMILARITY = float(os.getenv('HISTORY_FOLD_SIMILARITY', '0.8'))  # Shingle similarity (0-1) at which messages are folded together
+HISTORY_DROP_POLICY = os.getenv('HISTORY_DROP_POLICY', 'reactions')  # Comma-separated: reactions, short, links, mentions (empty = drop nothing)
+HISTORY_MIN_CHARS = int(os.getenv('HISTORY_MIN_CHARS', '3'))  # Letters / digits below which the "short" policy drops a message
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '3'))  # Min seconds between scan progress edits
+MESSAGE_ARCHIVE_ENABLED = os.getenv('MESSAGE_ARCHIVE_ENABLED', 'true').lower() == 'true'  # Archive seen messages locally for exact activity statistics
+BACKFILL_ENABLED = os.getenv('BACKFILL_ENABLED', 'true').lower() == 'true'  # Archive every readable channel's full history in the background
+BACKFILL_REQUESTS_PER_MINUTE = float(os.getenv('BACKFILL_REQUESTS_PER_MINUTE', '30'))  # Discord history pages fetched per minute by the backfill
+BACKFILL_IDLE_SECONDS = float(os.getenv('BACKFILL_IDLE_SECONDS', '30'))  # Backfill pauses this long after each command / mention
+ANALYTICS_MIN_MESSAGES = int(os.getenv('ANALYTICS_MIN_MESSAGES', '500'))  # Archived messages in scope before counting questions skip the scan
+ANALYTICS_MAX_SCOPES = int(os.getenv('ANALYTICS_MAX_SCOPES', '8'))  # Guilds whose analytics columns stay in memory
+TERM_SKETCHES_ENABLED = os.getenv('TERM_SKETCHES_ENABLED', 'true').lower() == 'true'  # Count terms per member while archiving
+TERM_SKETCH_WIDTH = int(os.getenv('TERM_SKETCH_WIDTH', '8192'))  # Counters per count-min row (wider = fewer overcounts)
+TERM_SKETCH_DEPTH = int(os.getenv('TERM_SKETCH_DEPTH', '4'))  # Count-min rows
+TERM_SKETCH_MAX_SCOPES = int(os.getenv('TERM_SKETCH_MAX_SCOPES', '128'))  # Channels + guilds with sketches in memory
+TERM_SKETCH_SAVE_SECONDS = int(os.getenv('TERM_SKETCH_SAVE_SECONDS', '600'))  # How often new counts are saved to SQLite
+DIGESTS_ENABLED = os.getenv('DIGESTS_ENABLED', 'true').lower() == 'true'  # Build rolling channel digests for "summarize the last week" questions
+DIGEST_INTERVAL_SECONDS = int(os.getenv('DIGEST_INTERVAL_SECONDS', '900'))  # How often active channels are digested
+DIGEST_LOOKBACK_HOURS = int(os.getenv('DIGEST_LOOKBACK_HOURS', '48'))  # History digested when a channel is first seen
+DIGEST_HOURLY_RETENTION_HOURS = int(os.getenv('DIGEST_HOURLY_RETENTION_HOURS', '48'))  # Hourly digests kept once rolled up into a day
+DIGEST_RETENTION_DAYS = int(os.getenv('DIGEST_RETENTION_DAYS', '30'))  # Daily digests kept
 
 # Pricing configuration (with defaults based on current xAI pricing)
 GROK_TEXT_INPUT_COST = float(os.getenv('GROK_TEXT_INPUT_COST', '0.20'))
@@ -250,16 +290,111 @@ GROK_TEXT_CACHED_COST = float(os.getenv('GROK_TEXT_CACHED_COST', '0.05'))
 GROK_VISION_INPUT_COST = float(os.getenv('GROK_VISION_INPUT_COST', '2.00'))
 GROK_VISION_OUTPUT_COST = float(os.getenv('GROK_VISION_OUTPUT_COST', '10.00'))
 GROK_SEARCH_COST = float(os.getenv('GROK_SEARCH_COST', '25.00'))
+GROK_IMAGE_OUTPUT_COST = float(os.getenv('GROK_IMAGE_OUTPUT_COST', '0.50'))  # $/image default, update as needed
+
+# Grok request scheduling (with defaults)
+GROK_REQUESTS_PER_MINUTE = int(os.getenv('GROK_REQUESTS_PER_MINUTE', '120'))  # Request rate limit across all guilds
+GROK_TOKENS_PER_MINUTE = int(os.getenv('GROK_TOKENS_PER_MINUTE', '1000000'))  # Token rate limit across all guilds
+GROK_MAX_CONCURRENT_REQUESTS = int(os.getenv('GROK_MAX_CONCURRENT_REQUESTS', '8'))  # Max Grok requests in flight
+GROK_BULK_MAX_WAIT = float(os.getenv('GROK_BULK_MAX_WAIT', '30'))  # Seconds before queued history analysis is promoted
+
+# Grok retry / circuit breaker / hedging (with defaults)
+GROK_MAX_RETRIES = int(os.getenv('GROK_MAX_RETRIES', '3'))  # Retries for transient errors (429, timeouts, 5xx)
+GROK_RETRY_BASE_DELAY = float(os.getenv('GROK_RETRY_BASE_DELAY', '1.0'))  # Seconds, doubled per retry (with jitter)
+GROK_RETRY_MAX_DELAY = float(os.getenv('GROK_RETRY_MAX_DELAY', '20'))  # Cap on a single backoff delay
+GROK_BREAKER_THRESHOLD = int(os.getenv('GROK_BREAKER_THRESHOLD', '5'))  # Consecutive failures before failing fast
+GROK_BREAKER_COOLDOWN = float(os.getenv('GROK_BREAKER_COOLDOWN', '30'))  # Seconds to fail fast before probing again
+GROK_HEDGE_REQUESTS = os.getenv('GROK_HEDGE_REQUESTS', 'false').lower() == 'true'  # Duplicate slow short prompts
+GROK_HEDGE_MAX_TOKENS = int(os.getenv('GROK_HEDGE_MAX_TOKENS', '2000'))  # Only hedge prompts estimated below this size
 
 client = OpenAI(api_key=XAI_KEY, base_url="https://api.x.ai/v1")
 
+# All Grok chat completions go through this scheduler (rate limits, priorities, per-guild fairness)
+grok_scheduler = GrokScheduler(
+    client,
+    requests_per_minute=GROK_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GROK_TOKENS_PER_MINUTE,
+    max_concurrency=GROK_MAX_CONCURRENT_REQUESTS,
+    bulk_max_wait=GROK_BULK_MAX_WAIT
+)
+
+# Retries, circuit breaking and optional hedging around every scheduled Grok call
+grok_resilience = GrokResilience(
+    max_retries=GROK_MAX_RETRIES,
+    base_delay=GROK_RETRY_BASE_DELAY,
+    max_delay=GROK_RETRY_MAX_DELAY,
+    breaker_threshold=GROK_BREAKER_THRESHOLD,
+    breaker_cooldown=GROK_BREAKER_COOLDOWN,
+    hedge_enabled=GROK_HEDGE_REQUESTS,
+    on_rate_limited=grok_scheduler.pause
+)
+
+# Lowercase member names -> IDs per guild, for turning names in answers into mentions
+member_index = GuildMemberIndex()
+
+# How much of each request type's prompt Grok serves from its prompt cache
+prompt_cache_telemetry = PromptCacheTelemetry()
+
+# Shared image generation service (one HTTP session, bounded queue, prompt dedup)
+image_service = ImageGenerationService(
+    api_key=XAI_KEY,
+    model=GROK_IMAGE_MODEL,
+    concurrency=IMAGE_GEN_CONCURRENCY,
+    queue_size=IMAGE_GEN_QUEUE_SIZE,
+    cache_ttl=IMAGE_CACHE_TTL_SECONDS
+)
+
 bot = commands.Bot(command_prefix='!', intents=discord.Intents.all())
 
-search_context = {}  # {channel_id: {user_id: {searched_user: User, messages: [...], query: str}}}
+# Compact copies of the messages behind each !search result, so replies to it are answered without rescanning
+followup_store = FollowUpStore(ttl=FOLLOWUP_CONTEXT_TTL_SECONDS, max_entries=FOLLOWUP_CONTEXT_MAX_ENTRIES)
+
+# Cached !search / natural language history analyses, invalidated by new channel activity
+channel_activity = ChannelActivityTracker()
+history_cache = HistoryResultCache(
+    channel_activity,
+    stale_after_messages=HISTORY_CACHE_STALE_MESSAGES,
+    max_age=HISTORY_CACHE_MAX_AGE_SECONDS
+)
+HISTORY_CACHE_USAGE_TEXT = "⚡ Cached result • 💵 $0.000000"
+
+# Identical requests already in flight share one history scan / Grok call instead of repeating it
+history_flights = SingleFlight('history analysis')
+history_waiters = {}  # {history flight key: ScanWaiters} of the requests sharing that scan
+response_flights = SingleFlight('Grok answer')
 
 # SQLite database for conversation history
 DB_PATH = os.getenv('CONVERSATION_DB_PATH', 'data/conversation_history.db')
-CONVERSATION_RETENTION_HOURS = int(os.getenv('CONVERSATION_RETENTION_HOURS', '24'))
+CONVERSATION_RETENTION_HOURS = int(os.getenv('CONVERSATION_RETENTION_HOURS', '24'))  # Rounded to whole UTC days: 24 keeps up to ~48h
+TEXT_COMPRESSION_ENABLED = os.getenv('TEXT_COMPRESSION_ENABLED', 'true').lower() == 'true'  # Store long queries, responses and archived messages compressed
+TEXT_COMPRESSION_MIN_BYTES = int(os.getenv('TEXT_COMPRESSION_MIN_BYTES', '200'))  # Shorter texts are stored as plain text
+MEMORY_BANK_ENABLED = os.getenv('MEMORY_BANK_ENABLED', 'true').lower() == 'true'  # Recall relevant stored exchanges into new prompts
+MEMORY_EMBEDDING_MODEL = os.getenv('MEMORY_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')  # Local feature-extraction model (empty = hashed word features)
+MEMORY_RECALL_K = int(os.getenv('MEMORY_RECALL_K', '3'))  # Past exchanges injected per question at most
+MEMORY_MIN_SIMILARITY = os.getenv('MEMORY_MIN_SIMILARITY', '')  # Cosine similarity below which exchanges aren't recalled (empty = embedder default)
+MEMORY_MAX_TOKENS = int(os.getenv('MEMORY_MAX_TOKENS', '800'))  # Estimated prompt tokens spent on recalled exchanges
+MEMORY_RECALL_SCOPE = os.getenv('MEMORY_RECALL_SCOPE', 'user')  # 'user' (asker's own exchanges in the channel) or 'channel'
+MESSAGE_ARCHIVE_RETENTION_DAYS = int(os.getenv('MESSAGE_ARCHIVE_RETENTION_DAYS', '0'))  # Archived messages kept (whole months dropped; 0 = forever)
+
+# Conversations are stored in one table per UTC day of the message (conversations_YYYYMMDD); message
+# IDs are snowflakes, so a lookup goes straight to its day and retention drops whole days
+conversation_partitions = TimePartitions('conversations', '''
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    user_query TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    model_used TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    embedding BLOB,
+    embedding_model TEXT
+''', period='day')
+
+# Response cache for general Grok answers (stored in the same SQLite database)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '21600'))  # 6 hours
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '5000'))
+RESPONSE_CACHE_MAX_HASH_BYTES = 10 * 1024 * 1024  # Larger images are keyed by URL, larger documents not cached
 
 
 # --- Only start the bot if running as main script ---
@@ -276,26 +411,29 @@ def init_conversation_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    # Create conversations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            message_id INTEGER PRIMARY KEY,
-            channel_id INTEGER NOT NULL,
-            author_id INTEGER NOT NULL,
-            user_query TEXT NOT NULL,
-            bot_response TEXT NOT NULL,
-            model_used TEXT NOT NULL,
-            created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
-        )
-    ''')
-    
-    # Create index for faster lookups
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_message_id ON conversations(message_id)
-    ''')
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_created_at ON conversations(created_at)
-    ''')
+    # Move rows of the old single conversations table (ISO text timestamps) into daily partitions
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'conversations'")
+    if cursor.fetchone():
+        cursor.execute('''
+            SELECT message_id, channel_id, author_id, user_query, bot_response, model_used,
+                   CAST(strftime('%s', created_at) AS INTEGER)
+            FROM conversations
+        ''')
+        rows = cursor.fetchall()
+        for row in rows:
+            partition = conversation_partitions.ensure(conn, snowflake_time(row[0]))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO {partition}
+                (message_id, channel_id, author_id, user_query, bot_response, model_used, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', row[:6] + (row[6] or snowflake_time(row[0]),))
+        conn.execute('DROP TABLE conversations')
+        logger.info(f'Moved {len(rows)} conversations into daily partitions')
+
+    # Compress long queries / responses stored before compression (or with an older codec)
+    if TEXT_COMPRESSION_ENABLED:
+        for partition in conversation_partitions.existing(conn):
+            compress_columns(conn, partition, 'message_id', ['user_query', 'bot_response'], TEXT_COMPRESSION_MIN_BYTES)
     
     conn.commit()
     conn.close()
@@ -308,12 +446,15 @@ def store_conversation(message_id: int, channel_id: int, author_id: int,
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
-        cursor.execute('''
-            INSERT OR REPLACE INTO conversations 
+        partition = conversation_partitions.ensure(conn, snowflake_time(message_id))
+        if TEXT_COMPRESSION_ENABLED:
+            user_query = compress_text(user_query, TEXT_COMPRESSION_MIN_BYTES)
+            bot_response = compress_text(bot_response, TEXT_COMPRESSION_MIN_BYTES)
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {partition}
             (message_id, channel_id, author_id, user_query, bot_response, model_used, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (message_id, channel_id, author_id, user_query, bot_response, model_used, now_iso))
+        ''', (message_id, channel_id, author_id, user_query, bot_response, model_used, int(datetime.now(timezone.utc).timestamp())))
         
         conn.commit()
         conn.close()
@@ -327,9 +468,13 @@ def get_conversation(message_id: int) -> Optional[dict]:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        cursor.execute('''
+        partition = conversation_partitions.name(snowflake_time(message_id))
+        if partition not in conversation_partitions.existing(conn):
+            conn.close()
+            return None
+        cursor.execute(f'''
             SELECT author_id, user_query, bot_response, model_used, created_at
-            FROM conversations
+            FROM {partition}
             WHERE message_id = ?
         ''', (message_id,))
         
@@ -339,8 +484,8 @@ def get_conversation(message_id: int) -> Optional[dict]:
         if row:
             return {
                 'author_id': row[0],
-                'user_query': row[1],
-                'bot_response': row[2],
+                'user_query': decompress_text(row[1]),
+                'bot_response': decompress_text(row[2]),
                 'model_used': row[3],
                 'created_at': row[4]
             }
@@ -350,23 +495,20 @@ def get_conversation(message_id: int) -> Optional[dict]:
         return None
 
 def cleanup_old_conversations():
-    """Remove conversations older than CONVERSATION_RETENTION_HOURS"""
+    """Drop the daily conversation partitions entirely older than CONVERSATION_RETENTION_HOURS"""
+    if CONVERSATION_RETENTION_HOURS <= 0:
+        return
     try:
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cutoff_time = (datetime.now(timezone.utc) - timedelta(hours=CONVERSATION_RETENTION_HOURS)).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
-        cursor.execute('''
-            DELETE FROM conversations
-            WHERE created_at < ?
-        ''', (cutoff_time,))
-        
-        deleted_count = cursor.rowcount
+        dropped = conversation_partitions.drop_before(
+            conn, datetime.now(timezone.utc).timestamp() - CONVERSATION_RETENTION_HOURS * 3600
+        )
         conn.commit()
         conn.close()
         
-        if deleted_count > 0:
-            logger.info(f'Cleaned up {deleted_count} old conversations (older than {CONVERSATION_RETENTION_HOURS}h)')
+        if dropped:
+            memory_bank.reset()
+            logger.info(f'Cleaned up {len(dropped)} old conversation partitions (older than {CONVERSATION_RETENTION_HOURS}h)')
     except Exception as e:
         logger.error(f'Error cleaning up conversations: {e}')
 
@@ -376,53 +518,173 @@ async def periodic_cleanup():
     while True:
         await asyncio.sleep(6 * 3600)  # Sleep for 6 hours
         cleanup_old_conversations()
+        response_cache.evict()
+        await message_archive.flush_async()
+        block_summaries.evict()
+        if MESSAGE_ARCHIVE_RETENTION_DAYS and message_archive.cleanup(MESSAGE_ARCHIVE_RETENTION_DAYS * 86400):
+            activity_analytics.reset()
+        digest_store.cleanup(DIGEST_HOURLY_RETENTION_HOURS * 3600, DIGEST_RETENTION_DAYS * 86400)
 
 # Initialize database on startup
 init_conversation_db()
 
-def convert_usernames_to_mentions(text: str, guild: discord.Guild) -> str:
+# Semantic recall of stored exchanges (local embeddings; hashed word features if the model can't be loaded)
+memory_embedder = HashingEmbedder()
+if MEMORY_BANK_ENABLED and MEMORY_EMBEDDING_MODEL:
+    try:
+        memory_embedder = TransformerEmbedder(pipeline('feature-extraction', model=MEMORY_EMBEDDING_MODEL), MEMORY_EMBEDDING_MODEL)
+    except Exception as e:
+        logger.warning(f'Embedding model {MEMORY_EMBEDDING_MODEL} not loaded, using hashed word features: {e}')
+memory_bank = MemoryBank(
+    DB_PATH,
+    conversation_partitions,
+    memory_embedder,
+    k=MEMORY_RECALL_K,
+    min_similarity=float(MEMORY_MIN_SIMILARITY) if MEMORY_MIN_SIMILARITY else None,
+    max_tokens=MEMORY_MAX_TOKENS,
+    scope=MEMORY_RECALL_SCOPE
+)
+memory_bank.init_db()
+
+response_cache = ResponseCache(
+    DB_PATH,
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES
+)
+response_cache.init_db()
+
+def sketch_phrases(text):
+    """Entities and noun chunks of an archived message, for the term sketches"""
+    parsed = advanced_nlp_parse(text, classify_intent=False)
+    return [entity for entity, _ in parsed['entities']] + parsed['topics']
+
+# Streaming per-member term frequency sketches of newly archived messages (bounded memory)
+term_sketches = TermSketches(
+    sketch_phrases,
+    width=TERM_SKETCH_WIDTH,
+    depth=TERM_SKETCH_DEPTH,
+    max_scopes=TERM_SKETCH_MAX_SCOPES
+)
+term_sketches.init_db(DB_PATH)
+term_sketches.load(DB_PATH)
+
+# Local archive of seen messages (same SQLite database) and exact activity statistics over it
+message_archive = MessageArchive(
+    DB_PATH,
+    on_ingest=term_sketches.submit if TERM_SKETCHES_ENABLED else None,
+    compress_min_bytes=TEXT_COMPRESSION_MIN_BYTES if TEXT_COMPRESSION_ENABLED else None
+)
+message_archive.init_db()
+activity_analytics = ActivityAnalytics(message_archive, TIMEZONE, max_scopes=ANALYTICS_MAX_SCOPES)
+
+# Resumable background backfill of every readable channel into the archive; pauses while users are
+# waiting on the bot
+archive_backfill = ArchiveBackfill(
+    message_archive,
+    DB_PATH,
+    requests_per_minute=BACKFILL_REQUESTS_PER_MINUTE,
+    idle_seconds=BACKFILL_IDLE_SECONDS,
+    is_busy=lambda: grok_scheduler.queue_depth(PRIORITY_INTERACTIVE) > 0
+)
+archive_backfill.init_db()
+
+def backfill_channels():
+    """Text channels whose history the bot can read"""
+    for guild in bot.guilds:
+        for channel in guild.text_channels:
+            permissions = channel.permissions_for(guild.me)
+            if permissions.read_messages and permissions.read_message_history:
+                yield channel
+
+async def hash_image_sources(message, image_urls):
     """
-    Convert Discord usernames in text to proper mentions.
-    Handles patterns like: username, @username, "username"
+    Hash the images in a request for response caching.
+    The message's own attachments are hashed by content (so re-uploads of the same image match);
+    links and context images fall back to their URL without the CDN query string.
     """
-    if not guild:
-        return text
-    
-    # Get all members in the guild
-    members = guild.members
-    
-    # Create a mapping of lowercase usernames/display names to member objects
-    username_map = {}
-    for member in members:
-        # Map both username and display name (case-insensitive)
-        username_map[member.name.lower()] = member
-        username_map[member.display_name.lower()] = member
-        # Also map without discriminator if present
-        if '#' in member.name:
-            base_name = member.name.split('#')[0].lower()
-            username_map[base_name] = member
-    
-    # Pattern to match potential usernames
-    # Matches: @username, "username", username (with word boundaries)
-    # But avoid matching if already in a mention format <@123456>
-    patterns_to_try = [
-        # Match @username (but not already formatted mentions)
-        (r'(?<!<)@([a-zA-Z0-9_]{2,32})(?!>)', lambda m: f"<@{username_map[m.group(1).lower()].id}>" if m.group(1).lower() in username_map else m.group(0)),
-        # Match "username" in quotes
-        (r'"([a-zA-Z0-9_]{2,32})"', lambda m: f"<@{username_map[m.group(1).lower()].id}>" if m.group(1).lower() in username_map else m.group(0)),
-        # Match username at word boundaries (but be conservative - only at start of sentence or after punctuation)
-        (r'(?<=\s)([A-Z][a-zA-Z0-9_]{1,31})(?=[\s,.\'])', lambda m: f"<@{username_map[m.group(1).lower()].id}>" if m.group(1).lower() in username_map else m.group(0)),
-    ]
-    
-    result = text
-    for pattern, replacement in patterns_to_try:
+    attachments_by_url = {attachment.url: attachment for attachment in message.attachments}
+    hashes = []
+    for url in image_urls:
+        attachment = attachments_by_url.get(url)
+        if attachment and attachment.size <= RESPONSE_CACHE_MAX_HASH_BYTES:
+            try:
+                hashes.append(hash_bytes(await attachment.read()))
+                continue
+            except Exception as e:
+                logger.debug(f'Could not read attachment {attachment.filename} for hashing: {e}')
+        hashes.append(normalize_url(url))
+    return hashes
+
+async def hash_documents(document_attachments):
+    """
+    Hash document attachments by content for response caching (re-uploads of the same file match).
+    Returns None, so the request isn't cached, if any document is over RESPONSE_CACHE_MAX_HASH_BYTES
+    or can't be read - large files are never downloaded just to build a cache key.
+    """
+    hashes = []
+    for attachment in document_attachments:
+        if attachment.size > RESPONSE_CACHE_MAX_HASH_BYTES:
+            return None
         try:
-            result = re.sub(pattern, replacement, result)
+            hashes.append(hash_bytes(await attachment.read()))
         except Exception as e:
-            logger.warning(f'Error applying username pattern {pattern}: {e}')
-            continue
-    
-    return result
+            logger.debug(f'Could not read attachment {attachment.filename} for hashing: {e}')
+            return None
+    return hashes
+
+async def grok_complete(request_params: dict, *, priority: int = PRIORITY_INTERACTIVE,
+                        guild_id: Optional[int] = None, request_type: str = 'general'):
+    """Send a chat completion to Grok through the shared request scheduler, with retries"""
+    # Only short interactive prompts are worth hedging - a duplicate bulk analysis costs too much
+    hedge = priority == PRIORITY_INTERACTIVE and estimate_request_tokens(request_params) <= GROK_HEDGE_MAX_TOKENS
+    completion = await grok_resilience.call(
+        lambda on_dispatch: grok_scheduler.submit(
+            request_params,
+            priority=priority,
+            guild_id=guild_id,
+            request_type=request_type,
+            on_dispatch=on_dispatch
+        ),
+        hedge=hedge
+    )
+    prompt_cache_telemetry.record(request_type, getattr(completion, 'usage', None))
+    return completion
+
+# Question-independent summaries of message blocks, reused by every analysis covering the same messages
+block_summaries = BlockSummaryStore(DB_PATH, max_entries=BLOCK_SUMMARY_MAX_ENTRIES)
+block_summaries.init_db()
+
+# Histories too large for one prompt are read in parts (stored block summaries, or token-bounded
+# shards) by concurrent bulk requests
+map_reduce = MapReduceAnalyzer(
+    grok_complete,
+    GROK_TEXT_MODEL,
+    shard_tokens=MAP_REDUCE_SHARD_TOKENS,
+    max_shards=MAP_REDUCE_MAX_SHARDS,
+    block_store=block_summaries if BLOCK_SUMMARIES_ENABLED else None,
+    tz=TIMEZONE,
+    block_size=BLOCK_SUMMARY_SIZE
+)
+
+# Near-duplicate folding / low-information dropping for histories sent to Grok
+history_compaction = CompactionPolicy(
+    fold_threshold=HISTORY_FOLD_SIMILARITY,
+    drop=[rule.strip() for rule in HISTORY_DROP_POLICY.split(',') if rule.strip()],
+    min_chars=HISTORY_MIN_CHARS,
+    enabled=HISTORY_COMPACTION_ENABLED
+)
+
+# Rolling hourly / daily digests of active channels (same SQLite database), built in the background
+digest_store = DigestStore(DB_PATH)
+digest_store.init_db()
+digest_builder = DigestBuilder(
+    digest_store,
+    grok_complete,
+    GROK_TEXT_MODEL,
+    TIMEZONE,
+    interval=DIGEST_INTERVAL_SECONDS,
+    lookback_hours=DIGEST_LOOKBACK_HOURS
+)
 
 @bot.event
 async def on_ready():
@@ -431,10 +693,429 @@ async def on_ready():
     
     # Clean up old conversations on startup
     cleanup_old_conversations()
+
+    # (Re)build member name indexes (catches any member events missed while disconnected)
+    for guild in bot.guilds:
+        member_index.index_guild(guild)
+
+    # Start the shared image generation workers
+    await image_service.start()
     
     # Schedule periodic cleanup (every 6 hours)
     bot.loop.create_task(periodic_cleanup())
 
+    # Count terms of newly archived messages in the background
+    if TERM_SKETCHES_ENABLED:
+        bot.loop.create_task(term_sketches.run())
+        bot.loop.create_task(term_sketches.autosave(DB_PATH, TERM_SKETCH_SAVE_SECONDS))
+
+    # Digest active channels in the background
+    if DIGESTS_ENABLED:
+        bot.loop.create_task(digest_builder.run(bot.get_channel))
+
+    # Embed exchanges stored before the memory bank (or with another embedding model)
+    if MEMORY_BANK_ENABLED:
+        bot.loop.create_task(memory_bank.backfill())
+
+    # Fill the archive with older history in the background (resumes from saved cursors)
+    if MESSAGE_ARCHIVE_ENABLED and BACKFILL_ENABLED:
+        bot.loop.create_task(archive_backfill.run(backfill_channels))
+
+@bot.before_invoke
+async def note_interactive_command(ctx):
+    archive_backfill.note_interactive()
+
+@bot.event
+async def on_guild_join(guild):
+    member_index.index_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    member_index.drop_guild(guild.id)
+
+@bot.event
+async def on_member_join(member):
+    member_index.add_member(member)
+
+@bot.event
+async def on_member_update(before, after):
+    member_index.update_member(before, after)
+
+@bot.event
+async def on_member_remove(member):
+    member_index.remove_member(member)
+
+@bot.event
+async def on_user_update(before, after):
+    """Global username changes arrive per user, not per member - re-index them in every shared guild"""
+    if before.name == after.name:
+        return
+    for guild in after.mutual_guilds:
+        member = guild.get_member(after.id)
+        if member:
+            member_index.add_member(member)
+
+@bot.command(name='botstats', help='Show Grok request queue and image generation stats')
+async def bot_stats(ctx):
+    """Show scheduler queue depth, wait times and image generation queue status"""
+    sched = grok_scheduler.stats()
+    images = image_service.stats()
+    resilience = grok_resilience.stats()
+    cache = response_cache.stats()
+    history = history_cache.stats()
+    followups = followup_store.stats()
+    mapped = map_reduce.stats()
+    blocks = block_summaries.stats()
+    archive = message_archive.stats()
+    analytics = activity_analytics.stats()
+    sketches = term_sketches.stats()
+    digests = digest_builder.stats()
+    backfill = archive_backfill.stats()
+    memory = memory_bank.stats()
+    compaction = history_compaction.stats()
+    prompt_cache = prompt_cache_telemetry.stats()
+    coalesced = (history_flights.counters['coalesced'] + response_flights.counters['coalesced']
+                 + images['coalesced'])
+    embed = discord.Embed(
+        title="📊 Gronk Stats",
+        color=discord.Color.purple(),
+        timestamp=ctx.message.created_at
+    )
+    embed.add_field(
+        name="Grok Requests",
+        value=(
+            f"In flight: {sched['in_flight']} • Completed: {sched['completed']:,}\n"
+            f"Interactive queued: {sched['interactive_queued']} "
+            f"(wait avg {sched['interactive_wait_avg']:.2f}s / p95 {sched['interactive_wait_p95']:.2f}s)\n"
+            f"Bulk queued: {sched['bulk_queued']} "
+            f"(wait avg {sched['bulk_wait_avg']:.2f}s / p95 {sched['bulk_wait_p95']:.2f}s)\n"
+            f"Guilds waiting: {sched['queued_guilds']}"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Reliability",
+        value=(
+            f"Retries: {resilience['retries']} • Succeeded after retry: {resilience['success_after_retry']}\n"
+            f"Failed: {resilience['failures']} • Short-circuited: {resilience['short_circuited']}\n"
+            f"Hedged: {resilience['hedges_sent']} (won {resilience['hedges_won']}) • "
+            f"p95 latency: {resilience['latency_p95']:.2f}s • Circuit: {resilience['breaker']}"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Response Cache",
+        value=(
+            f"Hits: {cache['hits']} • Misses: {cache['misses']} • Hit rate: {cache['hit_rate']:.0%}\n"
+            f"Bypassed (time-sensitive): {cache['bypassed']} • Stored: {cache['stored']}\n"
+            f"History analyses: {history['hits']} hits / {history['misses']} misses "
+            f"({history['stale']} stale, {history['entries']} cached)\n"
+            f"Search follow-ups: {followups['hits']} answered from {followups['entries']} stored results "
+            f"({followups['messages']:,} messages)\n"
+            f"Map-reduce analyses: {mapped['analyses']} ({mapped['shards']} shards, {mapped['failed_shards']} failed)\n"
+            f"Block summaries: {mapped['blocks_reused']} reused / {mapped['blocks_summarized']} written "
+            f"({blocks['hit_rate']:.0%} hit rate)\n"
+            f"Channel digests: {digests['hourly']} hourly / {digests['daily']} daily in {digests['channels']} channels "
+            f"({digests['active_channels']} pending, {digests['failures']} failed runs)\n"
+            f"Archive: {archive['messages']:,} messages in {archive['channels']} channels • "
+            f"Activity answers: {analytics['answered']} (avg {analytics['avg_ms']:.0f} ms, "
+            f"{analytics['loaded_messages']:,} messages loaded for {analytics['loaded_scopes']} guilds)\n"
+            f"Backfill: {backfill['complete']}/{backfill['channels']} channels complete, {backfill['messages']:,} messages "
+            f"in {backfill['pages']:,} pages{' (paused)' if backfill['paused'] else ''}\n"
+            f"Term sketches: {sketches['messages']:,} messages in {sketches['scopes']} channels/servers "
+            f"({sketches['sketch_bytes'] // 1024:,} KiB, {sketches['dropped_batches']} batches dropped)\n"
+            f"Memory bank: {memory['recalled']} exchanges recalled in {memory['recalls']} questions "
+            f"({memory['embedded']} embedded with {memory['embedder']})\n"
+            f"History compaction: {compaction['folded']:,} near-duplicates folded, {compaction['dropped']:,} "
+            f"low-information messages dropped ({compaction['histories']} histories)\n"
+            f"Coalesced duplicates: {coalesced}"
+        ),
+        inline=False
+    )
+    if prompt_cache:
+        embed.add_field(
+            name="Prompt Cache",
+            value="\n".join(
+                f"{request_type}: {totals['cached_ratio']:.0%} of {totals['prompt_tokens']:,} prompt tokens cached "
+                f"({totals['requests']} requests)"
+                for request_type, totals in sorted(prompt_cache.items())
+            ),
+            inline=False
+        )
+    embed.add_field(
+        name="Image Generation",
+        value=(
+            f"Active: {images['active']} • Queued: {images['queued']}\n"
+            f"Cached prompts: {images['cached_prompts']}"
+        ),
+        inline=False
+    )
+    await ctx.reply(embed=embed)
+
+def text_usage_text(*completions):
+    """
+    Cost and token footer text for one or more text model completions (e.g. map-reduce shards plus
+    the final answer); cached prompt tokens are billed at the cached rate
+    """
+    request_cost = 0
+    prompt_tokens = 0
+    completion_tokens = 0
+    for completion in completions:
+        if not (hasattr(completion, 'usage') and completion.usage):
+            continue
+        if hasattr(completion.usage, 'prompt_tokens_details') and completion.usage.prompt_tokens_details:
+            cached = completion.usage.prompt_tokens_details.cached_tokens
+            uncached = completion.usage.prompt_tokens - cached
+            input_cost = (uncached / 1_000_000) * GROK_TEXT_INPUT_COST + (cached / 1_000_000) * GROK_TEXT_CACHED_COST
+        else:
+            input_cost = (completion.usage.prompt_tokens / 1_000_000) * GROK_TEXT_INPUT_COST
+        output_cost = (completion.usage.completion_tokens / 1_000_000) * GROK_TEXT_OUTPUT_COST
+        request_cost += input_cost + output_cost
+        prompt_tokens += completion.usage.prompt_tokens
+        completion_tokens += completion.usage.completion_tokens
+    if not prompt_tokens:
+        return ""
+    usage_text = f"💵 ${request_cost:.6f} • {prompt_tokens} in / {completion_tokens} out"
+    if len(completions) > 1:
+        usage_text += f" • {len(completions)} requests"
+    return usage_text
+
+def analysis_window():
+    """How many of the newest matches a history scan keeps for analysis"""
+    return MAP_REDUCE_MAX_MESSAGES if MAP_REDUCE_ENABLED else MAX_MESSAGES_ANALYZED
+
+async def map_history_if_needed(encoded, query, *, guild_id, request_type):
+    """
+    Returns (history text for the answer prompt, map completions, number of messages covered).
+    Histories over MAX_MESSAGES_ANALYZED messages are replaced by concurrently written per-shard notes.
+    """
+    if not MAP_REDUCE_ENABLED or len(encoded.lines) <= MAX_MESSAGES_ANALYZED:
+        return encoded.text, [], len(encoded.number_map)
+    return await map_reduce.map(encoded, query, guild_id=guild_id, request_type=request_type)
+
+async def send_search_results(message, title, response, usage_text):
+    """
+    Send !search results (or a follow-up answer) as a reply to message, as one embed message
+    paged behind buttons when longer than an embed. Returns the sent message.
+    """
+    def build_embed(description, page, pages):
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=discord.Color.purple(),
+            timestamp=message.created_at
+        )
+        embed.set_author(
+            name="Grok Search",
+            icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
+        )
+        embed.add_field(
+            name="💡 Follow-up",
+            value="Reply to this message to ask more questions about this user's history",
+            inline=False
+        )
+        footer_text = f"Requested by {message.author.display_name}"
+        if usage_text:
+            footer_text += f" • {usage_text}"
+        if pages > 1:
+            footer_text = f"Page {page}/{pages} • {footer_text}"
+        embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
+        return embed
+
+    return await send_paginated(message.reply, response, build_embed)
+
+async def answer_search_followup(message, query, context):
+    """Answer a reply to a !search result from the messages that search analyzed, without rescanning"""
+    # The search's own history block, so it is served from Grok's prompt cache and citation numbers match
+    prompt_messages = assemble_messages(
+        search_system_prefix(TIMEZONE.zone),
+        f"Earlier search query: {context.query}\n\nFollow-up question: {query}\n\n"
+        f"Based on these messages, answer the follow-up question.",
+        history=context.history
+    )
+
+    async with message.channel.typing():
+        completion = await grok_complete(
+            {"model": GROK_TEXT_MODEL, "messages": prompt_messages},
+            guild_id=message.guild.id if message.guild else None,
+            request_type='search_followup'
+        )
+        response = completion.choices[0].message.content
+        response = ResponsePostProcessor(
+            context.number_map,
+            authors=context.authors,
+            name_lookup=member_index.lookup(message.guild) if message.guild else None
+        ).process(response)
+
+    logger.info(f'Answered search follow-up from {len(context.number_map)} stored messages')
+    result_message = await send_search_results(message, "🔍 Search Follow-up", response, text_usage_text(completion))
+    # Replies to the follow-up continue the same conversation
+    followup_store.put(result_message.id, context)
+
+async def run_channel_search(ctx, waiters, target_user, query, limit, keyword_filter):
+    """
+    Scan channel history for !search and analyze the matches with Grok, for every request in
+    waiters (a ScanWaiters). Returns a HistoryAnalysis (with follow-up context attached), or None if nothing matched.
+    """
+    # For keyword filtering, scan much more to find filtered results
+    # For general searches, only scan what we can send to Grok
+    if keyword_filter:
+        # Scan up to MAX_KEYWORD_SCAN messages for keyword searches
+        max_scan = MAX_KEYWORD_SCAN
+    else:
+        # For non-keyword searches, we'll send all results to Grok anyway
+        # So only scan up to MAX_MESSAGES_ANALYZED (no point scanning more)
+        max_scan = MAX_MESSAGES_ANALYZED
+
+    # Pre-compute lowercase keyword for faster comparison
+    keyword_lower = keyword_filter.lower() if keyword_filter else None
+
+    if target_user:
+        scope = f"{target_user.mention}'s message history"
+    else:
+        scope = "channel history" if keyword_filter else "channel message history"
+    if keyword_filter:
+        scope += f" for keyword `{keyword_filter}`"
+
+    def render_progress(scanned, found, pct, rate, eta):
+        status = f"{pct}% - " if pct is not None else ""
+        status += f"scanned {scanned:,}, found {found:,} • {rate:,.0f} msg/s"
+        if eta:
+            status += f" • ~{eta} left"
+        return f"🔍 Searching {scope}... ({status})"
+
+    # Keyword scans run to max_scan; other scans stop early once enough messages match
+    progress = ScanProgress(waiters.status_messages, render_progress, total=max_scan if keyword_filter else None,
+                            interval=PROGRESS_UPDATE_INTERVAL)
+
+    def matches(msg):
+        # Cheapest checks first: user filter, bot filter, then the keyword
+        if target_user and msg.author != target_user:
+            return False
+        if not target_user and msg.author.bot:
+            return False
+        return not keyword_lower or keyword_lower in msg.content.lower()
+
+    if target_user:
+        title = f"User {target_user.name}'s recent messages:"
+    else:
+        title = "Channel messages:"
+
+    # Stream history (newest first) through filter -> compact record -> compact encoding; only the
+    # newest matches that will be analyzed are kept (near-duplicates folded into one line, and
+    # low-information messages dropped unless a keyword was given), and message numbers / handles
+    # map back to records for citation linking and mentions
+    scan = HistoryScan(
+        ctx.channel,
+        limit=max_scan,
+        matches=matches,
+        encoder=HistoryEncoder(TIMEZONE, title, include_authors=not target_user, max_messages=analysis_window(),
+                               compactor=history_compaction.compactor(drop_low_information=not keyword_filter)),
+        skip_ids=waiters.command_ids,
+        stop_after=None if keyword_filter else limit,
+        progress=progress,
+        archive=message_archive if MESSAGE_ARCHIVE_ENABLED else None
+    )
+    encoded = await scan.run()
+    await progress.close()
+
+    if encoded is None:
+        return None
+
+    messages_found = scan.found
+    if target_user:
+        logger.info(f'Found {messages_found} messages from {target_user}' + (f' (filtered by "{keyword_filter}")' if keyword_filter else ''))
+    else:
+        logger.info(f'Found {messages_found} messages from all users' + (f' (filtered by "{keyword_filter}")' if keyword_filter else ''))
+
+    message_number_map = encoded.number_map
+    messages_to_analyze = len(message_number_map)
+
+    # Too many matches for one prompt: summarize shards concurrently, then answer from the notes
+    history_text, map_completions, messages_covered = await map_history_if_needed(
+        encoded, query, guild_id=ctx.guild.id if ctx.guild else None, request_type='search'
+    )
+    if map_completions:
+        showing = f"(Analyzed {messages_covered} of {messages_found} messages found, read in parts)"
+    else:
+        showing = f"(Showing {messages_to_analyze} of {messages_found} messages found)"
+
+    # Stable instructions first and the query last, so repeat searches hit Grok's prompt cache
+    prompt_messages = assemble_messages(
+        search_system_prefix(TIMEZONE.zone),
+        f"{showing}\n\n"
+        f"Search query: {query}\n\nBased on these messages, {query}",
+        history=history_text
+    )
+
+    # Query Grok
+    async with ctx.channel.typing():
+        # Build request parameters
+        request_params = {
+            "model": GROK_TEXT_MODEL,
+            "messages": prompt_messages
+        }
+
+        # Add search parameters if enabled
+        if ENABLE_WEB_SEARCH:
+            request_params["extra_body"] = {
+                "search_parameters": {
+                    "mode": "auto",
+                    "max_search_results": MAX_SEARCH_RESULTS
+                }
+            }
+
+        completion = await grok_complete(
+            request_params,
+            priority=PRIORITY_BULK,
+            guild_id=ctx.guild.id if ctx.guild else None,
+            request_type='search'
+        )
+
+        response = completion.choices[0].message.content
+
+        # Resolve citations (including ranges and malformed #N(channel) forms) to message links and
+        # author handles / usernames to mentions in one pass
+        postprocessor = ResponsePostProcessor(
+            message_number_map,
+            authors=encoded.authors,
+            name_lookup=member_index.lookup(ctx.guild) if ctx.guild else None
+        )
+        response = postprocessor.process(response)
+        cited_numbers = postprocessor.cited
+        logger.info(f'Found {len(cited_numbers)} cited messages: {sorted(cited_numbers)}')
+
+        usage_text = text_usage_text(*map_completions, completion)
+
+        # Create response embed
+        if target_user:
+            title = f"🔍 Search Results: {target_user.display_name}"
+        else:
+            title = "🔍 Search Results: Channel History"
+
+        # Prepare additional fields
+        messages_info = f"{messages_found} total (analyzed {messages_covered})"
+        if keyword_filter:
+            messages_info += f"\nFiltered by: `{keyword_filter}`"
+        if cited_numbers:
+            messages_info += f"\n{len(cited_numbers)} messages cited"
+
+        return HistoryAnalysis(
+            title=title,
+            text=response,
+            usage_text=usage_text,
+            channel_id=ctx.channel.id,
+            newest_message_id=message_number_map[messages_to_analyze].id,
+            messages_found=messages_found,
+            messages_analyzed=messages_covered,
+            # The prompt's history block and the records it refers to, so replies to the result need
+            # no rescan and no re-encoding
+            followup=SearchContext(
+                ctx.channel.id, target_user.id if target_user else None, query, history_text,
+                message_number_map, encoded.authors
+            )
+        )
+
 @bot.command(name='search')
 async def search_history(ctx, *, query_text: str):
     """Search message history in this channel
@@ -487,6 +1168,17 @@ async def search_history(ctx, *, query_text: str):
     else:
         logger.info(f'Search command by {ctx.author} for ALL users with query: {query}, limit: {limit}, keyword: {keyword_filter}')
     
+    # Serve a recent identical search if the channel hasn't moved on since
+    cache_key = make_history_cache_key(
+        'search', ctx.channel.id, target_user.id if target_user else None, query, keyword_filter, limit
+    )
+    cached = history_cache.get(cache_key)
+    if cached:
+        result_message = await send_search_results(ctx.message, cached.title, cached.text, HISTORY_CACHE_USAGE_TEXT)
+        if cached.followup:
+            followup_store.put(result_message.id, cached.followup)
+        return
+    
     # Send a "searching" message
     if keyword_filter:
         # Keyword search scans entire history
@@ -501,435 +1193,38 @@ async def search_history(ctx, *, query_text: str):
         else:
             searching_msg = await ctx.reply(f"🔍 Searching channel message history (last {limit} messages)...")
     
+    # Identical searches already running share one scan and one Grok call; each gets the progress
+    # edits and the scan skips every one of their commands
+    waiters = history_waiters.setdefault(cache_key, ScanWaiters())
+    waiters.join(ctx.message, searching_msg)
     try:
-        # Collect messages (history returns newest first)
-        collected_messages = []
-        messages_scanned = 0
-        last_update = 0
-        
-        # For keyword filtering, scan much more to find filtered results
-        # For general searches, only scan what we can send to Grok
-        if keyword_filter:
-            # Scan up to MAX_KEYWORD_SCAN messages for keyword searches
-            max_scan = MAX_KEYWORD_SCAN
-        else:
-            # For non-keyword searches, we'll send all results to Grok anyway
-            # So only scan up to MAX_MESSAGES_ANALYZED (no point scanning more)
-            max_scan = MAX_MESSAGES_ANALYZED
-        
-        # Pre-compute lowercase keyword for faster comparison
-        keyword_lower = keyword_filter.lower() if keyword_filter else None
-        
-        async for msg in ctx.channel.history(limit=max_scan):
-            # Skip the search command itself immediately
-            if msg.id == ctx.message.id:
-                continue
-            
-            messages_scanned += 1
-            
-            # Apply filters efficiently (short-circuit evaluation)
-            # Check user filter first (faster than string operations)
-            if target_user and msg.author != target_user:
-                continue
-            
-            # Check bot filter for non-targeted searches
-            if not target_user and msg.author.bot:
-                continue
-            
-            # Apply keyword filter last (most expensive operation)
-            if keyword_lower and keyword_lower not in msg.content.lower():
-                continue
-            
-            # Message passed all filters
-            collected_messages.append(msg)
-            
-            # Update progress message every 2000 messages scanned (even less frequent)
-            if messages_scanned - last_update >= 2000:
-                last_update = messages_scanned
-                try:
-                    if keyword_filter:
-                        progress_pct = int((messages_scanned / max_scan) * 100) if max_scan > 0 else 0
-                        if target_user:
-                            await searching_msg.edit(content=f"🔍 Searching {target_user.mention}'s message history for keyword `{keyword_filter}`... ({progress_pct}% - scanned {messages_scanned:,}, found {len(collected_messages):,})")
-                        else:
-                            await searching_msg.edit(content=f"🔍 Searching channel history for keyword `{keyword_filter}`... ({progress_pct}% - scanned {messages_scanned:,}, found {len(collected_messages):,})")
-                    else:
-                        if target_user:
-                            await searching_msg.edit(content=f"🔍 Searching {target_user.mention}'s message history... (scanned {messages_scanned:,}, found {len(collected_messages):,})")
-                        else:
-                            await searching_msg.edit(content=f"🔍 Searching channel message history... (scanned {messages_scanned:,}, found {len(collected_messages):,})")
-                except:
-                    pass  # Ignore errors updating status
-            
-            # For non-keyword searches, stop when we have enough
-            if not keyword_filter and len(collected_messages) >= limit:
-                break
-        
-        if not collected_messages:
+        try:
+            analysis = await history_flights.do(
+                cache_key,
+                lambda: run_channel_search(ctx, waiters, target_user, query, limit, keyword_filter)
+            )
+        finally:
+            if waiters.leave(searching_msg) and history_waiters.get(cache_key) is waiters:
+                del history_waiters[cache_key]
+
+        if not analysis:
             if target_user:
                 await searching_msg.edit(content=f"❌ No messages found from {target_user.mention} in this channel.")
             else:
                 await searching_msg.edit(content=f"❌ No messages found in this channel.")
             return
-        
-        if target_user:
-            logger.info(f'Found {len(collected_messages)} messages from {target_user}' + (f' (filtered by "{keyword_filter}")' if keyword_filter else ''))
-        else:
-            logger.info(f'Found {len(collected_messages)} messages from all users' + (f' (filtered by "{keyword_filter}")' if keyword_filter else ''))
-        
-        # Store search context for follow-ups
-        if ctx.channel.id not in search_context:
-            search_context[ctx.channel.id] = {}
-        search_context[ctx.channel.id][ctx.author.id] = {
-            'searched_user': target_user,
-            'messages': collected_messages,
-            'last_query': query
-        }
-        
-        # Build context for Grok (configurable limit via MAX_MESSAGES_ANALYZED)
-        # Since collected_messages is in reverse chronological order (newest first),
-        # we take the first N messages (most recent) and then reverse them for chronological order
-        messages_to_analyze = min(len(collected_messages), MAX_MESSAGES_ANALYZED)
-        messages_for_context = collected_messages[:messages_to_analyze]
-        
-        if target_user:
-            context_parts = [f"Search query: {query}\n\nUser {target_user.name}'s recent messages (showing {messages_to_analyze} of {len(collected_messages)} found, from oldest to newest):\n"]
-        else:
-            context_parts = [f"Search query: {query}\n\nChannel messages (showing {messages_to_analyze} of {len(collected_messages)} found, from oldest to newest):\n"]
-        
-        # Create a mapping of message numbers to message objects for later citation linking
-        # Reverse to show chronological order (oldest to newest)
-        message_number_map = {}
-        for i, msg in enumerate(reversed(messages_for_context), 1):
-            # Convert UTC timestamp to configured timezone
-            timestamp_local = msg.created_at.astimezone(TIMEZONE)
-            tz_abbr = timestamp_local.strftime("%Z")  # Get timezone abbreviation (CST, CDT, etc.)
-            timestamp_str = timestamp_local.strftime(f"%Y-%m-%d %H:%M {tz_abbr}")
-            author_name = msg.author.name if not target_user else ""
-            content = msg.content[:300] + "..." if len(msg.content) > 300 else msg.content
-            message_number_map[i] = msg  # Store mapping for later
-            if target_user:
-                context_parts.append(f"[{i}] [{timestamp_str}] {content}")
-            else:
-                context_parts.append(f"[{i}] [{timestamp_str}] {author_name}: {content}")
-        
-        context_parts.append(f"\n\nBased on these messages, {query}")
-        context_parts.append("\n\nIMPORTANT CITATION GUIDELINES:")
-        context_parts.append("- Cite key messages that support your main points (aim for 3-6 total citations)")
-        context_parts.append("- Be selective - don't cite every message, but DO cite your evidence")
-        context_parts.append("- NEVER use ranges like [#5-#10] - only cite individual messages: [#5], [#7], [#10]")
-        context_parts.append("- Use EXACTLY this format: [#N] where N is the message number")
-        context_parts.append("- Examples: [#5] or [#12]. Multiple: [#3], [#7], and [#12]")
-        context_parts.append("- Do NOT add any extra text or context inside the brackets")
-        context_parts.append("\n\nNote: Custom Discord emojis appear as <:emoji_name:emoji_id>. When quoting messages with emojis, preserve this exact format.")
-        tz_name = TIMEZONE.zone  # e.g., "America/Chicago"
-        context_parts.append(f"\n\nNote: All timestamps are in {tz_name} timezone.")
-        full_prompt = "\n".join(context_parts)
-        
-        # Query Grok
-        async with ctx.channel.typing():
-            # Build request parameters
-            request_params = {
-                "model": GROK_TEXT_MODEL,
-                "messages": [{"role": "user", "content": full_prompt}]
-            }
-            
-            # Add search parameters if enabled
-            if ENABLE_WEB_SEARCH:
-                request_params["extra_body"] = {
-                    "search_parameters": {
-                        "mode": "auto",
-                        "max_search_results": MAX_SEARCH_RESULTS
-                    }
-                }
-            
-            completion = client.chat.completions.create(**request_params)
-            
-            response = completion.choices[0].message.content
-            
-            # Clean up malformed citations (e.g., #248(⁠post-election-year-hate-dome⁠) -> #248)
-            # First, remove channel names from citations
-            malformed_citation_pattern = r'#(\d+)\([^)]*\)'
-            response = re.sub(malformed_citation_pattern, r'#\1', response)
-            
-            # Now convert citations to bracketed format
-            # First handle ranges like #140-#141-#142 or #727-#1000 -> [#140-#141-#142]
-            # The pattern matches: #<num>-#<num> or #<num>-<num>-#<num> etc.
-            # Must not already be inside brackets
-            range_bare_pattern = r'(?<!\[)#(\d+(?:-#?\d+)+)(?!\])'
-            response = re.sub(range_bare_pattern, r'[#\1]', response)
-            
-            # Then handle individual citations #N -> [#N]
-            # Must not be: already in brackets, followed by dash (part of range), or followed by ]
-            bare_citation_pattern = r'(?<!\[)#(\d+)(?![\d\-\)\]])'
-            response = re.sub(bare_citation_pattern, r'[#\1]', response)
-            
-            # Parse citations from response and extract referenced message numbers
-            # Match both individual citations [#N] and ranges [#N-#M], [#N]-[#M], [#N-M]
-            citation_pattern = r'\[#(\d+)\]'
-            range_pattern = r'\[#(\d+)-#?(\d+)\]'  # Matches [#497-502], [#88-#90]
-            
-            # Find individual citations (but not those that are part of ranges)
-            cited_numbers = set()
-            for match in re.finditer(citation_pattern, response):
-                # Check if this is part of a range by looking at context
-                pos = match.start()
-                # Skip if preceded by a range pattern
-                if pos > 0 and response[pos-1:pos] in ['-', ']']:
-                    continue
-                cited_numbers.add(int(match.group(1)))
-            
-            # Find and expand ranges
-            for match in re.finditer(range_pattern, response):
-                start_num = int(match.group(1))
-                end_num = int(match.group(2))
-                # Add all numbers in the range
-                cited_numbers.update(range(start_num, end_num + 1))
-            
-            logger.info(f'Found {len(cited_numbers)} cited messages: {sorted(cited_numbers)}')
-            
-            # Replace ranges with individual linked citations (compact format)
-            def replace_range(match):
-                start_num = int(match.group(1))
-                end_num = int(match.group(2))
-                links = []
-                for msg_num in range(start_num, end_num + 1):
-                    if msg_num in message_number_map:
-                        msg = message_number_map[msg_num]
-                        msg_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{msg.id}"
-                        links.append(f"[#{msg_num}]({msg_link})")
-                    else:
-                        links.append(f"[#{msg_num}]")
-                return "-".join(links) if links else match.group(0)
-            
-            # Replace individual citations with Discord message links (not part of ranges, compact format)
-            def replace_citation(match):
-                # Skip if already a markdown link (check if followed by ]( )
-                pos = match.start()
-                after_pos = match.end()
-                
-                # Check if this is already inside a markdown link
-                if after_pos < len(response) - 2 and response[after_pos:after_pos+2] == '](':
-                    return match.group(0)  # Already linked, skip
-                
-                # Check if this citation is part of a range by looking at context
-                if after_pos < len(response) and response[after_pos:after_pos+1] == '-':
-                    return match.group(0)  # This is the start of a range, skip it
-                # Check what comes before
-                if pos > 0 and response[pos-1:pos] == '-':
-                    return match.group(0)  # This is the end of a range, skip it
-                    
-                msg_num = int(match.group(1))
-                if msg_num in message_number_map:
-                    msg = message_number_map[msg_num]
-                    msg_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{msg.id}"
-                    return f"[#{msg_num}]({msg_link})"
-                return match.group(0)  # Keep original if not found
-            
-            # First replace ranges, then individual citations
-            response = re.sub(range_pattern, replace_range, response)
-            response = re.sub(citation_pattern, replace_citation, response)
-            
-            # Convert custom Discord emoji references to actual emoji format
-            # Pattern: <:emoji_name:emoji_id> or <a:emoji_name:emoji_id> for animated
-            emoji_pattern = r'<(a?):([^:]+):(\d+)>'
-            def render_emoji(match):
-                animated = match.group(1)
-                emoji_name = match.group(2)
-                emoji_id = match.group(3)
-                # Return proper Discord emoji format
-                return f"<{animated}:{emoji_name}:{emoji_id}>"
-            
-            response = re.sub(emoji_pattern, render_emoji, response)
-            
-            # Convert Discord usernames to mentions
-            response = convert_usernames_to_mentions(response, ctx.guild)
-            
-            # Calculate cost
-            request_cost = 0
-            usage_text = ""
-            if hasattr(completion, 'usage') and completion.usage:
-                if hasattr(completion.usage, 'prompt_tokens_details') and completion.usage.prompt_tokens_details:
-                    cached = completion.usage.prompt_tokens_details.cached_tokens
-                    uncached = completion.usage.prompt_tokens - cached
-                    input_cost = (uncached / 1_000_000) * GROK_TEXT_INPUT_COST + (cached / 1_000_000) * GROK_TEXT_CACHED_COST
-                else:
-                    input_cost = (completion.usage.prompt_tokens / 1_000_000) * GROK_TEXT_INPUT_COST
-                output_cost = (completion.usage.completion_tokens / 1_000_000) * GROK_TEXT_OUTPUT_COST
-                request_cost = input_cost + output_cost
-                usage_text = f"💵 ${request_cost:.6f} • {completion.usage.prompt_tokens} in / {completion.usage.completion_tokens} out"
-            
-            # Delete searching message
-            await searching_msg.delete()
-            
-            # Create response embed
-            if target_user:
-                title = f"🔍 Search Results: {target_user.display_name}"
-            else:
-                title = "🔍 Search Results: Channel History"
-            
-            # Prepare additional fields
-            messages_info = f"{len(collected_messages)} total (analyzed {messages_to_analyze})"
-            if keyword_filter:
-                messages_info += f"\nFiltered by: `{keyword_filter}`"
-            if cited_numbers:
-                messages_info += f"\n{len(cited_numbers)} messages cited"
-            
-            # Split response into chunks if needed (4096 char limit per embed description)
-            # When splitting, ensure we don't break citations in the middle
-            if len(response) <= 4096:
-                # Single embed response
-                embed = discord.Embed(
-                    title=title,
-                    description=response,
-                    color=discord.Color.purple(),
-                    timestamp=ctx.message.created_at
-                )
-                embed.set_author(
-                    name="Grok Search",
-                    icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                )
-                embed.add_field(
-                    name="💡 Follow-up",
-                    value="Reply to this message to ask more questions about this user's history",
-                    inline=False
-                )
-                footer_text = f"Requested by {ctx.author.display_name}"
-                if usage_text:
-                    footer_text += f" • {usage_text}"
-                embed.set_footer(text=footer_text, icon_url=ctx.author.avatar.url if ctx.author.avatar else None)
-                
-                await ctx.reply(embed=embed)
-            else:
-                # Split into multiple embeds, but avoid breaking citations
-                chunks = []
-                current_chunk = ""
-                
-                # Split by sentences/paragraphs first to avoid breaking markdown links
-                paragraphs = response.split('\n\n')
-                
-                for para in paragraphs:
-                    # If adding this paragraph would exceed limit, start new chunk
-                    if len(current_chunk) + len(para) + 2 > 4096:  # +2 for \n\n
-                        if current_chunk:
-                            chunks.append(current_chunk.rstrip())
-                            current_chunk = para + '\n\n'
-                        else:
-                            # Paragraph itself is too long, need to split it more carefully
-                            sentences = para.split('. ')
-                            for sentence in sentences:
-                                if len(current_chunk) + len(sentence) + 2 > 4096:
-                                    if current_chunk:
-                                        chunks.append(current_chunk.rstrip())
-                                        current_chunk = sentence + '. '
-                                    else:
-                                        # Even a single sentence is too long, force split but try to avoid breaking links
-                                        # Find a safe break point (space not inside a markdown link)
-                                        safe_length = 4096
-                                        chunk_text = sentence[:safe_length]
-                                        
-                                        # Check if we're in the middle of a markdown link
-                                        last_bracket = chunk_text.rfind('[')
-                                        last_paren = chunk_text.rfind('(')
-                                        close_bracket = chunk_text.rfind(']')
-                                        close_paren = chunk_text.rfind(')')
-                                        
-                                        # If we have an open bracket/paren without close, find a safer break
-                                        if (last_bracket > close_bracket) or (last_paren > close_paren):
-                                            # Find last complete space before the link started
-                                            last_safe_space = chunk_text.rfind(' ', 0, last_bracket if last_bracket > last_paren else last_paren)
-                                            if last_safe_space > 0:
-                                                chunk_text = sentence[:last_safe_space]
-                                        
-                                        chunks.append(chunk_text)
-                                        current_chunk = sentence[len(chunk_text):] + '. '
-                                else:
-                                    current_chunk += sentence + '. '
-                    else:
-                        current_chunk += para + '\n\n'
-                
-                # Add remaining chunk
-                if current_chunk.strip():
-                    chunks.append(current_chunk.rstrip())
-                
-                logger.info(f'Search response split into {len(chunks)} embeds')
-                
-                # Helper function to calculate total embed size
-                def get_embed_size(embed):
-                    size = 0
-                    if embed.title:
-                        size += len(embed.title)
-                    if embed.description:
-                        size += len(embed.description)
-                    if embed.footer and embed.footer.text:
-                        size += len(embed.footer.text)
-                    if embed.author and embed.author.name:
-                        size += len(embed.author.name)
-                    for field in embed.fields:
-                        if field.name:
-                            size += len(field.name)
-                        if field.value:
-                            size += len(field.value)
-                    return size
-                
-                for i, chunk in enumerate(chunks):
-                    embed = discord.Embed(
-                        title=f"{title} (Part {i+1}/{len(chunks)})" if i > 0 else title,
-                        description=chunk,
-                        color=discord.Color.purple(),
-                        timestamp=ctx.message.created_at
-                    )
-                    embed.set_author(
-                        name="Grok Search",
-                        icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                    )
-                    
-                    # Add fields and footer only to last embed
-                    if i == len(chunks) - 1:
-                        embed.add_field(
-                            name="💡 Follow-up",
-                            value="Reply to this message to ask more questions about this user's history",
-                            inline=False
-                        )
-                        footer_text = f"Requested by {ctx.author.display_name}"
-                        if usage_text:
-                            footer_text += f" • {usage_text}"
-                        embed.set_footer(text=footer_text, icon_url=ctx.author.avatar.url if ctx.author.avatar else None)
-                    
-                    # Check if embed size exceeds limit (6000 chars total)
-                    embed_size = get_embed_size(embed)
-                    if embed_size > 5800:  # Leave some buffer
-                        # Need to split this chunk further
-                        logger.warning(f'Embed {i+1} size {embed_size} exceeds limit, splitting further')
-                        # Split description in half
-                        mid_point = len(chunk) // 2
-                        # Find a good break point (paragraph or sentence)
-                        break_point = chunk.rfind('\n\n', 0, mid_point)
-                        if break_point == -1:
-                            break_point = chunk.rfind('. ', 0, mid_point)
-                        if break_point == -1:
-                            break_point = chunk.rfind(' ', 0, mid_point)
-                        if break_point == -1:
-                            break_point = mid_point
-                        
-                        # Insert the second half back into chunks
-                        first_half = chunk[:break_point].rstrip()
-                        second_half = chunk[break_point:].lstrip()
-                        chunks[i] = first_half
-                        chunks.insert(i + 1, second_half)
-                        
-                        # Update embed with first half
-                        embed.description = first_half
-                        # Update title to reflect new total
-                        if i > 0:
-                            embed.title = f"{title} (Part {i+1}/{len(chunks)})"
-                        
-                        logger.info(f'Split embed into 2 parts, now have {len(chunks)} total chunks')
-                    
-                    await ctx.reply(embed=embed)
-            
-            logger.info(f'Search completed successfully')
-            
+
+        # Remember the result so a repeat of this search in a quiet channel is instant
+        history_cache.put(cache_key, analysis)
+
+        # Delete searching message
+        await searching_msg.delete()
+
+        result_message = await send_search_results(ctx.message, analysis.title, analysis.text, analysis.usage_text)
+        followup_store.put(result_message.id, analysis.followup)
+
+        logger.info(f'Search completed successfully')
+
     except Exception as e:
         logger.error(f'Error in search command: {e}', exc_info=True)
         try:
@@ -938,7 +1233,7 @@ async def search_history(ctx, *, query_text: str):
             # If searching message was already deleted, send a new message
             await ctx.reply(f"❌ Error searching messages: {str(e)}")
 
-async def should_search_discord_history(message_content, has_mentions):
+async def should_search_discord_history(message_content, has_mentions, guild_id=None):
     """
     Determine if the user query is asking to search Discord history.
     
@@ -987,16 +1282,35 @@ async def should_search_discord_history(message_content, has_mentions):
         time_limit = extract_time_period(content_lower)
         keywords = extract_keywords(content_lower)
         return True, time_limit, keywords
-    
+
     # Check for Discord-specific pronouns (we/us/our)
     discord_pronouns = [" we ", " us ", " our "]
     has_discord_pronoun = any(pronoun in " " + content_lower + " " for pronoun in discord_pronouns)
     
     # 2. OBVIOUS GENERAL QUERIES - Skip API call
-    general_indicators = [
+    # About the outside world ("who posts the most on twitter") - never the Discord history
+    external_indicators = [
         "in history", "in the world", "on twitter", "on x.com",
         "in the news", "globally", "worldwide", "scientists say",
-        "researchers found", "studies show", "according to",
+        "researchers found", "studies show", "according to"
+    ]
+    if any(indicator in content_lower for indicator in external_indicators):
+        logger.info('General query detected: general indicator found')
+        return False, None, None
+
+    # Counting / ranking questions about members ("who talks the most", "how many messages have I sent");
+    # plain activity rankings ("leaderboard", "top posters") need a hint that they are about members here
+    analytics_question = parse_analytics_question(message_content)
+    if analytics_question and (
+        analytics_question.kind != 'rank_messages' or has_discord_pronoun
+        or re.search(r"\b(?:who|members?|users?|people|everyone|anyone)\b", content_lower)
+    ):
+        logger.info('Discord search detected: activity counting / ranking question')
+        time_limit = extract_time_period(content_lower)
+        keywords = extract_keywords(content_lower)
+        return True, time_limit, keywords
+
+    general_indicators = [
         "what is", "what are", "what was", "what were",
         "how does", "how do", "how did", "how can", "how much", "how many", "how high", "how low", "how far",
         "why does", "why do", "why did", "why is", "why are",
@@ -1054,7 +1368,7 @@ async def should_search_discord_history(message_content, has_mentions):
         # Ambiguous case - use Grok to classify
         logger.info(f'Ambiguous query (score {discord_score}), using Grok classification...')
         try:
-            is_discord = await classify_with_grok(message_content)
+            is_discord = await classify_with_grok(message_content, guild_id=guild_id)
             if is_discord:
                 time_limit = extract_time_period(content_lower)
                 keywords = extract_keywords(content_lower)
@@ -1109,39 +1423,21 @@ def extract_keywords(content_lower):
         return ', '.join(keywords)
     return None
 
-async def classify_with_grok(message_content):
+async def classify_with_grok(message_content, guild_id=None):
     """Use Grok to classify if query is about Discord or general knowledge"""
-    classification_prompt = f"""You are analyzing a Discord bot query. Determine if the user is asking about:
-
-A) DISCORD: The Discord server's chat history, messages, or users in THIS server
-B) GENERAL: General knowledge, news, history, or topics outside this Discord server
-
-Examples of DISCORD queries:
-- "who talks about Python the most?"
-- "what have we discussed about AI recently?"
-- "summarize our conversations from last week"
-- "who mentions crypto the most?"
-- "what are the main topics discussed here?"
-
-Examples of GENERAL queries:
-- "who was the smartest person in history?"
-- "what have scientists discussed about climate change?"
-- "summarize news from last week"
-- "what did Elon Musk say recently?"
-- "who is the best programmer in the world?"
-
-User query: "{message_content}"
-
-Respond with ONLY one word: "DISCORD" or "GENERAL"
-"""
     
     try:
         # Use a quick, cheap API call for classification
-        completion = client.chat.completions.create(
-            model=GROK_TEXT_MODEL,
-            messages=[{"role": "user", "content": classification_prompt}],
-            max_tokens=10,  # We only need one word
-            temperature=0.3  # Lower temperature for more consistent classification
+        completion = await grok_complete(
+            {
+                "model": GROK_TEXT_MODEL,
+                "messages": assemble_messages(CLASSIFICATION_SYSTEM_PREFIX, f'User query: "{message_content}"'),
+                "max_tokens": 10,  # We only need one word
+                "temperature": 0.3  # Lower temperature for more consistent classification
+            },
+            priority=PRIORITY_INTERACTIVE,
+            guild_id=guild_id,
+            request_type='classification'
         )
         
         response = completion.choices[0].message.content.strip().upper()
@@ -1152,6 +1448,293 @@ Respond with ONLY one word: "DISCORD" or "GENERAL"
         logger.error(f'Error in Grok classification: {e}')
         return False
 
+async def send_history_analysis(message, title, answer, usage_text):
+    """Send a natural language history analysis as one embed message, paged behind buttons if needed"""
+    def build_embed(description, page, pages):
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=discord.Color.purple(),
+            timestamp=message.created_at
+        )
+        embed.set_author(
+            name="Grok Analysis",
+            icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
+        )
+        footer_text = f"Requested by {message.author.display_name}"
+        if usage_text:
+            footer_text += f" • {usage_text}"
+        if pages > 1:
+            footer_text = f"Page {page}/{pages} • {footer_text}"
+        embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
+        return embed
+
+    await send_paginated(message.reply, answer, build_embed)
+
+async def run_history_analysis(message, waiters, query, max_scan, time_limit, keywords, target_user):
+    """
+    Scan channel history for a natural-language history question and analyze it with Grok, for
+    every request in waiters (a ScanWaiters). Returns a HistoryAnalysis, or None if no messages matched.
+    """
+    keyword_lower = keywords.lower() if keywords is not None else None
+
+    def render_progress(scanned, found, pct, rate, eta):
+        status = f"{pct}% - scanned {scanned:,}, found {found:,} • {rate:,.0f} msg/s"
+        if eta:
+            status += f" • ~{eta} left"
+        return f"🔍 Analyzing... ({status})"
+
+    progress = ScanProgress(waiters.status_messages, render_progress, total=max_scan, interval=PROGRESS_UPDATE_INTERVAL)
+
+    def matches(msg):
+        if target_user and msg.author != target_user:
+            return False
+        if not target_user and msg.author.bot:
+            return False
+        if keyword_lower is not None and keyword_lower not in msg.content.lower():
+            return False
+        # Skip empty messages (attachments / embeds only)
+        return bool(msg.content.strip())
+
+    if target_user:
+        title = f"Analyzing user {target_user.name}'s messages:"
+    else:
+        title = "Analyzing channel messages:"
+
+    # Stream history through filter -> compact record -> compact encoding, keeping only the newest
+    # matches that will be analyzed (near-duplicates folded, low-information messages dropped unless
+    # keywords were given); IDs, links and mentions are resolved locally from the number map and legend
+    scan = HistoryScan(
+        message.channel,
+        limit=max_scan,
+        matches=matches,
+        encoder=HistoryEncoder(TIMEZONE, title, include_authors=not target_user, max_messages=analysis_window(),
+                               compactor=history_compaction.compactor(drop_low_information=keyword_lower is None)),
+        skip_ids=waiters.command_ids,
+        progress=progress,
+        archive=message_archive if MESSAGE_ARCHIVE_ENABLED else None
+    )
+    encoded = await scan.run()
+    await progress.close()
+
+    if encoded is None:
+        return None
+
+    messages_found = scan.found
+    logger.info(f'Found {messages_found} messages for analysis')
+
+    message_number_map = encoded.number_map
+    messages_to_analyze = len(message_number_map)
+
+    # Too many matches for one prompt: summarize shards concurrently, then answer from the notes
+    history_text, map_completions, messages_covered = await map_history_if_needed(
+        encoded, query, guild_id=message.guild.id if message.guild else None, request_type='history_analysis'
+    )
+    if map_completions:
+        showing = f"(Analyzed {messages_covered} of {messages_found} messages found, read in parts)"
+    else:
+        showing = f"(Showing {messages_to_analyze} of {messages_found} messages found)"
+
+    # Identity and JSON contract first, then the messages, then the query (prompt cache friendly)
+    prompt_messages = assemble_messages(
+        history_analysis_system_prefix(),
+        f"{showing}\n\nUser query: {query}",
+        history=history_text
+    )
+
+    # Query Grok
+    async with message.channel.typing():
+        request_params = {
+            "model": GROK_TEXT_MODEL,
+            "messages": prompt_messages
+        }
+        if ENABLE_WEB_SEARCH:
+            request_params["extra_body"] = {
+                "search_parameters": {
+                    "mode": "auto",
+                    "max_search_results": MAX_SEARCH_RESULTS
+                }
+            }
+        completion = await grok_complete(
+            request_params,
+            priority=PRIORITY_BULK,
+            guild_id=message.guild.id if message.guild else None,
+            request_type='history_analysis'
+        )
+
+        response = completion.choices[0].message.content
+
+        # The model replies with the answer text only; fall back to the "answer" field if it
+        # still wraps the answer in JSON
+        answer = response.strip()
+        if answer.startswith('{'):
+            try:
+                answer = json.loads(answer).get("answer", answer)
+            except Exception:
+                pass
+
+        # Get bot mention ('gronk' in the answer refers to the bot itself)
+        bot_mention = message.guild.me.mention if message.guild else None
+
+        # Resolve citations to message links (from the number map) and author handles, bot name,
+        # author IDs and usernames to mentions in one pass
+        postprocessor = ResponsePostProcessor(
+            message_number_map,
+            link_format="[#{num}](<{link}>)",
+            authors=encoded.authors,
+            bot_mention=bot_mention,
+            name_lookup=member_index.lookup(message.guild) if message.guild else None
+        )
+        answer = postprocessor.process(answer)
+
+    usage_text = text_usage_text(*map_completions, completion)
+
+    # Only show the answer (with inline citations), no separate sources or confidence
+    title = "🔍 Discord History Analysis"
+    if target_user:
+        title += f": {target_user.display_name}"
+
+    return HistoryAnalysis(
+        title=title,
+        text=answer,
+        usage_text=usage_text,
+        channel_id=message.channel.id,
+        newest_message_id=message_number_map[messages_to_analyze].id,
+        messages_found=messages_found,
+        messages_analyzed=messages_covered
+    )
+
+async def answer_with_analytics(message, query, question, target_user):
+    """
+    Answer a counting / ranking question with exact numbers from the message archive, with Grok
+    only narrating them. Returns False (nothing sent) if the archive has too little in scope.
+    """
+    user = target_user or (message.author if question.about_self else None)
+    guild_id = message.guild.id if message.guild else None
+    result = None
+    if (TERM_SKETCHES_ENABLED and question.kind in ('rank_term', 'count_term') and not question.window and not user
+            and not question.ascending):
+        # All-time "who talks about X the most": constant time from the term sketches
+        result = term_sketches.answer(question, guild_id, message.channel.id)
+        if result and result.messages_in_scope < ANALYTICS_MIN_MESSAGES:
+            result = None
+    if result is None:
+        result = await activity_analytics.answer(question, guild_id, message.channel.id, user_id=user.id if user else None)
+    if result is None or result.messages_in_scope < ANALYTICS_MIN_MESSAGES:
+        return False
+    logger.info(f'Answered {question.kind} question from {result.messages_in_scope:,} archived messages '
+                f'in {result.elapsed_ms:.1f}ms')
+
+    postprocessor = ResponsePostProcessor(
+        authors=result.authors,
+        bot_mention=message.guild.me.mention if message.guild else None,
+        name_lookup=member_index.lookup(message.guild) if message.guild else None
+    )
+    timing = f"📊 {result.elapsed_ms:.0f} ms over {result.messages_in_scope:,} messages"
+    try:
+        async with message.channel.typing():
+            completion = await grok_complete(
+                {
+                    "model": GROK_TEXT_MODEL,
+                    "messages": assemble_messages(analytics_system_prefix(), f"User query: {query}", history=result.facts)
+                },
+                priority=PRIORITY_INTERACTIVE,
+                guild_id=message.guild.id if message.guild else None,
+                request_type='analytics_narration'
+            )
+        answer = postprocessor.process(completion.choices[0].message.content.strip())
+        usage_text = " • ".join(filter(None, [timing, text_usage_text(completion)]))
+    except Exception as e:
+        # The numbers stand on their own
+        logger.warning(f'Analytics narration failed, sending the numbers as is: {e}')
+        answer = postprocessor.process(result.facts)
+        usage_text = timing
+
+    await send_history_analysis(message, "📊 Channel Activity", answer, usage_text)
+    return True
+
+async def run_digest_summary(message, query, window_seconds, skip_ids=()):
+    """
+    Answer a "summarize the last <period>" question from the channel's digests plus the messages
+    posted since the last digested one. Returns None if the digests don't reach back far enough or
+    the undigested tail is too long, so the caller falls back to scanning.
+    """
+    start = int(datetime.now(timezone.utc).timestamp()) - window_seconds
+    covered = digest_store.cover(message.channel.id, start)
+    if covered is None:
+        return None
+    digests, state = covered
+    logger.info(f'Summarizing {window_seconds // 3600}h of channel {message.channel.id} from {len(digests)} digests')
+
+    # Messages newer than the last digested one (or the last digested hour if it had none)
+    after = discord.Object(id=state.last_message_id or discord.utils.time_snowflake(
+        datetime.fromtimestamp(state.covered_until, tz=timezone.utc)
+    ))
+    scan = HistoryScan(
+        message.channel,
+        limit=MAX_MESSAGES_ANALYZED * 2,
+        matches=lambda msg: not msg.author.bot and bool(msg.content.strip()),
+        # Every message since the last digest is needed, so the window is not aligned (trimmed)
+        encoder=HistoryEncoder(TIMEZONE, "Messages since the last digest:", max_messages=MAX_MESSAGES_ANALYZED,
+                               align=None),
+        skip_ids=skip_ids,
+        stop_after=MAX_MESSAGES_ANALYZED + 1,
+        after=after,
+        archive=message_archive if MESSAGE_ARCHIVE_ENABLED else None
+    )
+    encoded = await scan.run()
+    if scan.found > MAX_MESSAGES_ANALYZED or scan.scanned >= MAX_MESSAGES_ANALYZED * 2:
+        logger.info('Digests are too far behind the channel, scanning instead')
+        return None
+    if not digests and encoded is None:
+        return None
+
+    history_parts = [digest_history_block(digests, TIMEZONE) if digests else "Digests: (none in this period)", DIGEST_NOTE]
+    history_parts.append(encoded.text if encoded else "Messages since the last digest: (none)")
+    message_number_map = encoded.number_map if encoded else {}
+    digested = sum(digest.message_count for digest in digests)
+
+    prompt_messages = assemble_messages(
+        history_analysis_system_prefix(),
+        f"(Summarized from {len(digests)} digests of {digested} messages plus {len(message_number_map)} newer messages)"
+        f"\n\nUser query: {query}",
+        history="\n\n".join(history_parts)
+    )
+
+    async with message.channel.typing():
+        completion = await grok_complete(
+            {"model": GROK_TEXT_MODEL, "messages": prompt_messages},
+            priority=PRIORITY_BULK,
+            guild_id=message.guild.id if message.guild else None,
+            request_type='digest_summary'
+        )
+
+        answer = completion.choices[0].message.content.strip()
+        if answer.startswith('{'):
+            try:
+                answer = json.loads(answer).get("answer", answer)
+            except Exception:
+                pass
+
+        postprocessor = ResponsePostProcessor(
+            message_number_map,
+            link_format="[#{num}](<{link}>)",
+            authors=encoded.authors if encoded else None,
+            bot_mention=message.guild.me.mention if message.guild else None,
+            name_lookup=member_index.lookup(message.guild) if message.guild else None
+        )
+        answer = postprocessor.process(answer)
+
+    return HistoryAnalysis(
+        title="🔍 Discord History Summary",
+        text=answer,
+        usage_text=text_usage_text(completion),
+        channel_id=message.channel.id,
+        newest_message_id=message_number_map[len(message_number_map)].id if message_number_map else state.last_message_id,
+        messages_found=digested + len(message_number_map),
+        messages_analyzed=len(message_number_map)
+    )
+
 async def perform_discord_history_search(message, query, time_limit=None, keywords=None, target_user=None):
     """
     Search Discord history and analyze with Grok
@@ -1176,9 +1759,29 @@ async def perform_discord_history_search(message, query, time_limit=None, keywor
         # For general searches, only scan what we can send to Grok
         max_scan = MAX_MESSAGES_ANALYZED
         time_limit = max_scan
+
+    # Counting / ranking questions get exact numbers from the message archive instead of a scan
+    if MESSAGE_ARCHIVE_ENABLED:
+        question = parse_analytics_question(query)
+        if question and await answer_with_analytics(message, query, question, target_user):
+            return
+
+    # "Summarize the last week" questions are answered from the channel's rolling digests when they cover it
+    summary_window = parse_summary_window(query) if DIGESTS_ENABLED and not target_user else None
+
+    # Serve a recent identical analysis if the channel hasn't moved on since
+    cache_key = make_history_cache_key(
+        'analysis', message.channel.id, target_user.id if target_user else None, query, keywords, time_limit
+    )
+    cached = history_cache.get(cache_key)
+    if cached:
+        await send_history_analysis(message, cached.title, cached.text, HISTORY_CACHE_USAGE_TEXT)
+        return
     
     # Send searching message
-    if target_user:
+    if summary_window:
+        searching_msg = await message.reply("🔍 Summarizing channel history from digests...")
+    elif target_user:
         if use_keyword_filter:
             searching_msg = await message.reply(f"🔍 Analyzing {target_user.mention}'s messages about `{keywords}` (scanning up to {time_limit:,} messages)...")
         else:
@@ -1189,380 +1792,37 @@ async def perform_discord_history_search(message, query, time_limit=None, keywor
         else:
             searching_msg = await message.reply(f"🔍 Analyzing channel message history (last {max_scan:,} messages)...")
     
+    # Identical questions already running share one scan and one Grok call; each gets the progress
+    # edits and the scan skips every one of their questions
+    waiters = history_waiters.setdefault(cache_key, ScanWaiters())
+    waiters.join(message, searching_msg)
     try:
-        # Collect messages
-        collected_messages = []
-        messages_scanned = 0
-        last_update = 0
-        
-        async for msg in message.channel.history(limit=max_scan):
-            # Skip the command message
-            if msg.id == message.id:
-                logger.debug(f"Skipping command message id={msg.id}")
-                continue
-
-            messages_scanned += 1
-
-            # Apply filters, but log why messages are skipped
-            if target_user and msg.author != target_user:
-                logger.debug(f"Skipping message id={msg.id} (author {msg.author} != target_user {target_user})")
-                continue
-
-            if not target_user and msg.author.bot:
-                logger.debug(f"Skipping message id={msg.id} (author is bot)")
-                continue
-
-            if use_keyword_filter and keywords.lower() not in msg.content.lower():
-                logger.debug(f"Skipping message id={msg.id} (keyword '{keywords}' not in content)")
-                continue
+        async def analyze():
+            if summary_window:
+                analysis = await run_digest_summary(message, query, summary_window, waiters.command_ids)
+                if analysis:
+                    return analysis
+            return await run_history_analysis(message, waiters, query, max_scan, time_limit, keywords, target_user)
 
-            # Only skip empty messages (no content) for non-targeted searches
-            if not msg.content.strip():
-                logger.debug(f"Skipping message id={msg.id} (empty content)")
-                continue
-
-            collected_messages.append(msg)
+        try:
+            analysis = await history_flights.do(cache_key, analyze)
+        finally:
+            if waiters.leave(searching_msg) and history_waiters.get(cache_key) is waiters:
+                del history_waiters[cache_key]
 
-            # Update progress every 2000 messages
-            if messages_scanned - last_update >= 2000:
-                last_update = messages_scanned
-                try:
-                    progress_pct = int((messages_scanned / time_limit) * 100)
-                    await searching_msg.edit(content=f"🔍 Analyzing... ({progress_pct}% - scanned {messages_scanned:,}, found {len(collected_messages):,})")
-                except Exception as e:
-                    logger.debug(f"Progress update failed: {e}")
-        
-        if not collected_messages:
+        if not analysis:
             await searching_msg.edit(content=f"❌ No messages found matching your criteria.")
             return
-        
-        logger.info(f'Found {len(collected_messages)} messages for analysis')
-        
-        # Build context for Grok (configurable limit via MAX_MESSAGES_ANALYZED)
-        messages_to_analyze = min(len(collected_messages), MAX_MESSAGES_ANALYZED)
-        messages_for_context = collected_messages[:messages_to_analyze]
-        
-        # Explicitly tell Grok that @gronk and 'gronk' refer to the AI itself, and place this at the top of the prompt
-        context_parts = [
-            (
-                "SYSTEM: You are 'gronk', the AI assistant and Discord bot. 'gronk' is a Discord bot interface for interacting with Grok the AI. "
-                "Any mention of 'gronk' or '@gronk' in the following messages refers to you, the AI, and NEVER the user. "
-                "Never refer to the user as 'gronk' or '@gronk'. Always refer to yourself as 'gronk' or '@gronk' when those names are mentioned. "
-                "You are the AI behind the 'gronk' Discord bot, and all responses from 'gronk' are from the AI assistant. "
-                "When referring to users, use either their mention or their user ID, but not both in the same phrase. Avoid redundant references like '@username (user ID @123)'. "
-                "NEVER output patterns like '@useridnumber (which appears to be @gronk)', '@useridnumber (which is @gronk)', or any similar construction. If a user is the bot, always use only '@gronk' and never the user ID or both together.\n"
-            ),
-            f"User query: {query}\n"
-        ]
-
-
-        if target_user:
-            context_parts.append(f"Analyzing user {target_user.name}'s messages (showing {messages_to_analyze} of {len(collected_messages)} found, oldest to newest):\n")
-        else:
-            context_parts.append(f"Analyzing channel messages (showing {messages_to_analyze} of {len(collected_messages)} found, oldest to newest):\n")
-        
-        message_number_map = {}
-        for i, msg in enumerate(reversed(messages_for_context), 1):
-            timestamp_local = msg.created_at.astimezone(TIMEZONE)
-            tz_abbr = timestamp_local.strftime("%Z")
-            timestamp_str = timestamp_local.strftime(f"%Y-%m-%d %H:%M {tz_abbr}")
-            author_name = msg.author.name if not target_user else ""
-            content = msg.content[:300] + "..." if len(msg.content) > 300 else msg.content
-            message_number_map[i] = msg
-            # Provide real metadata for each message in the JSON block only, not in the visible context
-            # Visible context: just number, timestamp, author, and content
-            if target_user:
-                context_parts.append(f"[{i}] [{timestamp_str}] {content}")
-            else:
-                context_parts.append(f"[{i}] [{timestamp_str}] {author_name}: {content}")
-            # Metadata for JSON block (unchanged, used later)
-            # meta = { ... }
-
-
-        # Add message metadata mapping for Grok to use in citations
-        context_parts.append("\n\nMessage Metadata Mapping:")
-        for i, msg in enumerate(reversed(messages_for_context), 1):
-            excerpt = msg.content[:80].replace('\\', ' ').replace('"', "'")
-            context_parts.append(f"{i}: {{'message_id': '{msg.id}', 'channel_id': '{msg.channel.id}', 'user_id': '{msg.author.id}', 'excerpt': '{excerpt}', 'link': 'https://discord.com/channels/{msg.guild.id}/{msg.channel.id}/{msg.id}'}}")
-
-        # (Instruction moved to top of prompt for clarity)
-
-        # INSTRUCT GROK TO REPLY ONLY WITH JSON and use only [#N] for citations, using the above mapping for sources
-        context_parts.append(f"\n\nBased on these messages, reply ONLY with a single JSON object in the following format. Do NOT include any natural language or commentary before or after the JSON. Only cite the most meaningful and relevant messages (typically 3-6), and do NOT cite every message. For each citation in your answer, use the metadata from the mapping above for the corresponding number in the 'sources' field.\n")
-        context_parts.append("""
-{
-    \"answer\": \"<your answer, with inline citations like [#N] ONLY. Do NOT include channel names, emojis, or any extra formatting in the citations. Use only [#N] for each citation.>\",
-    \"sources\": {
-        \"N\": {
-            \"message_id\": \"<discord message id from mapping>\",
-            \"channel_id\": \"<discord channel id from mapping>\",
-            \"user_id\": \"<discord user id from mapping>\",
-            \"excerpt\": \"<short excerpt from the message>\",
-            \"link\": \"<discord message link from mapping>\"
-        },
-        ...
-    },
-    \"confidence\": <float between 0 and 1>
-}
-""")
-        context_parts.append("\nIMPORTANT: For every citation, use ONLY the format [#N] with no channel name, emoji, or extra formatting. Example: [#1], [#2], etc.\n")
-        full_prompt = "\n".join(context_parts)
-        
-        # Query Grok
-        async with message.channel.typing():
-            request_params = {
-                "model": GROK_TEXT_MODEL,
-                "messages": [{"role": "user", "content": full_prompt}]
-            }
-            if ENABLE_WEB_SEARCH:
-                request_params["extra_body"] = {
-                    "search_parameters": {
-                        "mode": "auto",
-                        "max_search_results": MAX_SEARCH_RESULTS
-                    }
-                }
-            completion = client.chat.completions.create(**request_params)
-
-            response = completion.choices[0].message.content
-
-
 
+        # Remember the result so a repeat of this question in a quiet channel is instant
+        history_cache.put(cache_key, analysis)
 
-            # --- Begin JSON extraction and parsing ---
-            import json as _json
-            import re as _re
-            json_match = _re.search(r'\{[\s\S]*\}$', response)
-            if json_match:
-                json_str = json_match.group(0)
-                try:
-                    data = _json.loads(json_str)
-                    answer = data.get("answer", "")
-                    sources = data.get("sources", {})
-                except Exception as e:
-                    answer = response
-                    sources = {}
-            else:
-                answer = response
-                sources = {}
-
-            # Only use the answer field for the embed description
-            # Replace [#N] in the answer with clickable links using the sources map (if available)
-            def replace_citation_with_link(match):
-                num = match.group(1)
-                if sources and num in sources:
-                    meta = sources[num]
-                    link = meta.get("link")
-                    if link and link.startswith("https://discord.com/channels/"):
-                        return f"[#{num}](<{link}>)"
-                return f"[#{num}]"
-
-            answer = re.sub(r'\[#(\d+)\]', replace_citation_with_link, answer)
-
-
-            # Add spacing between consecutive citations (e.g., [#1][#2] -> [#1] [#2])
-            answer = re.sub(r'(\]\[)', '] [', answer)
-
-            # Replace user IDs or usernames in the answer with Discord mention links if possible
-            # Build a user_id to mention mapping from sources
-            user_id_to_mention = {}
-            for src in sources.values():
-                uid = src.get("user_id")
-                if uid:
-                    user_id_to_mention[uid] = f'<@{uid}>'
-
-            # Optionally, build a username to mention mapping if usernames are present in excerpts
-            # (This is less reliable, but can help if usernames are referenced directly)
-            username_to_mention = {}
-            for src in sources.values():
-                excerpt = src.get("excerpt", "")
-                uid = src.get("user_id")
-                if uid and message.guild:
-                    member = message.guild.get_member(int(uid))
-                    if member:
-                        username_to_mention[member.name] = f'<@{uid}>'
-                        username_to_mention[member.display_name] = f'<@{uid}>'
-
-
-            # Get bot user ID and mention
-            bot_mention = None
-            bot_user_id = None
-            if message.guild:
-                bot_member = message.guild.get_member(message.guild.me.id)
-                if bot_member:
-                    bot_mention = bot_member.mention
-                    bot_user_id = str(bot_member.id)
-
-            # Replace all occurrences of '@gronk' (case-insensitive, not already a mention) with the bot mention
-            if bot_mention:
-                answer = re.sub(r'(?<!<@)@?gronk(?!>)', bot_mention, answer, flags=re.IGNORECASE)
-
-            # Replace user IDs with mentions, but skip the bot's user ID (already handled by @gronk logic)
-            for uid, mention in user_id_to_mention.items():
-                if bot_user_id and uid == bot_user_id:
-                    continue  # skip bot user id
-                answer = answer.replace(uid, mention)
-
-            # Replace any username with a mention (avoid double-mentioning if already replaced)
-            for uname, mention in username_to_mention.items():
-                # Only replace if not already a mention and not 'gronk'
-                if uname.lower() != 'gronk':
-                    answer = re.sub(rf'(?<!<@){re.escape(uname)}(?!>)', mention, answer)
-
-            # Remove redundant patterns: @gronk (user ID @botid) or @gronk (user ID botid)
-            if bot_mention and bot_user_id:
-                answer = re.sub(rf'{re.escape(bot_mention)} ?\(user ID ?<?@!?{bot_user_id}>?\)', bot_mention, answer)
-                answer = re.sub(rf'{re.escape(bot_mention)} ?\(user ID ?{bot_user_id}\)', bot_mention, answer)
-
-
-        # Convert any remaining Discord usernames to mentions (fallback)
-        answer = convert_usernames_to_mentions(answer, message.guild)
-
-        # Remove redundant user mention and user ID pairs, e.g., '@username (user ID @123)' or '@123 (which is @username)'
-        # Remove patterns like: @username (user ID @username) or @userID (which is @username)
-        answer = re.sub(r'(\<@!?\d+\>) ?\(user ID \1\)', r'\1', answer)
-        answer = re.sub(r'(\<@!?\d+\>) ?\(which is \1\)', r'\1', answer)
-        # Remove patterns like: @username (user ID @1234567890)
-        answer = re.sub(r'(\<@!?\d+\>) ?\(user ID @\d+\)', r'\1', answer)
-        # Remove patterns like: @1234567890 (which is @username)
-        answer = re.sub(r'(@\d+) ?\(which is \<@!?\d+\>\)', r'\1', answer)
-
-        # Calculate cost
-        request_cost = 0
-        usage_text = ""
-        if hasattr(completion, 'usage') and completion.usage:
-            if hasattr(completion.usage, 'prompt_tokens_details') and completion.usage.prompt_tokens_details:
-                cached = completion.usage.prompt_tokens_details.cached_tokens
-                uncached = completion.usage.prompt_tokens - cached
-                input_cost = (uncached / 1_000_000) * GROK_TEXT_INPUT_COST + (cached / 1_000_000) * GROK_TEXT_CACHED_COST
-            else:
-                input_cost = (completion.usage.prompt_tokens / 1_000_000) * GROK_TEXT_INPUT_COST
-            output_cost = (completion.usage.completion_tokens / 1_000_000) * GROK_TEXT_OUTPUT_COST
-            request_cost = input_cost + output_cost
-            usage_text = f"💵 ${request_cost:.6f} • {completion.usage.prompt_tokens} in / {completion.usage.completion_tokens} out"
-
-            await searching_msg.delete()
+        await searching_msg.delete()
 
-            # Only show the answer (with inline citations), no separate sources or confidence
-            title = "🔍 Discord History Analysis"
-            if target_user:
-                title += f": {target_user.display_name}"
-            if len(answer) <= 4096:
+        await send_history_analysis(message, analysis.title, analysis.text, analysis.usage_text)
 
+        logger.info('Discord history analysis completed')
 
-                embed = discord.Embed(
-                    title=title,
-                    description=answer,
-                    color=discord.Color.purple(),
-                    timestamp=message.created_at
-                )
-                embed.set_author(
-                    name="Grok Analysis",
-                    icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                )
-                analyzed_text = f"{messages_to_analyze} messages analyzed"
-                if len(collected_messages) > messages_to_analyze:
-                    analyzed_text += f" ({len(collected_messages)} found)"
-                if messages_for_context:
-                    oldest_msg = messages_for_context[-1]
-                    oldest_date = oldest_msg.created_at.astimezone(TIMEZONE)
-                    analyzed_text += f" • Oldest: {oldest_date.strftime('%Y-%m-%d %H:%M %Z')}"
-                # Removed the 'Analyzed' field for a cleaner embed
-                footer_text = f"Requested by {message.author.display_name}"
-                if usage_text:
-                    footer_text += f" • {usage_text}"
-                embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
-                await message.reply(embed=embed)
-            else:
-                # Split into multiple embeds
-                chunks = []
-                current_chunk = ""
-                
-                # Split by paragraphs to avoid breaking markdown links
-                paragraphs = response.split('\n\n')
-                
-                for para in paragraphs:
-                    # Check if adding this paragraph would exceed limit
-                    if len(current_chunk) + len(para) + 2 > 4096:
-                        if current_chunk:
-                            chunks.append(current_chunk.rstrip())
-                            current_chunk = ""
-                        
-                        # If paragraph itself is too long, split it
-                        if len(para) > 4096:
-                            # Split by sentences
-                            sentences = para.split('. ')
-                            for sentence in sentences:
-                                sentence_with_period = sentence + '. ' if not sentence.endswith('.') else sentence + ' '
-                                
-                                if len(current_chunk) + len(sentence_with_period) > 4096:
-                                    if current_chunk:
-                                        chunks.append(current_chunk.rstrip())
-                                        current_chunk = ""
-                                    
-                                    # If single sentence is too long, force split
-                                    if len(sentence_with_period) > 4096:
-                                        for i in range(0, len(sentence_with_period), 4096):
-                                            chunks.append(sentence_with_period[i:i+4096])
-                                    else:
-                                        current_chunk = sentence_with_period
-                                else:
-                                    current_chunk += sentence_with_period
-                        else:
-                            current_chunk = para + '\n\n'
-                    else:
-                        current_chunk += para + '\n\n'
-                
-                if current_chunk.strip():
-                    chunks.append(current_chunk.rstrip())
-                
-                # Validate all chunks are within limit
-                validated_chunks = []
-                for chunk in chunks:
-                    if len(chunk) > 4096:
-                        logger.warning(f'Chunk exceeded 4096 chars ({len(chunk)}), force splitting...')
-                        # Force split at 4096 boundaries
-                        for i in range(0, len(chunk), 4096):
-                            validated_chunks.append(chunk[i:i+4096])
-                    else:
-                        validated_chunks.append(chunk)
-                
-                chunks = validated_chunks
-                logger.info(f'Split response into {len(chunks)} embeds (validated)')
-                
-                for i, chunk in enumerate(chunks):
-                    embed = discord.Embed(
-                        title=f"{title} (Part {i+1}/{len(chunks)})" if i > 0 else title,
-                        description=chunk,
-                        color=discord.Color.purple(),
-                        timestamp=message.created_at
-                    )
-                    embed.set_author(
-                        name="Grok Analysis",
-                        icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                    )
-                    
-                    # Add fields and footer only to last embed
-                    if i == len(chunks) - 1:
-                        analyzed_text = f"{messages_to_analyze} messages analyzed"
-                        if len(collected_messages) > messages_to_analyze:
-                            analyzed_text += f" ({len(collected_messages)} found)"
-                        
-                        # Add oldest message date
-                        if messages_for_context:
-                            oldest_msg = messages_for_context[-1]  # Last in list (reversed for chronological)
-                            oldest_date = oldest_msg.created_at.astimezone(TIMEZONE)
-                            analyzed_text += f"\nOldest: {oldest_date.strftime('%Y-%m-%d %H:%M %Z')}"
-                        
-                        # Removed the 'Analyzed' field for a cleaner embed
-                        footer_text = f"Requested by {message.author.display_name}"
-                        if usage_text:
-                            footer_text += f" • {usage_text}"
-                        embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
-                    
-                    await message.reply(embed=embed)
-            
-            logger.info('Discord history analysis completed')
-            
     except Exception as e:
         logger.error(f'Error in Discord history search: {e}', exc_info=True)
         try:
@@ -1576,6 +1836,15 @@ async def on_message(message):
     if message.author == bot.user:
         return
 
+    if MESSAGE_ARCHIVE_ENABLED:
+        message_archive.add(message)
+
+    # Track channel activity so cached history analyses know when they're stale
+    if not message.author.bot:
+        channel_activity.record(message.channel.id, message.id)
+        if DIGESTS_ENABLED:
+            digest_builder.mark_active(message.channel.id, message.created_at.timestamp())
+
     # Initialize variables to avoid NameError
     image_urls = []
     unsupported_images = []
@@ -1606,6 +1875,7 @@ async def on_message(message):
             pass
 
     if is_bot_mentioned or is_replying_to_bot:
+        archive_backfill.note_interactive()
         if is_replying_to_bot:
             logger.info(f'Bot reply detected from {message.author} in #{message.channel}')
         else:
@@ -1617,10 +1887,29 @@ async def on_message(message):
         prompt = prompt.strip()
         logger.info(f'Normalized prompt for intent detection: "{prompt}"')
 
+        # Replies to a !search result are answered from the messages that search analyzed
+        if is_replying_to_bot and prompt:
+            followup = followup_store.get(replied_msg.id)
+            if followup:
+                logger.info(f'Search follow-up detected for result message {replied_msg.id}')
+                try:
+                    await answer_search_followup(message, prompt, followup)
+                except Exception as e:
+                    logger.error(f'Error answering search follow-up: {e}', exc_info=True)
+                    if isinstance(e, CircuitOpenError):
+                        await message.reply(f"⏳ {e}. Please try again shortly.")
+                    else:
+                        await message.reply(f"❌ Error answering follow-up: {str(e)}")
+                return
+
         # Check if this is a Discord history analysis query (if feature enabled)
         if ENABLE_NL_HISTORY_SEARCH:
             target_user = message.mentions[0] if message.mentions and message.mentions[0] != bot.user else None
-            should_search, time_limit, keywords = await should_search_discord_history(prompt, target_user is not None)
+            should_search, time_limit, keywords = await should_search_discord_history(
+                prompt,
+                target_user is not None,
+                guild_id=message.guild.id if message.guild else None
+            )
             logger.info(f'should_search_discord_history result: should_search={should_search}, time_limit={time_limit}, keywords={keywords}')
             if should_search:
                 logger.info(f'Discord history search triggered for query: {prompt}')
@@ -1633,11 +1922,6 @@ async def on_message(message):
                 )
                 return  # Don't process as normal query
         
-        # Check if this is a follow-up to a previous conversation
-        is_search_followup = False
-        conversation_context = []
-        
-
         if is_bot_mentioned or is_replying_to_bot:
             if is_replying_to_bot:
                 logger.info(f'Bot reply detected from {message.author} in #{message.channel}')
@@ -1868,34 +2152,8 @@ async def on_message(message):
         try:
             usage_text = ""
             async with message.channel.typing():
-                # Upload document files to Grok if present
-                grok_file_ids = []
-                if document_attachments:
-                    async with aiohttp.ClientSession() as session:
-                        for attachment in document_attachments:
-                            with tempfile.NamedTemporaryFile(delete=True) as tmp:
-                                await attachment.save(tmp.name)
-                                tmp.flush()
-                                files_url = "https://api.x.ai/v1/files"
-                                headers = {"Authorization": f"Bearer {XAI_KEY}"}
-                                with open(tmp.name, "rb") as f:
-                                    data = aiohttp.FormData()
-                                    data.add_field('file', f, filename=attachment.filename)
-                                    async with session.post(files_url, headers=headers, data=data) as resp:
-                                        if resp.status == 200:
-                                            result = await resp.json()
-                                            file_id = result.get('id') or result.get('file_id')
-                                            if file_id:
-                                                grok_file_ids.append(file_id)
-                                                logger.info(f'Uploaded {attachment.filename} to Grok, file_id={file_id}')
-                                            else:
-                                                logger.warning(f'No file_id returned for {attachment.filename}')
-                                        else:
-                                            logger.error(f'Failed to upload {attachment.filename} to Grok: {resp.status}')
-
                 # Determine model based on whether we have images
                 model = GROK_VISION_MODEL if image_urls else GROK_TEXT_MODEL
-                logger.info(f'Using model: {model} (images: {len(image_urls)}, docs: {len(grok_file_ids)})')
 
                 # Always require strict JSON output from Grok
                 json_instructions = (
@@ -1912,64 +2170,160 @@ async def on_message(message):
                     + json_instructions
                 )
 
-                if image_urls:
-                    content = [{"type": "text", "text": prompt or "What's in this image?"}]
-                    for url in image_urls:
-                        content.append({"type": "image_url", "image_url": {"url": url}})
-                    logger.info('Sending request to Grok with images...')
-                    completion = client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": content}
-                        ]
-                    )
-                elif grok_file_ids:
-                    messages_to_send = []
-                    messages_to_send.append({"role": "system", "content": system_prompt})
-                    if conversation_messages:
-                        messages_to_send.extend(conversation_messages)
-                    messages_to_send.append({"role": "user", "content": prompt})
-                    logger.info(f'Sending request to Grok with {len(messages_to_send)} messages and {len(grok_file_ids)} files')
-                    request_params = {
-                        "model": model,
-                        "messages": messages_to_send,
-                        "file_ids": grok_file_ids
-                    }
-                    if ENABLE_WEB_SEARCH:
-                        request_params["extra_body"] = {
-                            "search_parameters": {
-                                "mode": "auto",
-                                "max_search_results": MAX_SEARCH_RESULTS
-                            }
-                        }
-                    completion = client.chat.completions.create(**request_params)
+                # Serve repeated questions from the response cache
+                # (bypassed when the question needs live web search results)
+                cache_key = None
+                cached_response = None
+                if RESPONSE_CACHE_ENABLED:
+                    if ENABLE_WEB_SEARCH and is_time_sensitive(prompt):
+                        response_cache.counters['bypassed'] += 1
+                        logger.info('Response cache bypassed for time-sensitive query')
+                    else:
+                        file_hashes = await hash_documents(document_attachments)
+                        if file_hashes is None:
+                            response_cache.counters['bypassed'] += 1
+                            logger.info('Response cache bypassed for large documents')
+                        else:
+                            image_hashes = await hash_image_sources(message, image_urls)
+                            cache_key = make_response_cache_key(
+                                model,
+                                prompt,
+                                image_hashes=image_hashes,
+                                file_hashes=file_hashes,
+                                context=[system_prompt, conversation_messages]
+                            )
+                            cached_response = response_cache.get(cache_key)
+
+                completion = None
+                if cached_response is not None:
+                    response = cached_response
+                    logger.info(f'Response cache hit ({len(response)} characters)')
                 else:
-                    messages_to_send = []
-                    messages_to_send.append({"role": "system", "content": system_prompt})
-                    if conversation_messages:
-                        messages_to_send.extend(conversation_messages)
-                    messages_to_send.append({"role": "user", "content": prompt})
-                    logger.info(f'Sending text-only request to Grok with {len(messages_to_send)} messages (history: {len(conversation_messages)})')
-                    request_params = {
-                        "model": model,
-                        "messages": messages_to_send
-                    }
-                    if ENABLE_WEB_SEARCH:
-                        request_params["extra_body"] = {
-                            "search_parameters": {
-                                "mode": "auto",  # Let Grok decide when to search
-                                "max_search_results": MAX_SEARCH_RESULTS
+                    # Recall relevant earlier exchanges from the memory bank (not the one being replied to),
+                    # only on a cache miss. An answer shaped by recalled exchanges is private to the asker:
+                    # it is neither shared with identical requests in flight nor cached
+                    if MEMORY_BANK_ENABLED and prompt and not image_urls:
+                        question = re.sub(r'<@!?'+str(bot.user.id)+r'>', '', message.content).strip()
+                        recalled = await memory_bank.recall(
+                            message.channel.id,
+                            message.author.id,
+                            question or prompt,
+                            exclude=[replied_msg.id] if is_replying_to_bot else []
+                        )
+                        if recalled:
+                            conversation_messages.append({"role": "system", "content": recalled})
+                            cache_key = None
+                            logger.info('Added recalled exchanges from the memory bank')
+
+                    async def request_completion():
+                        """Upload any documents and ask Grok (shared by identical requests in flight)"""
+                        # Upload document files to Grok if present
+                        grok_file_ids = []
+                        if document_attachments:
+                            async with aiohttp.ClientSession() as session:
+                                for attachment in document_attachments:
+                                    with tempfile.NamedTemporaryFile(delete=True) as tmp:
+                                        await attachment.save(tmp.name)
+                                        tmp.flush()
+                                        files_url = "https://api.x.ai/v1/files"
+                                        headers = {"Authorization": f"Bearer {XAI_KEY}"}
+                                        with open(tmp.name, "rb") as f:
+                                            data = aiohttp.FormData()
+                                            data.add_field('file', f, filename=attachment.filename)
+                                            async with session.post(files_url, headers=headers, data=data) as resp:
+                                                if resp.status == 200:
+                                                    result = await resp.json()
+                                                    file_id = result.get('id') or result.get('file_id')
+                                                    if file_id:
+                                                        grok_file_ids.append(file_id)
+                                                        logger.info(f'Uploaded {attachment.filename} to Grok, file_id={file_id}')
+                                                    else:
+                                                        logger.warning(f'No file_id returned for {attachment.filename}')
+                                                else:
+                                                    logger.error(f'Failed to upload {attachment.filename} to Grok: {resp.status}')
+
+                        logger.info(f'Using model: {model} (images: {len(image_urls)}, docs: {len(grok_file_ids)})')
+
+                        if image_urls:
+                            content = [{"type": "text", "text": prompt or "What's in this image?"}]
+                            for url in image_urls:
+                                content.append({"type": "image_url", "image_url": {"url": url}})
+                            logger.info('Sending request to Grok with images...')
+                            completion = await grok_complete(
+                                {
+                                    "model": model,
+                                    "messages": [
+                                        {"role": "system", "content": system_prompt},
+                                        {"role": "user", "content": content}
+                                    ]
+                                },
+                                guild_id=message.guild.id if message.guild else None,
+                                request_type='vision'
+                            )
+                        elif grok_file_ids:
+                            messages_to_send = []
+                            messages_to_send.append({"role": "system", "content": system_prompt})
+                            if conversation_messages:
+                                messages_to_send.extend(conversation_messages)
+                            messages_to_send.append({"role": "user", "content": prompt})
+                            logger.info(f'Sending request to Grok with {len(messages_to_send)} messages and {len(grok_file_ids)} files')
+                            request_params = {
+                                "model": model,
+                                "messages": messages_to_send,
+                                "file_ids": grok_file_ids
                             }
-                        }
-                    completion = client.chat.completions.create(**request_params)
+                            if ENABLE_WEB_SEARCH:
+                                request_params["extra_body"] = {
+                                    "search_parameters": {
+                                        "mode": "auto",
+                                        "max_search_results": MAX_SEARCH_RESULTS
+                                    }
+                                }
+                            completion = await grok_complete(
+                                request_params,
+                                guild_id=message.guild.id if message.guild else None,
+                                request_type='documents'
+                            )
+                        else:
+                            messages_to_send = []
+                            messages_to_send.append({"role": "system", "content": system_prompt})
+                            if conversation_messages:
+                                messages_to_send.extend(conversation_messages)
+                            messages_to_send.append({"role": "user", "content": prompt})
+                            logger.info(f'Sending text-only request to Grok with {len(messages_to_send)} messages (history: {len(conversation_messages)})')
+                            request_params = {
+                                "model": model,
+                                "messages": messages_to_send
+                            }
+                            if ENABLE_WEB_SEARCH:
+                                request_params["extra_body"] = {
+                                    "search_parameters": {
+                                        "mode": "auto",  # Let Grok decide when to search
+                                        "max_search_results": MAX_SEARCH_RESULTS
+                                    }
+                                }
+                            completion = await grok_complete(
+                                request_params,
+                                guild_id=message.guild.id if message.guild else None,
+                                request_type='general'
+                            )
 
-                response = completion.choices[0].message.content
-                logger.info(f'Received response from Grok ({len(response)} characters)')
+                        return completion
+
+                    if cache_key:
+                        completion = await response_flights.do(cache_key, request_completion)
+                    else:
+                        completion = await request_completion()
+
+                    response = completion.choices[0].message.content
+                    logger.info(f'Received response from Grok ({len(response)} characters)')
 
                 # Calculate token usage and cost BEFORE parsing JSON/creating embed
                 usage_text = ""
-                if hasattr(completion, 'usage') and completion.usage:
+                num_sources = 0
+                if completion is None:
+                    usage_text = "⚡ Cached answer • 💵 $0.000000"
+                elif hasattr(completion, 'usage') and completion.usage:
                     model_used = completion.model
                     is_vision = 'vision' in model_used.lower()
                     vision_cost = 0
@@ -2006,223 +2360,36 @@ async def on_message(message):
                     await message.reply("❌ Grok did not return valid JSON. Please try again.")
                     return
 
+                # Only cache answers that didn't rely on live web sources
+                if cache_key and completion is not None and not num_sources:
+                    response_cache.put(cache_key, model, response)
+
                 # Build Discord embed from parsed JSON
                 answer = grok_json.get("answer", "(No answer)")
                 sources = grok_json.get("sources", [])
-                confidence = grok_json.get("confidence", None)
 
-                embed = discord.Embed(
-                    description=answer,
-                    color=discord.Color.blue(),
-                    timestamp=message.created_at
-                )
-                embed.set_author(
-                    name="Grok Response",
-                    icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                )
-                if sources:
+                formatted_sources = []
+                for src in sources:
                     # For non-Discord queries, show only clickable links (not title and link)
-                    formatted_sources = []
-                    for src in sources:
-                        # If the source looks like a Markdown link [title](url), extract just the URL
-                        m = re.match(r"\[.*?\]\((https?://[^)]+)\)", src)
-                        if m:
-                            formatted_sources.append(m.group(1))
-                        # If the source is just a URL, keep as is
-                        elif re.match(r"https?://", src):
-                            formatted_sources.append(src)
-                        else:
-                            # If the source is a string with both title and URL separated by space, try to extract the URL
-                            m2 = re.search(r"(https?://\S+)", src)
-                            if m2:
-                                formatted_sources.append(m2.group(1))
-                            else:
-                                formatted_sources.append(src)
-                    embed.add_field(name="Sources", value="\n".join(formatted_sources), inline=False)
-                # Confidence score removed from embed as requested
-
-                footer_text = f"Requested by {message.author.display_name}"
-                if usage_text:
-                    footer_text += f" • {usage_text}"
-                embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
-
-                bot_message = await message.reply(embed=embed)
-
-                # Store conversation for future context
-                original_prompt = message.content.replace(f'<@{bot.user.id}>', '').replace(f'<@!{bot.user.id}>', '').strip()
-                store_conversation(
-                    message_id=bot_message.id,
-                    channel_id=message.channel.id,
-                    author_id=message.author.id,
-                    user_query=original_prompt,
-                    bot_response=answer,
-                    model_used=model
-                )
-                logger.info(f'Stored conversation history for bot message {bot_message.id} (asked by user {message.author.id})')
-                return  # Prevent duplicate messages
-                
-                # Process citations if this is a search follow-up with message_number_map
-                if is_search_followup and 'message_number_map' in locals():
-                    # Clean up malformed citations (e.g., #248(⁠post-election-year-hate-dome⁠) -> #248)
-                    # First, remove channel names from citations
-                    malformed_citation_pattern = r'#(\d+)\([^)]*\)'
-                    response = re.sub(malformed_citation_pattern, r'#\1', response)
-                    
-                    # Now convert citations to bracketed format
-                    # First handle ranges like #140-#141-#142 or #727-#1000 -> [#140-#141-#142]
-                    # The pattern matches: #<num>-#<num> or #<num>-<num>-#<num> etc.
-                    # Must not already be inside brackets
-                    range_bare_pattern = r'(?<!\[)#(\d+(?:-#?\d+)+)(?!\])'
-                    response = re.sub(range_bare_pattern, r'[#\1]', response)
-                    
-                    # Then handle individual citations #N -> [#N]
-                    # Must not be: already in brackets, followed by dash (part of range), or followed by ]
-                    bare_citation_pattern = r'(?<!\[)#(\d+)(?![\d\-\)\]])'
-                    response = re.sub(bare_citation_pattern, r'[#\1]', response)
-                    
-                    # Parse citations from response and extract referenced message numbers
-                    # Match both individual citations [#N] and ranges [#N-#M], [#N-M]
-                    citation_pattern = r'\[#(\d+)\]'
-                    range_pattern = r'\[#(\d+)-#?(\d+)\]'  # Matches [#497-502], [#88-#90]
-                    
-                    # Find individual citations (but not those that are part of ranges)
-                    cited_numbers = set()
-                    for match in re.finditer(citation_pattern, response):
-                        # Check if this is part of a range by looking at context
-                        pos = match.start()
-                        # Skip if preceded by a range pattern
-                        if pos > 0 and response[pos-1:pos] in ['-', ']']:
-                            continue
-                        cited_numbers.add(int(match.group(1)))
-                    
-                    # Find and expand ranges
-                    for match in re.finditer(range_pattern, response):
-                        start_num = int(match.group(1))
-                        end_num = int(match.group(2))
-                        # Add all numbers in the range
-                        cited_numbers.update(range(start_num, end_num + 1))
-                    
-                    logger.info(f'Found {len(cited_numbers)} cited messages in follow-up: {sorted(cited_numbers)}')
-                    
-                    # Replace ranges with individual linked citations (compact format)
-                    def replace_range(match):
-                        start_num = int(match.group(1))
-                        end_num = int(match.group(2))
-                        links = []
-                        for msg_num in range(start_num, end_num + 1):
-                            if msg_num in message_number_map:
-                                msg = message_number_map[msg_num]
-                                msg_link = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{msg.id}"
-                                links.append(f"[#{msg_num}]({msg_link})")
-                            else:
-                                links.append(f"[#{msg_num}]")
-                        return "-".join(links) if links else match.group(0)
-                    
-                    # Replace individual citations with Discord message links (not part of ranges, compact format)
-                    def replace_citation(match):
-                        # Skip if already a markdown link (check if followed by ]( )
-                        pos = match.start()
-                        after_pos = match.end()
-                        
-                        # Check if this is already inside a markdown link
-                        if after_pos < len(response) - 2 and response[after_pos:after_pos+2] == '](':
-                            return match.group(0)  # Already linked, skip
-                        
-                        # Check if this citation is part of a range by looking at context
-                        if after_pos < len(response) and response[after_pos:after_pos+1] == '-':
-                            return match.group(0)  # This is the start of a range, skip it
-                        # Check what comes before
-                        if pos > 0 and response[pos-1:pos] == '-':
-                            return match.group(0)  # This is the end of a range, skip it
-                            
-                        msg_num = int(match.group(1))
-                        if msg_num in message_number_map:
-                            msg = message_number_map[msg_num]
-                            msg_link = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{msg.id}"
-                            return f"[#{msg_num}]({msg_link})"
-                        return match.group(0)  # Keep original if not found
-                    
-                    # First replace ranges, then individual citations
-                    response = re.sub(range_pattern, replace_range, response)
-                    response = re.sub(citation_pattern, replace_citation, response)
-                    
-                    # Convert custom Discord emoji references to actual emoji format
-                    emoji_pattern = r'<(a?):([^:]+):(\d+)>'
-                    def render_emoji(match):
-                        animated = match.group(1)
-                        emoji_name = match.group(2)
-                        emoji_id = match.group(3)
-                        return f"<{animated}:{emoji_name}:{emoji_id}>"
-                    
-                    response = re.sub(emoji_pattern, render_emoji, response)
-                    logger.info(f'Processed citations and emojis in follow-up response')
-                
-                # Convert Discord usernames to mentions (do this before Twitter conversion)
-                response = convert_usernames_to_mentions(response, message.guild)
-                
-                # Convert Twitter/X usernames to clickable links
-                # Match @username patterns (not already in URLs or Discord mentions)
-                twitter_pattern = r'(?<![:/\w<])@([A-Za-z0-9_]{1,15})(?!>|\w)'
-                response = re.sub(twitter_pattern, r'[@\1](https://x.com/\1)', response)
-                logger.info(f'Converted usernames and Twitter mentions')
-                
-                # No need to store conversation history here anymore - we'll do it below per message
-                
-                # Track token usage and calculate cost
-                request_cost = 0
-                search_cost = 0
-                usage_text = ""
-                if hasattr(completion, 'usage') and completion.usage:
-                    # Calculate token cost based on actual model used
-                    model_used = completion.model
-                    is_vision = 'vision' in model_used.lower()
-                    vision_cost = 0
-                    
-                    if is_vision:
-                        # Grok-vision pricing
-                        input_cost = (completion.usage.prompt_tokens / 1_000_000) * GROK_VISION_INPUT_COST
-                        output_cost = (completion.usage.completion_tokens / 1_000_000) * GROK_VISION_OUTPUT_COST
-                        vision_cost = input_cost + output_cost
+                    # If the source looks like a Markdown link [title](url), extract just the URL
+                    m = re.match(r"\[.*?\]\((https?://[^)]+)\)", src)
+                    if m:
+                        formatted_sources.append(m.group(1))
+                    # If the source is just a URL, keep as is
+                    elif re.match(r"https?://", src):
+                        formatted_sources.append(src)
                     else:
-                        # Grok text model pricing
-                        # Account for cached tokens if available
-                        if hasattr(completion.usage, 'prompt_tokens_details') and completion.usage.prompt_tokens_details:
-                            cached = completion.usage.prompt_tokens_details.cached_tokens
-                            uncached = completion.usage.prompt_tokens - cached
-                            input_cost = (uncached / 1_000_000) * GROK_TEXT_INPUT_COST + (cached / 1_000_000) * GROK_TEXT_CACHED_COST
+                        # If the source is a string with both title and URL separated by space, try to extract the URL
+                        m2 = re.search(r"(https?://\S+)", src)
+                        if m2:
+                            formatted_sources.append(m2.group(1))
                         else:
-                            input_cost = (completion.usage.prompt_tokens / 1_000_000) * GROK_TEXT_INPUT_COST
-                        output_cost = (completion.usage.completion_tokens / 1_000_000) * GROK_TEXT_OUTPUT_COST
-                    
-                    # Calculate search cost if sources were used
-                    num_sources = getattr(completion.usage, 'num_sources_used', 0)
-                    if num_sources > 0:
-                        search_cost = (num_sources / 1000) * GROK_SEARCH_COST
-                        logger.info(f"Search usage - Sources used: {num_sources}, Cost: ${search_cost:.6f}")
-                    
-                    request_cost = input_cost + output_cost + search_cost
-                    
-                    # Build usage text with vision and search cost breakdowns
-                    cost_str = f"💵 ${request_cost:.6f}"
-                    indicators = []
-                    
-                    if is_vision:
-                        indicators.append(f"👁️ ${vision_cost:.6f} vision")
-                    if search_cost > 0:
-                        indicators.append(f"🔍 ${search_cost:.6f} search")
-                    
-                    if indicators:
-                        cost_str += f" ({', '.join(indicators)})"
-                    
-                    usage_text = f"{cost_str} • {completion.usage.prompt_tokens} in / {completion.usage.completion_tokens} out"
-                    
-                    logger.info(f"Token usage - Input: {completion.usage.prompt_tokens}, Output: {completion.usage.completion_tokens}, Search sources: {num_sources}, Total cost: ${request_cost:.6f}")
-                
-                # Create embed(s) for the response
-                # Discord embed description limit is 4096 characters
-                if len(response) <= 4096:
+                            formatted_sources.append(src)
+
+                # One message; answers longer than an embed are paged behind buttons
+                def build_embed(description, page, pages):
                     embed = discord.Embed(
-                        description=response,
+                        description=description,
                         color=discord.Color.blue(),
                         timestamp=message.created_at
                     )
@@ -2230,75 +2397,44 @@ async def on_message(message):
                         name="Grok Response",
                         icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
                     )
+                    if formatted_sources:
+                        embed.add_field(name="Sources", value="\n".join(formatted_sources), inline=False)
+                    # Confidence score removed from embed as requested
+
                     footer_text = f"Requested by {message.author.display_name}"
                     if usage_text:
                         footer_text += f" • {usage_text}"
+                    if pages > 1:
+                        footer_text = f"Page {page}/{pages} • {footer_text}"
                     embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
-                    
-                    # Send reply and store in conversation history
-                    bot_message = await message.reply(embed=embed)
-                    
-                    # Store conversation for future context
-                    # Extract the original user prompt (without mentions)
-                    original_prompt = message.content.replace(f'<@{bot.user.id}>', '').replace(f'<@!{bot.user.id}>', '').strip()
-                    
-                    # Store this response in SQLite so it can be referenced in future replies
-                    store_conversation(
-                        message_id=bot_message.id,
-                        channel_id=message.channel.id,
-                        author_id=message.author.id,
-                        user_query=original_prompt,
-                        bot_response=response,
-                        model_used=model
-                    )
-                    logger.info(f'Stored conversation history for bot message {bot_message.id} (asked by user {message.author.id})')
-                else:
-                    # Split into multiple embeds if response is too long
-                    chunks = [response[i:i+4096] for i in range(0, len(response), 4096)]
-                    logger.info(f'Response split into {len(chunks)} embeds')
-                    bot_message = None
-                    for i, chunk in enumerate(chunks):
-                        embed = discord.Embed(
-                            description=chunk,
-                            color=discord.Color.blue(),
-                            timestamp=message.created_at
-                        )
-                        embed.set_author(
-                            name=f"Grok Response (Part {i+1}/{len(chunks)})",
-                            icon_url="https://pbs.twimg.com/profile_images/1683899100922511378/5lY42eHs_400x400.jpg"
-                        )
-                        if i == len(chunks) - 1:  # Only add footer to last embed
-                            footer_text = f"Requested by {message.author.display_name}"
-                            if usage_text:
-                                footer_text += f" • {usage_text}"
-                            embed.set_footer(text=footer_text, icon_url=message.author.avatar.url if message.author.avatar else None)
-                        
-                        # Only store the first message for conversation history
-                        if i == 0:
-                            bot_message = await message.reply(embed=embed)
-                        else:
-                            await message.reply(embed=embed)
-                    
-                    # Store conversation for future context
-                    if bot_message:
-                        original_prompt = message.content.replace(f'<@{bot.user.id}>', '').replace(f'<@!{bot.user.id}>', '').strip()
-                        store_conversation(
-                            message_id=bot_message.id,
-                            channel_id=message.channel.id,
-                            author_id=message.author.id,
-                            user_query=original_prompt,
-                            bot_response=response,
-                            model_used=model
-                        )
-                        logger.info(f'Stored conversation history for bot message {bot_message.id} (asked by user {message.author.id})')
-                
-                logger.info('Response sent successfully')
+                    return embed
+
+                bot_message = await send_paginated(message.reply, answer, build_embed)
+
+                # Store conversation for future context
+                original_prompt = message.content.replace(f'<@{bot.user.id}>', '').replace(f'<@!{bot.user.id}>', '').strip()
+                store_conversation(
+                    message_id=bot_message.id,
+                    channel_id=message.channel.id,
+                    author_id=message.author.id,
+                    user_query=original_prompt,
+                    bot_response=answer,
+                    model_used=model
+                )
+                if MEMORY_BANK_ENABLED:
+                    bot.loop.create_task(memory_bank.add(
+                        bot_message.id, message.channel.id, message.author.id, original_prompt, answer
+                    ))
+                logger.info(f'Stored conversation history for bot message {bot_message.id} (asked by user {message.author.id})')
+                return  # Prevent duplicate messages
         except Exception as e:
             logger.error(f'Error querying Grok: {e}', exc_info=True)
             
             # Provide user-friendly error messages
             error_msg = str(e)
-            if "412" in error_msg and "Unsupported content-type" in error_msg:
+            if isinstance(e, CircuitOpenError):
+                await message.reply(f"⏳ {error_msg}. Please try again shortly.")
+            elif "412" in error_msg and "Unsupported content-type" in error_msg:
                 await message.reply("❌ One or more images are in an unsupported format. Grok only accepts JPEG, PNG, and WebP images.\n\nPlease try again with supported image formats.")
             elif "401" in error_msg or "authentication" in error_msg.lower():
                 await message.reply("❌ Authentication error. Please check the API key configuration.")
@@ -2311,4 +2447,10 @@ async def on_message(message):
     
     await bot.process_commands(message)
 
-bot.run(TOKEN)
\ No newline at end of file
+bot.run(TOKEN)
+
+# Write messages still buffered for the archive, and keep the counts made since the last autosave
+if MESSAGE_ARCHIVE_ENABLED:
+    message_archive.flush()
+if TERM_SKETCHES_ENABLED:
+    term_sketches.save(DB_PATH)
\ No newline at end of file
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from block_summaries import make_block_key, renumber_citations, split_blocks
+from grok_scheduler import PRIORITY_BULK
+from prompt_assembly import (
+    BLOCK_SUMMARY_PROMPT_VERSION, REDUCE_NOTE, EncodedHistory, assemble_messages, block_summary_system_prefix,
+    encode_history, history_block, map_system_prefix
+)
+
+logger = logging.getLogger('GrokBot')
+
+CHARS_PER_TOKEN = 4  # Same rough estimate the scheduler uses
+NOTHING_RELEVANT = "NOTHING RELEVANT"
+
+
+class MapReduceAnalyzer:
+    """
+    Map step for histories too large for one prompt.
+
+    The encoded messages are split into consecutive shards of at most `shard_tokens` (estimated),
+    each shard is summarized into notes by its own Grok request - all submitted at once as bulk work,
+    so the request scheduler runs them as concurrently as the rate limits allow - and the notes are
+    returned as a history block that replaces the messages in the caller's normal (reduce) prompt.
+    Citation numbers are global across shards, so the final answer resolves against the full
+    number map. Beyond `max_shards`, the oldest messages are left out (and the reduce prompt says so).
+
+    With a `block_store` (block_summaries.BlockSummaryStore), the map step writes question-independent
+    summaries of ID-aligned blocks of about `block_size` messages instead (at most `max_shards` of
+    them, newest first). Blocks are cut from the scanned matches, so a block summary is reused by
+    later analyses that match the same messages (same channel and filters) - only blocks that are new
+    or have changed cost a request.
+    """
+
+    def __init__(self, complete, model: str, shard_tokens: int = 24000, max_shards: int = 16,
+                 block_store=None, tz=None, block_size: int = 200):
+        self.complete = complete  # grok_complete(request_params, *, priority, guild_id, request_type)
+        self.model = model
+        self.shard_tokens = shard_tokens
+        self.max_shards = max_shards
+        self.block_store = block_store
+        self.tz = tz  # Timezone of the standalone block encodings
+        self.block_size = block_size
+        self.counters = {'analyses': 0, 'shards': 0, 'failed_shards': 0, 'empty_shards': 0,
+                         'blocks_reused': 0, 'blocks_summarized': 0}
+
+    def shard(self, encoded: EncodedHistory) -> List[Tuple[int, int]]:
+        """Split message numbers into consecutive (first, last) ranges that fit the shard budget"""
+        budget = max(1000, self.shard_tokens * CHARS_PER_TOKEN - len(encoded.header) - len(encoded.footer))
+        shards = []
+        first = 1
+        size = 0
+        for number, line in enumerate(encoded.lines, 1):
+            if size and size + len(line) + 1 > budget:
+                shards.append((first, number - 1))
+                first = number
+                size = 0
+            size += len(line) + 1
+        if size:
+            shards.append((first, len(encoded.lines)))
+        if len(shards) > self.max_shards:
+            logger.warning(f'History needs {len(shards)} shards, analyzing the newest {self.max_shards}')
+            shards = shards[-self.max_shards:]
+        return shards
+
+    @staticmethod
+    def _reduce_header(encoded: EncodedHistory, first: int) -> str:
+        """Header of the notes block; says so when the messages before #first were left out"""
+        header = encoded.header + REDUCE_NOTE
+        if first > 1:
+            header += f" Messages #1-#{first - 1} (the oldest) were left out: there were too many parts to read."
+        return header + "\n"
+
+    async def _map_shard(self, encoded: EncodedHistory, first: int, last: int, query: str,
+                         guild_id: Optional[int], request_type: str):
+        part = history_block(encoded.header, encoded.lines[first - 1:last], encoded.footer)
+        return await self.complete(
+            {
+                "model": self.model,
+                "messages": assemble_messages(map_system_prefix(), f"User query: {query}", history=part)
+            },
+            priority=PRIORITY_BULK,
+            guild_id=guild_id,
+            request_type=f'{request_type}_map'
+        )
+
+    async def map(self, encoded: EncodedHistory, query: str, *, guild_id: Optional[int] = None,
+                  request_type: str = 'history_analysis') -> Tuple[str, list, int]:
+        """
+        Summarize every shard concurrently.
+        Returns (history block of shard notes for the reduce prompt, completions for cost accounting,
+        number of messages covered - fewer than encoded when the oldest parts were left out).
+        """
+        if self.block_store is not None:
+            return await self._map_blocks(encoded, guild_id, request_type)
+        shards = self.shard(encoded)
+        logger.info(f'Map-reduce: {len(encoded.lines)} messages in {len(shards)} shards')
+        results = await asyncio.gather(
+            *(self._map_shard(encoded, first, last, query, guild_id, request_type) for first, last in shards),
+            return_exceptions=True
+        )
+
+        completions = []
+        notes = []
+        for (first, last), result in zip(shards, results):
+            if isinstance(result, BaseException):
+                self.counters['failed_shards'] += 1
+                logger.warning(f'Map-reduce shard #{first}-#{last} failed: {result}')
+                notes.append(f"Part #{first}-#{last}: (could not be analyzed)\n")
+                continue
+            completions.append(result)
+            text = (result.choices[0].message.content or "").strip()
+            if not text or text.upper().startswith(NOTHING_RELEVANT):
+                self.counters['empty_shards'] += 1
+                continue
+            notes.append(f"Part #{first}-#{last}:\n{text}\n")
+        if not completions:
+            # Every shard failed; surface the first error like a single-prompt failure would
+            raise next(result for result in results if isinstance(result, BaseException))
+
+        self.counters['analyses'] += 1
+        self.counters['shards'] += len(shards)
+        if not notes:
+            notes.append("(No part contained anything relevant to the query.)")
+        covered = sum(last - first + 1 for first, last in shards)
+        return history_block(self._reduce_header(encoded, shards[0][0]), notes, encoded.footer), completions, covered
+
+    async def _summarize_block(self, messages: list, guild_id: Optional[int], request_type: str):
+        # Encoded on its own (own numbers, legend and times) so the prompt depends only on the block
+        block = encode_history(messages, self.tz, "Channel messages:")
+        return await self.complete(
+            {
+                "model": self.model,
+                "messages": assemble_messages(block_summary_system_prefix(), "Summarize this block.", history=block.text)
+            },
+            priority=PRIORITY_BULK,
+            guild_id=guild_id,
+            request_type=f'{request_type}_block'
+        )
+
+    async def _map_blocks(self, encoded: EncodedHistory, guild_id: Optional[int],
+                          request_type: str) -> Tuple[str, list, int]:
+        messages = [encoded.number_map[number] for number in range(1, len(encoded.lines) + 1)]
+        blocks = split_blocks(messages, self.block_size)
+        if len(blocks) > self.max_shards:
+            logger.warning(f'History needs {len(blocks)} blocks, analyzing the newest {self.max_shards}')
+            blocks = blocks[-self.max_shards:]
+        keys = [make_block_key(messages[start:end], self.model, BLOCK_SUMMARY_PROMPT_VERSION) for start, end in blocks]
+        summaries = self.block_store.get_many(keys)
+        missing = [(key, start, end) for key, (start, end) in zip(keys, blocks) if key not in summaries]
+        logger.info(f'Map-reduce: {len(messages)} messages in {len(blocks)} blocks, {len(missing)} to summarize')
+        results = await asyncio.gather(
+            *(self._summarize_block(messages[start:end], guild_id, request_type) for _, start, end in missing),
+            return_exceptions=True
+        )
+
+        completions = []
+        for (key, start, end), result in zip(missing, results):
+            if isinstance(result, BaseException):
+                self.counters['failed_shards'] += 1
+                logger.warning(f'Map-reduce block #{start + 1}-#{end} failed: {result}')
+                continue
+            completions.append(result)
+            summary = (result.choices[0].message.content or "").strip()
+            self.block_store.put(key, self.model, BLOCK_SUMMARY_PROMPT_VERSION, messages[start].id,
+                                 messages[end - 1].id, end - start, summary)
+            summaries[key] = summary
+        if not summaries:
+            # Nothing cached and every block failed; surface the first error like a single-prompt failure would
+            raise next(result for result in results if isinstance(result, BaseException))
+
+        notes = []
+        for key, (start, end) in zip(keys, blocks):
+            summary = summaries.get(key)
+            if summary is None:
+                notes.append(f"Part #{start + 1}-#{end}: (could not be analyzed)\n")
+            else:
+                # Block summaries cite the block's own numbers; shift them to the full history's
+                notes.append(f"Part #{start + 1}-#{end}:\n{renumber_citations(summary, start)}\n")
+
+        self.counters['analyses'] += 1
+        self.counters['shards'] += len(blocks)
+        self.counters['blocks_reused'] += len(blocks) - len(missing)
+        self.counters['blocks_summarized'] += len(completions)
+        covered = sum(end - start for start, end in blocks)
+        return history_block(self._reduce_header(encoded, blocks[0][0] + 1), notes, encoded.footer), completions, covered
+
+    def stats(self) -> dict:
+        return dict(self.counters)
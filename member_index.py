@@ -0,0 +1,87 @@
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger('GrokBot')
+
+
+def member_name_keys(member) -> set:
+    """Lowercase names a member can be referred to by (username, display name, name without discriminator)"""
+    keys = {member.name.lower(), member.display_name.lower()}
+    # Also map without discriminator if present
+    if '#' in member.name:
+        keys.add(member.name.split('#')[0].lower())
+    return keys
+
+
+class GuildMemberIndex:
+    """
+    Lowercase username / display name -> member ID, per guild, kept current from gateway events.
+
+    A guild is indexed once (on ready / guild join, or lazily on first lookup); after that
+    joins, updates and removals adjust only the affected member's names, so resolving a name is a
+    dict lookup no matter how large the guild is.
+    """
+
+    def __init__(self):
+        self._names: Dict[int, Dict[str, List[int]]] = {}  # {guild_id: {name: [member_id, ...]}}
+        self._keys: Dict[int, Dict[int, set]] = {}  # {guild_id: {member_id: {name, ...}}}
+
+    def index_guild(self, guild):
+        """(Re)build a guild's index from its member cache"""
+        self._names[guild.id] = {}
+        self._keys[guild.id] = {}
+        for member in guild.members:
+            self.add_member(member)
+        logger.info(f'Indexed {len(self._keys[guild.id]):,} member names for guild {guild.id}')
+
+    def drop_guild(self, guild_id: int):
+        self._names.pop(guild_id, None)
+        self._keys.pop(guild_id, None)
+
+    def add_member(self, member):
+        names = self._names.get(member.guild.id)
+        if names is None:
+            return  # Guild not indexed yet; it will be built in full on first lookup
+        keys = self._keys[member.guild.id]
+        if member.id in keys:
+            self.remove_member(member)
+        member_keys = member_name_keys(member)
+        keys[member.id] = member_keys
+        for key in member_keys:
+            names.setdefault(key, []).append(member.id)
+
+    def remove_member(self, member):
+        names = self._names.get(member.guild.id)
+        if names is None:
+            return
+        for key in self._keys[member.guild.id].pop(member.id, ()):
+            holders = names.get(key)
+            if holders and member.id in holders:
+                holders.remove(member.id)
+                if not holders:
+                    del names[key]
+
+    def update_member(self, before, after):
+        """Re-index a member whose username or nickname may have changed"""
+        if member_name_keys(before) != member_name_keys(after) or after.id not in self._keys.get(after.guild.id, {}):
+            self.add_member(after)
+
+    def lookup(self, guild) -> Callable[[str], Optional[str]]:
+        """Name -> mention resolver for ResponsePostProcessor(name_lookup=...)"""
+        if guild.id not in self._names:
+            self.index_guild(guild)
+        names = self._names[guild.id]
+
+        def resolve(name: str) -> Optional[str]:
+            holders = names.get(name)
+            # Most recently joined / renamed member wins when names collide
+            return f"<@{holders[-1]}>" if holders else None
+
+        return resolve
+
+    def stats(self) -> dict:
+        return {
+            'guilds': len(self._names),
+            'members': sum(len(keys) for keys in self._keys.values()),
+            'names': sum(len(names) for names in self._names.values()),
+        }
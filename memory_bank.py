@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from text_compression import decompress_text
+from time_partitions import snowflake_time
+
+logger = logging.getLogger('GrokBot')
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free fallback embedder: the distinct word unigrams and bigrams of a text hashed into
+    `dim` signed buckets (the hashing trick), L2-normalized. Finds exchanges sharing vocabulary, not
+    paraphrases, so related texts score lower than with a transformer model.
+    """
+
+    min_similarity = 0.15
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            for feature in set(words + [f"{a} {b}" for a, b in zip(words, words[1:])]):
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+class TransformerEmbedder:
+    """Sentence embeddings from a local transformers feature-extraction pipeline (mean-pooled, L2-normalized)"""
+
+    min_similarity = 0.35
+
+    def __init__(self, extractor, model: str):
+        self.extractor = extractor  # transformers.pipeline('feature-extraction', model=model)
+        self.name = model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for features in self.extractor(texts, truncation=True):
+            # [1, tokens, dim] token features -> mean over tokens
+            vectors.append(np.asarray(features, np.float32).reshape(-1, np.shape(features)[-1]).mean(axis=0))
+        vectors = np.stack(vectors)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+class ScopeIndex:
+    """Embeddings of one channel's stored exchanges: message IDs, authors and a unit-vector matrix"""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.authors: List[int] = []
+        self._vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, message_id: int, author_id: int, vector: np.ndarray):
+        self.ids.append(message_id)
+        self.authors.append(author_id)
+        self._vectors.append(vector.astype(np.float32))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) != len(self._vectors):
+            self._matrix = np.stack(self._vectors)
+        return self._matrix
+
+
+class MemoryBank:
+    """
+    Semantic recall over stored conversations (the memory bank).
+
+    Each exchange's question and answer are embedded locally (`embedder`, a TransformerEmbedder or
+    the HashingEmbedder fallback) in a worker thread and the vector is stored with the exchange in
+    its daily conversation partition, so retention drops both together. For a new question, the
+    channel's vectors are loaded once into an in-memory index and the top `k` earlier exchanges
+    (only the asker's own unless `scope` is 'channel') above `min_similarity` (by default the
+    embedder's) are returned as a context block of at most `max_tokens` estimated tokens.
+    """
+
+    def __init__(self, db_path: str, partitions, embedder, *, k: int = 3, min_similarity: Optional[float] = None,
+                 max_tokens: int = 800, scope: str = 'user', max_channels: int = 256):
+        self.db_path = db_path
+        self.partitions = partitions  # time_partitions.TimePartitions of the conversations
+        self.embedder = embedder
+        self.k = k
+        self.min_similarity = embedder.min_similarity if min_similarity is None else min_similarity
+        self.max_tokens = max_tokens
+        self.scope = scope
+        self.max_channels = max_channels
+        self._indexes: OrderedDict = OrderedDict()  # {channel_id: ScopeIndex}, least recently used first
+        self.counters = {'embedded': 0, 'recalls': 0, 'recalled': 0}
+        self._lock = threading.Lock()  # Indexes are used from worker threads
+
+    def init_db(self):
+        """Add the embedding columns to conversation partitions created before the memory bank"""
+        conn = sqlite3.connect(self.db_path)
+        for name in self.partitions.existing(conn):
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({name})')}
+            if 'embedding' not in columns:
+                conn.execute(f'ALTER TABLE {name} ADD COLUMN embedding BLOB')
+                conn.execute(f'ALTER TABLE {name} ADD COLUMN embedding_model TEXT')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def exchange_text(user_query: str, bot_response: str) -> str:
+        """What is embedded for an exchange: the question and the start of the answer"""
+        return f"{user_query}\n{bot_response[:500]}"
+
+    def _vector(self, blob: bytes) -> np.ndarray:
+        return np.frombuffer(blob, np.float16).astype(np.float32)
+
+    def _store(self, rows: List[Tuple[int, int, int, str]]) -> int:
+        """Embed exchanges (message_id, channel_id, author_id, text) and save the vectors (blocking)"""
+        vectors = self.embedder.embed([text for _, _, _, text in rows])
+        conn = sqlite3.connect(self.db_path)
+        for (message_id, channel_id, author_id, _), vector in zip(rows, vectors):
+            name = self.partitions.name(snowflake_time(message_id))
+            conn.execute(f'UPDATE {name} SET embedding = ?, embedding_model = ? WHERE message_id = ?',
+                         (vector.astype(np.float16).tobytes(), self.embedder.name, message_id))
+            with self._lock:
+                index = self._indexes.get(channel_id)
+                if index is not None:
+                    index.add(message_id, author_id, vector)
+        conn.commit()
+        conn.close()
+        self.counters['embedded'] += len(rows)
+        return len(rows)
+
+    async def add(self, message_id: int, channel_id: int, author_id: int, user_query: str, bot_response: str):
+        """Embed a just-stored exchange (call after store_conversation)"""
+        try:
+            await asyncio.to_thread(
+                self._store, [(message_id, channel_id, author_id, self.exchange_text(user_query, bot_response))]
+            )
+        except Exception as e:
+            logger.error(f'Error embedding conversation {message_id}: {e}')
+
+    async def backfill(self):
+        """Embed stored exchanges from before the memory bank (or another embedder) in a worker thread"""
+        await asyncio.to_thread(self._backfill)
+
+    def _backfill(self, batch_size: int = 64) -> int:
+        done = 0
+        try:
+            conn = sqlite3.connect(self.db_path)
+            partitions = self.partitions.existing(conn)
+            for name in partitions:
+                rows = conn.execute(f'''
+                    SELECT message_id, channel_id, author_id, user_query, bot_response FROM {name}
+                    WHERE embedding IS NULL OR embedding_model IS NOT ?
+                ''', (self.embedder.name,)).fetchall()
+                for i in range(0, len(rows), batch_size):
+                    done += self._store([
+                        (message_id, channel_id, author_id,
+                         self.exchange_text(decompress_text(query), decompress_text(response)))
+                        for message_id, channel_id, author_id, query, response in rows[i:i + batch_size]
+                    ])
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error embedding stored conversations: {e}')
+        if done:
+            logger.info(f'Memory bank embedded {done} stored conversations with {self.embedder.name}')
+        return done
+
+    def _index(self, channel_id: int) -> ScopeIndex:
+        """The channel's index, loaded from the conversation partitions on first use (call with the lock held)"""
+        index = self._indexes.get(channel_id)
+        if index is None:
+            index = ScopeIndex()
+            conn = sqlite3.connect(self.db_path)
+            for name in self.partitions.existing(conn):
+                for message_id, author_id, blob in conn.execute(f'''
+                    SELECT message_id, author_id, embedding FROM {name}
+                    WHERE channel_id = ? AND embedding_model = ? ORDER BY message_id
+                ''', (channel_id, self.embedder.name)):
+                    index.add(message_id, author_id, self._vector(blob))
+            conn.close()
+            self._indexes[channel_id] = index
+            while len(self._indexes) > self.max_channels:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(channel_id)
+        return index
+
+    def _recall(self, channel_id: int, author_id: int, query: str, exclude: Iterable[int]) -> Optional[str]:
+        vector = self.embedder.embed([query])[0]
+        excluded = set(exclude)
+        with self._lock:
+            index = self._index(channel_id)
+            if not index.ids:
+                return None
+            scores = index.matrix @ vector
+            if self.scope == 'user':
+                scores = np.where(np.asarray(index.authors) == author_id, scores, -1.0)
+            ranked = [index.ids[i] for i in np.argsort(-scores)[:self.k + len(excluded)]
+                      if scores[i] >= self.min_similarity and index.ids[i] not in excluded][:self.k]
+        if not ranked:
+            return None
+
+        conn = sqlite3.connect(self.db_path)
+        exchanges = []
+        for message_id in ranked:
+            row = conn.execute(
+                f'SELECT user_query, bot_response FROM {self.partitions.name(snowflake_time(message_id))} '
+                f'WHERE message_id = ?', (message_id,)
+            ).fetchone()
+            if row:
+                exchanges.append((message_id, decompress_text(row[0]), decompress_text(row[1])))
+        conn.close()
+
+        # Oldest first, within the token budget (~4 characters per token), most relevant kept first
+        budget = self.max_tokens * 4
+        lines = []
+        for message_id, user_query, bot_response in exchanges:
+            when = time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(snowflake_time(message_id)))
+            entry = f"[{when}] Q: {user_query[:300]}\nA: {bot_response[:600]}"
+            if len(entry) > budget:
+                break
+            budget -= len(entry)
+            lines.append((message_id, entry))
+        if not lines:
+            return None
+        self.counters['recalled'] += len(lines)
+        lines.sort()
+        who = "with this user" if self.scope == 'user' else "in this channel"
+        return (f"Earlier exchanges {who} that may be relevant (oldest first; use them only if they help "
+                f"answer the new question):\n\n" + "\n\n".join(entry for _, entry in lines))
+
+    async def recall(self, channel_id: int, author_id: int, query: str, exclude: Iterable[int] = ()) -> Optional[str]:
+        """Context block of the most relevant earlier exchanges for a new question, or None"""
+        self.counters['recalls'] += 1
+        try:
+            return await asyncio.to_thread(self._recall, channel_id, author_id, query, list(exclude))
+        except Exception as e:
+            logger.error(f'Error recalling conversations: {e}')
+            return None
+
+    def reset(self):
+        """Forget loaded indexes (after conversation partitions were dropped)"""
+        self._indexes.clear()
+
+    def stats(self) -> dict:
+        return dict(self.counters, channels=len(self._indexes), embedder=self.embedder.name)
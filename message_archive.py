@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from text_compression import compress_columns, compress_text, decompress_text
+from time_partitions import TimePartitions
+
+logger = logging.getLogger('GrokBot')
+
+
+class MessageArchive:
+    """
+    Local archive of channel messages in the conversation SQLite DB, for analytics that need exact
+    counts over more history than fits in a prompt.
+
+    Messages seen live (on_message) and by history scans are buffered and written in batches of
+    `batch_size` (or when the buffer is older than `flush_interval` seconds); when add() is called
+    from the event loop the batch is written in a worker thread, so scans never wait on SQLite.
+    Readers flush first (flush_async() on the event loop). A message ID is only stored once. Rows get an increasing `seq` in the order they were archived
+    (older history found by a scan is archived after newer live messages), so readers can pick up
+    everything archived since their last read. Newly stored rows are passed to `on_ingest` (e.g. to
+    update term sketches), so re-scanned messages are never counted twice.
+
+    Rows are stored in one table per UTC month of the message's creation (message_archive_YYYYMM),
+    so retention drops whole months and reads for a time window only touch the months it overlaps.
+    Message bodies of at least `compress_min_bytes` are stored compressed (text_compression; None
+    stores everything as plain text).
+    """
+
+    SCHEMA = '''
+        message_id INTEGER PRIMARY KEY,
+        guild_id INTEGER,
+        channel_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        author_name TEXT NOT NULL,
+        is_bot INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        seq INTEGER NOT NULL
+    '''
+
+    def __init__(self, db_path: str, batch_size: int = 200, flush_interval: float = 10.0, on_ingest=None,
+                 compress_min_bytes: Optional[int] = 200):
+        self.db_path = db_path
+        self.compress_min_bytes = compress_min_bytes
+        self.on_ingest = on_ingest  # Callable[[List[row]], None], rows as buffered by add()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[tuple] = []
+        self._buffered_since = 0.0
+        self._next_seq: Optional[int] = None
+        self._write_lock = threading.Lock()  # Writes run in worker threads
+        self._writes = set()  # Background flush tasks
+        self.partitions = TimePartitions('message_archive', self.SCHEMA, period='month',
+                                         indexes=['(guild_id, seq)', '(channel_id, seq)'])
+        self.counters = {'ingested': 0, 'flushes': 0}
+
+    def init_db(self):
+        """Find the archive partitions (moving rows of the old single-table layout into them)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'message_archive'")
+        if cursor.fetchone():
+            cursor.execute('''
+                SELECT message_id, guild_id, channel_id, author_id, author_name, is_bot, created_at, length, content, seq
+                FROM message_archive
+            ''')
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                by_partition = {}
+                for row in rows:
+                    by_partition.setdefault(self.partitions.ensure(conn, row[6]), []).append(row)
+                for name, partition_rows in by_partition.items():
+                    conn.executemany(f'INSERT OR IGNORE INTO {name} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', partition_rows)
+            conn.execute('DROP TABLE message_archive')
+            logger.info('Moved the message archive into monthly partitions')
+        self._next_seq = 1
+        for name in self.partitions.existing(conn):
+            cursor.execute(f'SELECT COALESCE(MAX(seq), 0) + 1 FROM {name}')
+            self._next_seq = max(self._next_seq, cursor.fetchone()[0])
+            if self.compress_min_bytes is not None:
+                compress_columns(conn, name, 'message_id', ['content'], self.compress_min_bytes)
+        conn.commit()
+        conn.close()
+
+    def add(self, msg):
+        """Buffer a discord.Message for the archive"""
+        if not self._buffer:
+            self._buffered_since = time.monotonic()
+        self._buffer.append((
+            msg.id,
+            msg.guild.id if msg.guild else None,
+            msg.channel.id,
+            msg.author.id,
+            msg.author.name,
+            int(msg.author.bot),
+            int(msg.created_at.timestamp()),
+            len(msg.content),
+            msg.content,
+        ))
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._buffered_since >= self.flush_interval:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            rows, self._buffer = self._buffer, []
+            task = loop.create_task(self._write_async(rows))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    def flush(self):
+        """Write buffered messages (blocking)"""
+        rows, self._buffer = self._buffer, []
+        if rows:
+            self._ingested(self._write(rows))
+
+    async def flush_async(self):
+        """Write buffered messages in a worker thread, and wait for background writes in progress"""
+        rows, self._buffer = self._buffer, []
+        if rows:
+            await self._write_async(rows)
+        if self._writes:
+            await asyncio.gather(*self._writes)
+
+    async def _write_async(self, rows: List[tuple]):
+        self._ingested(await asyncio.to_thread(self._write, rows))
+
+    def _ingested(self, rows: List[tuple]):
+        if rows and self.on_ingest:
+            self.on_ingest(rows)
+
+    def _write(self, rows: List[tuple]) -> List[tuple]:
+        """Store rows not archived yet; returns the newly stored rows"""
+        with self._write_lock:
+            return self._write_locked(rows)
+
+    def _write_locked(self, rows: List[tuple]) -> List[tuple]:
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            # Group by partition (a message's partition follows from its creation time)
+            by_partition = {}
+            for row in rows:
+                by_partition.setdefault(self.partitions.ensure(conn, row[6]), []).append(row)
+            # Only rows not archived yet (scans see the same messages again)
+            seen = set()
+            for name, partition_rows in by_partition.items():
+                placeholders = ",".join("?" * len(partition_rows))
+                cursor.execute(f'SELECT message_id FROM {name} WHERE message_id IN ({placeholders})',
+                               [row[0] for row in partition_rows])
+                seen.update(row[0] for row in cursor.fetchall())
+            new_rows = []
+            for name, partition_rows in by_partition.items():
+                partition_rows = [row for row in partition_rows if not (row[0] in seen or seen.add(row[0]))]
+                seq = self._next_seq
+                self._next_seq += len(partition_rows)
+                cursor.executemany(f'''
+                    INSERT OR IGNORE INTO {name}
+                    (message_id, guild_id, channel_id, author_id, author_name, is_bot, created_at, length, content, seq)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [row[:8] + (self._stored(row[8]), seq + i) for i, row in enumerate(partition_rows)])
+                new_rows.extend(partition_rows)
+            rows = new_rows
+            conn.commit()
+            conn.close()
+            self.counters['ingested'] += len(rows)
+            self.counters['flushes'] += 1
+        except Exception as e:
+            logger.error(f'Error writing {len(rows)} messages to the archive: {e}')
+            return []
+        return rows
+
+    def _stored(self, content: str):
+        return compress_text(content, self.compress_min_bytes) if self.compress_min_bytes is not None else content
+
+    def rows_after(self, guild_id: Optional[int], channel_id: int, after_seq: int,
+                   since: Optional[int] = None) -> List[Tuple]:
+        """
+        Human messages of a guild (or of one channel outside guilds) archived after seq (and sent
+        at or after `since`, if given), in archive order:
+        (seq, message_id, channel_id, author_id, author_name, created_at, length, content).
+        Only written rows are read: flush (or await flush_async()) first.
+        """
+        scope, scope_id = ('guild_id', guild_id) if guild_id is not None else ('channel_id', channel_id)
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            rows = []
+            for name in self.partitions.existing(conn, start=since):
+                cursor.execute(f'''
+                    SELECT seq, message_id, channel_id, author_id, author_name, created_at, length, content
+                    FROM {name} WHERE {scope} = ? AND seq > ? AND is_bot = 0 AND created_at >= ?
+                    ORDER BY seq
+                ''', (scope_id, after_seq, since or 0))
+                rows.extend(cursor.fetchall())
+            conn.close()
+            rows.sort()
+            return [row[:7] + (decompress_text(row[7]),) for row in rows]
+        except Exception as e:
+            logger.error(f'Error reading the message archive: {e}')
+            return []
+
+    def cleanup(self, retention_seconds: int) -> int:
+        """Drop the months entirely older than the retention period; returns the number dropped"""
+        self.flush()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            dropped = self.partitions.drop_before(conn, time.time() - retention_seconds)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error dropping archive partitions: {e}')
+            return 0
+        if dropped:
+            logger.info(f'Message archive dropped {len(dropped)} partitions: {", ".join(dropped)}')
+        return len(dropped)
+
+    def stats(self) -> dict:
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            partitions = self.partitions.existing(conn)
+            messages, channels = 0, set()
+            for name in partitions:
+                cursor.execute(f'SELECT COUNT(*) FROM {name}')
+                messages += cursor.fetchone()[0]
+                cursor.execute(f'SELECT DISTINCT channel_id FROM {name}')
+                channels.update(row[0] for row in cursor.fetchall())
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error reading archive stats: {e}')
+            partitions, messages, channels = [], 0, set()
+        return dict(self.counters, messages=messages, channels=len(channels), partitions=len(partitions),
+                    buffered=len(self._buffer))
@@ -0,0 +1,361 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from block_summaries import is_block_boundary
+
+logger = logging.getLogger('GrokBot')
+
+# Grok caches prompt prefixes: every token up to the first difference from an earlier request is
+# served from cache (billed at the cached rate and skipped during prefill). Prompts are therefore
+# laid out from most to least stable:
+#   1. system prefix    - fixed instructions, identical for every request of a type
+#   2. history block    - channel messages, oldest to newest, in a fixed format; the Authors legend
+#                         and other per-scan notes follow the messages, so new ones only add to the end
+#   3. query            - the user's question and anything else that changes per request
+
+CLASSIFICATION_SYSTEM_PREFIX = """You are analyzing a Discord bot query. Determine if the user is asking about:
+
+A) DISCORD: The Discord server's chat history, messages, or users in THIS server
+B) GENERAL: General knowledge, news, history, or topics outside this Discord server
+
+Examples of DISCORD queries:
+- "who talks about Python the most?"
+- "what have we discussed about AI recently?"
+- "summarize our conversations from last week"
+- "who mentions crypto the most?"
+- "what are the main topics discussed here?"
+
+Examples of GENERAL queries:
+- "who was the smartest person in history?"
+- "what have scientists discussed about climate change?"
+- "summarize news from last week"
+- "what did Elon Musk say recently?"
+- "who is the best programmer in the world?"
+
+Respond with ONLY one word: "DISCORD" or "GENERAL"
+"""
+
+
+# Compact message encoding: each message is "[N] A3 2h05m: content" - a citation number, an author
+# handle from the legend, and its age relative to the newest message. Message/user IDs and links
+# are never sent; they are resolved locally from the citation number and author handle afterwards.
+HISTORY_FORMAT_NOTE = (
+    "Messages are listed oldest to newest, one per line, as \"[N] <author> <age>: <content>\". "
+    "N is the message number to cite. <author> is a short handle (A1, A2, ...) defined in the Authors legend "
+    "after the list (omitted when all messages are from one user). <age> is how long before the reference time given above the "
+    "list it was sent (e.g. 45m, 5h12m, 3d4h). "
+    "Refer to authors by their handle (e.g. A1) - handles are turned into Discord mentions automatically."
+)
+
+def format_age(seconds: float) -> str:
+    """Compact age: 45m under an hour, 5h12m under two days, 3d4h beyond"""
+    minutes = max(0, int(seconds // 60))
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 48:
+        return f"{hours}h{minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d{hours}h"
+
+
+def age_reference(newest: datetime) -> datetime:
+    """
+    Time that ages are counted back from: the newest message's time rounded up to the whole hour,
+    so lines already sent keep the same text (and prompt-cache prefix) while messages arrive within the hour.
+    On its own this only holds while the window grows; full windows also need HistoryEncoder's `align`
+    so the lines themselves don't shift.
+    """
+    hour = newest.replace(minute=0, second=0, microsecond=0)
+    return hour if hour == newest else hour + timedelta(hours=1)
+
+
+class EncodedHistory:
+    """A compact history block plus what is needed to resolve the model's answer locally"""
+
+    __slots__ = ('header', 'lines', 'footer', 'number_map', 'authors')
+
+    def __init__(self, header: str, lines: List[str], footer: str, number_map: dict, authors: dict):
+        self.header = header  # Title and the time ages are counted back from
+        self.lines = lines  # One line per message, oldest to newest
+        self.footer = footer  # Authors legend and fold / drop notes ("" if none)
+        self.number_map = number_map  # {N: message}
+        self.authors = authors  # {'A1': author}
+
+    @property
+    def text(self) -> str:
+        return history_block(self.header, self.lines, self.footer)
+
+
+class HistoryEncoder:
+    """
+    Incremental encoder for the compact history format, fed messages newest first as a scan
+    yields them. Each message's age and content are formatted on arrival (ages are counted back from
+    age_reference() of the first, newest, message); citation numbers and author handles are assigned oldest first by
+    finish(), and the Authors legend comes after the lines. Stops accepting messages (full) after max_messages.
+
+    Numbers, handles and ages of the lines already sent then stay the same as new messages arrive,
+    so the prompt-cache prefix reaches up to the new lines. For a full window the oldest messages
+    would drop out one by one and shift everything, so with `align` the window instead starts at
+    the oldest message whose ID is a block boundary (block_summaries.is_block_boundary, about one in
+    `align` messages, looked for among the oldest 2 * align); it moves only when that message drops out.
+
+    With a compactor (history_compaction.HistoryCompactor), near-duplicates of a message already
+    added are folded into its line as a count instead of taking lines of their own, and
+    low-information messages are left out, so they don't count towards max_messages.
+    """
+
+    def __init__(self, tz, title: str, include_authors: bool = True, max_content: int = 300,
+                 max_messages: Optional[int] = None, compactor=None, align: Optional[int] = 32):
+        self.tz = tz
+        self.title = title
+        self.include_authors = include_authors
+        self.max_content = max_content
+        self.max_messages = max_messages
+        self.compactor = compactor
+        self.align = align
+        self._reference = None
+        self._entries = []  # [(message, "age: content")] newest first
+        self._folds = {}  # {entry index: [copies folded in, oldest copy's time, {author IDs}]}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def full(self) -> bool:
+        return self.max_messages is not None and len(self._entries) >= self.max_messages
+
+    def add(self, msg):
+        created_at = msg.created_at
+        if self._reference is None:
+            self._reference = age_reference(created_at)
+        content = " ".join(msg.content.split())
+        if self.compactor is not None:
+            verdict = self.compactor.admit(content, len(self._entries))
+            if verdict is not None:
+                if verdict >= 0:
+                    fold = self._folds.setdefault(verdict, [0, None, {self._entries[verdict][0].author.id}])
+                    fold[0] += 1
+                    fold[1] = created_at
+                    fold[2].add(msg.author.id)
+                return
+        if len(content) > self.max_content:
+            content = content[:self.max_content] + "..."
+        age = format_age((self._reference - created_at).total_seconds())
+        self._entries.append((msg, f"{age}: {content}"))
+
+    def _window_start(self) -> int:
+        """Number of entries (newest first) in the window: all of them unless a full window is aligned"""
+        count = len(self._entries)
+        if self.align and self.full:
+            for index in range(count - 1, max(-1, count - 1 - 2 * self.align), -1):
+                if is_block_boundary(self._entries[index][0].id, self.align):
+                    return index + 1
+        return count
+
+    def finish(self) -> EncodedHistory:
+        handles = {}  # {author_id: 'A1'}
+        authors = {}
+        number_map = {}
+        lines = []
+        count = self._window_start()
+        for i, (msg, body) in enumerate(reversed(self._entries[:count]), 1):
+            number_map[i] = msg
+            fold = self._folds.get(count - i)
+            if fold is not None:
+                copies, oldest, author_ids = fold
+                first = format_age((self._reference - oldest).total_seconds())
+                posters = f", {len(author_ids)} authors" if len(author_ids) > 1 else ""
+                body = f"{body} (×{copies + 1} similar, first {first}{posters})"
+            if self.include_authors:
+                handle = handles.get(msg.author.id)
+                if handle is None:
+                    handle = handles[msg.author.id] = f"A{len(handles) + 1}"
+                    authors[handle] = msg.author
+                lines.append(f"[{i}] {handle} {body}")
+            else:
+                lines.append(f"[{i}] {body}")
+
+        reference_local = self._reference.astimezone(self.tz)
+        header = [self.title, f"Ages are counted back from {reference_local.strftime('%Y-%m-%d %H:%M %Z')}"]
+        footer = []
+        if authors:
+            footer.append("Authors: " + ", ".join(f"{handle}={author.name}" for handle, author in authors.items()))
+        if any(index < count for index in self._folds):
+            footer.append("Repeated messages are folded into their newest copy, marked (×N similar, first <age of the "
+                          "oldest copy>).")
+        dropped = self.compactor.counters['dropped'] if self.compactor is not None else 0
+        if dropped:
+            footer.append(f"{dropped:,} low-information messages (e.g. bare reactions) left out.")
+        return EncodedHistory("\n".join(header) + "\n", lines, "\n".join(footer), number_map, authors)
+
+
+def encode_history(messages: list, tz, title: str, include_authors: bool = True,
+                   max_content: int = 300) -> EncodedHistory:
+    """
+    Encode messages (oldest to newest) in the compact format described by HISTORY_FORMAT_NOTE.
+    Output is deterministic for the same messages, so repeat requests hit the prompt cache.
+    Only a convenience for callers that already hold a list (block summaries, digests): it feeds
+    HistoryEncoder newest first with no window limit, so there is no separate encoding path.
+    """
+    encoder = HistoryEncoder(tz, title, include_authors=include_authors, max_content=max_content, align=None)
+    for msg in reversed(messages):
+        encoder.add(msg)
+    return encoder.finish()
+
+
+def search_system_prefix(tz_name: str) -> str:
+    """Static instructions for !search (citation rules, emoji and timezone notes)"""
+    return "\n".join([
+        "You answer questions about a Discord channel's message history.",
+        HISTORY_FORMAT_NOTE,
+        "\nIMPORTANT CITATION GUIDELINES:",
+        "- Cite key messages that support your main points (aim for 3-6 total citations)",
+        "- Be selective - don't cite every message, but DO cite your evidence",
+        "- NEVER use ranges like [#5-#10] - only cite individual messages: [#5], [#7], [#10]",
+        "- Use EXACTLY this format: [#N] where N is the message number",
+        "- Examples: [#5] or [#12]. Multiple: [#3], [#7], and [#12]",
+        "- Do NOT add any extra text or context inside the brackets",
+        "\n\nNote: Custom Discord emojis appear as <:emoji_name:emoji_id>. When quoting messages with emojis, preserve this exact format.",
+        f"\n\nNote: All absolute times are in {tz_name} timezone.",
+    ])
+
+
+def history_analysis_system_prefix() -> str:
+    """Static instructions for natural language history analysis (identity, answer-only output contract)"""
+    return "\n".join([
+        (
+            "You are 'gronk', the AI assistant and Discord bot. 'gronk' is a Discord bot interface for interacting with Grok the AI. "
+            "Any mention of 'gronk' or '@gronk' in the following messages refers to you, the AI, and NEVER the user. "
+            "Never refer to the user as 'gronk' or '@gronk'. Always refer to yourself as 'gronk' or '@gronk' when those names are mentioned. "
+            "You are the AI behind the 'gronk' Discord bot, and all responses from 'gronk' are from the AI assistant. "
+            "When referring to users, use only their author handle, never a name and handle together. Avoid redundant references like '@username (user ID @123)'. "
+            "NEVER output patterns like '@useridnumber (which appears to be @gronk)', '@useridnumber (which is @gronk)', or any similar construction. If a user is the bot, always use only '@gronk' and never the user ID or both together.\n"
+        ),
+        "You will be given Discord messages and then the user's query.",
+        HISTORY_FORMAT_NOTE,
+        "\nReply with ONLY your answer as plain text (no JSON, no sources list, no confidence score, no preamble). "
+        "Cite supporting messages inline as [#N]. Only cite the most meaningful and relevant messages (typically 3-6), and do NOT cite every message. "
+        "Message links, mentions and excerpts are filled in for you from the citation numbers - never repeat them.\n",
+        "\nIMPORTANT: For every citation, use ONLY the format [#N] with no channel name, emoji, or extra formatting. Example: [#1], [#2], etc.\n",
+    ])
+
+
+def map_system_prefix() -> str:
+    """Static instructions for the map step of a map-reduce analysis (notes on one part of the history)"""
+    return "\n".join([
+        "You are reading one part of a Discord channel's message history that is too long for a single prompt. "
+        "Other parts are read separately, and a final step combines the notes from every part to answer the user's query.",
+        HISTORY_FORMAT_NOTE,
+        "\nWrite concise notes (at most about 250 words) on everything in THIS part that is relevant to the query: "
+        "who said what, how often, recurring themes and notable quotes. Cite supporting messages inline as [#N] with their exact "
+        "numbers - numbers are shared across all parts. Only report what this part shows. "
+        "If nothing in this part is relevant, reply with exactly: NOTHING RELEVANT",
+    ])
+
+
+# Bump when block_summary_system_prefix changes, so stored block summaries are rewritten
+BLOCK_SUMMARY_PROMPT_VERSION = 1
+
+
+def block_summary_system_prefix() -> str:
+    """Static instructions for question-independent summaries of one block of history (stored and reused)"""
+    return "\n".join([
+        "You summarize one block of a Discord channel's message history. The summary is stored and reused to "
+        "answer many different later questions about the channel, so cover the whole block rather than any one topic.",
+        HISTORY_FORMAT_NOTE,
+        "\nWrite a factual summary (at most about 250 words): each topic discussed and who took part, roughly how many "
+        "messages each active person wrote, decisions, open questions, links shared and notable quotes. Refer to people "
+        "by their name from the Authors legend, not by handle - handles are different in every block. Cite supporting "
+        "messages inline as [#N] with their numbers in this block. No preamble.",
+    ])
+
+
+REDUCE_NOTE = (
+    "The history was too long for one prompt, so it was read in parts. In place of the messages, below are notes on "
+    "each part, oldest part first. Combine them into one answer: add up counts across parts, and keep the [#N] "
+    "citations from the notes - they refer to the original message numbers."
+)
+
+
+def digest_system_prefix() -> str:
+    """Static instructions for writing hourly / daily channel digests"""
+    return "\n".join([
+        "You write short digests of a Discord channel's activity for later \"what happened\" questions.",
+        HISTORY_FORMAT_NOTE,
+        "\nIn the digest, refer to people by their name from the Authors legend, not by handle - handles are not kept. "
+        "Reply with ONLY the digest as plain text (at most about 150 words): the topics discussed, decisions, questions "
+        "left open, and who said the notable things. No preamble and no citations.",
+    ])
+
+
+DIGEST_NOTE = (
+    "Earlier activity is given as digests (summaries of one hour or one day each, oldest first, times in the "
+    "bot's timezone); messages since the last digest follow in full. Answer from both. Only the full messages "
+    "can be cited as [#N]."
+)
+
+
+def analytics_system_prefix() -> str:
+    """Static instructions for narrating activity statistics (the numbers are computed locally)"""
+    return "\n".join([
+        "You are 'gronk', the AI assistant and Discord bot. You will be given statistics computed from this Discord "
+        "server's message archive (exact counts, or sketch estimates marked with ~), then the user's question.",
+        "\nAnswer the question from the statistics in a few natural sentences or a short list. Report the numbers as "
+        "given (keeping a leading ~ on estimates) and never recompute, round differently, estimate or add numbers that "
+        "are not listed. Don't invent members or activity beyond the statistics; if they don't answer the question, say "
+        "what they do show. Mention the period covered when it matters. Refer to members only by their author handle "
+        "(A1, A2, ...) - handles are turned into Discord mentions automatically. Reply with ONLY the answer as plain "
+        "text (no JSON, no preamble).",
+    ])
+
+
+def history_block(header: str, lines: Iterable[str], footer: str = "") -> str:
+    """Join the channel messages under a fixed header, then the footer (callers pass them oldest to newest)"""
+    return "\n".join([header, *lines, *(["\n" + footer] if footer else [])])
+
+
+def assemble_messages(system_prefix: str, query: str, history: Optional[str] = None) -> List[dict]:
+    """Build chat messages in cache-friendly order: system prefix, history block, then the query"""
+    user_content = f"{history}\n\n{query}" if history else query
+    return [
+        {"role": "system", "content": system_prefix},
+        {"role": "user", "content": user_content},
+    ]
+
+
+class PromptCacheTelemetry:
+    """Per request type share of prompt tokens that Grok served from its prompt cache"""
+
+    def __init__(self):
+        self._totals = {}  # {request_type: [requests, prompt_tokens, cached_tokens]}
+
+    def record(self, request_type: str, usage) -> Optional[float]:
+        """Add a completion's usage and log its cached-token ratio"""
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        if not prompt_tokens:
+            return None
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None) or 0
+        totals = self._totals.setdefault(request_type, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += prompt_tokens
+        totals[2] += cached_tokens
+        ratio = cached_tokens / prompt_tokens
+        logger.info(
+            f'Prompt cache [{request_type}]: {cached_tokens}/{prompt_tokens} tokens cached ({ratio:.0%}), '
+            f'running {totals[2] / totals[1]:.0%} over {totals[0]} requests'
+        )
+        return ratio
+
+    def stats(self) -> dict:
+        return {
+            request_type: {
+                'requests': requests,
+                'prompt_tokens': prompt_tokens,
+                'cached_tokens': cached_tokens,
+                'cached_ratio': cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            }
+            for request_type, (requests, prompt_tokens, cached_tokens) in self._totals.items()
+        }
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger('GrokBot')
+
+# Queries whose answer depends on "now" - these must hit live web search instead of the cache
+TIME_SENSITIVE_PATTERN = re.compile(
+    r'\b(today|tonight|tomorrow|yesterday|now|right now|currently|current|latest|newest|recent|recently|'
+    r'this (week|month|year|morning|evening)|breaking|news|live|score|scores|weather|forecast|'
+    r'price|prices|stock|stocks|crypto|btc|bitcoin|eth|election|poll|polls|trending)\b'
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so near-identical questions match"""
+    text = " ".join((prompt or "").lower().split())
+    return text.rstrip(" ?!.")
+
+
+def is_time_sensitive(prompt: str) -> bool:
+    """True if the question is about current events, so a cached answer could be stale"""
+    return bool(TIME_SENSITIVE_PATTERN.search((prompt or "").lower()))
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_url(url: str) -> str:
+    """Drop query strings (Discord CDN signatures change on every fetch)"""
+    return url.split('?', 1)[0].lower()
+
+
+def make_response_cache_key(model: str, prompt: str, image_hashes=(), file_hashes=(), context=None) -> str:
+    """Stable key: model + normalized prompt + attachment content hashes + hash of surrounding context"""
+    context_hash = hashlib.sha256(
+        json.dumps(context, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest() if context else ''
+    material = json.dumps({
+        'model': model,
+        'prompt': normalize_prompt(prompt),
+        'images': sorted(image_hashes),
+        'files': sorted(file_hashes),
+        'context': context_hash,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of raw Grok responses, persisted in the conversation SQLite DB.
+
+    A small in-memory LRU sits in front of the table so hot entries skip the disk entirely
+    (their last_used is only refreshed in SQLite when they fall out of memory and are read again).
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int = 21600, max_entries: int = 5000,
+                 memory_entries: int = 256):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # {key: (created_at, response)}
+        self._puts_since_evict = 0
+        self.counters = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0}
+
+    def init_db(self):
+        """Create the response cache table"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache(last_used)
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _remember(self, key: str, created_at: float, response: str):
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a fresh cached response or None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and now - entry[0] < self.ttl_seconds:
+            self._memory.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+        self._memory.pop(key, None)
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT response, created_at FROM response_cache WHERE cache_key = ?', (key,))
+            row = cursor.fetchone()
+            if row and now - row[1] < self.ttl_seconds:
+                cursor.execute('UPDATE response_cache SET last_used = ?, hits = hits + 1 WHERE cache_key = ?', (now, key))
+                conn.commit()
+                conn.close()
+                self._remember(key, row[1], row[0])
+                self.counters['hits'] += 1
+                return row[0]
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error reading response cache: {e}')
+        self.counters['misses'] += 1
+        return None
+
+    def put(self, key: str, model: str, response: str):
+        """Store a response (evicting expired / least recently used rows now and then)"""
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('''
+                INSERT OR REPLACE INTO response_cache (cache_key, model, response, created_at, last_used, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+            ''', (key, model, response, now, now))
+            conn.commit()
+            conn.close()
+            self._remember(key, now, response)
+            self.counters['stored'] += 1
+        except Exception as e:
+            logger.error(f'Error storing response cache entry: {e}')
+            return
+        self._puts_since_evict += 1
+        if self._puts_since_evict >= 100:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        self._puts_since_evict = 0
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM response_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            expired = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            overflow = cursor.rowcount
+            conn.commit()
+            conn.close()
+            if expired or overflow:
+                logger.info(f'Response cache evicted {expired} expired and {overflow} least recently used entries')
+        except Exception as e:
+            logger.error(f'Error evicting response cache: {e}')
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
@@ -0,0 +1,122 @@
+import re
+from typing import Callable, Optional, Set
+
+# Every rewrite the bot applies to a Grok answer, as one alternation scanned left to right in a
+# single pass. Order matters where alternatives can start at the same position: text that must be
+# left alone (existing mentions, emoji, URLs, already-linked citations) comes first, then
+# citations, then names.
+POSTPROCESS_PATTERN = re.compile(
+    # Cheap first-character filter so most positions are rejected before trying the alternatives
+    r'(?=[<h\[ (A-Z@"g0-9])(?:'
+    r'(?P<keep><[^<>\s]*>|https?://[^\s)>]+|\[#\d+\]\([^)]*\))'
+    r'|(?P<redundant> ?\((?:user ID|which is|which appears to be) ?(?:<@!?\d+>|@\w+|\d{17,20})\))'
+    r'|(?P<range>\[#(?P<range_nums>\d+(?:-#?\d+)+)\])'
+    r'|(?P<cite>\[#(?P<cite_num>\d+)(?:\([^)]*\))?\])'
+    r'|(?P<handle>(?<![\w<@#])A(?P<handle_num>\d+)\b)'
+    r'|(?P<bot>(?<![<\w])@?(?i:gronk)\b)'
+    r'|(?P<user_id>(?<![\w<@/])\d{17,20}\b)'
+    r'|(?P<at>(?<!<)@(?P<at_name>[a-zA-Z0-9_]{2,32})(?!>))'
+    r'|(?P<quoted>"(?P<quoted_name>[a-zA-Z0-9_]{2,32})")'
+    r'|(?P<word>(?<=\s)(?P<word_name>[A-Z][a-zA-Z0-9_]{1,31})(?=[\s,.\']))'
+    r')'
+)
+
+RANGE_SPLIT_PATTERN = re.compile(r'-#?')
+
+# Ranges longer than this are linked by their endpoints only instead of one link per message
+MAX_EXPANDED_RANGE = 10
+
+
+class ResponsePostProcessor:
+    """
+    Resolve citations and mentions in a Grok answer in one linear pass.
+
+    - [#N] and [#N(channel-name)] become links to the numbered message; a bare #N ("issue #123")
+      is left alone
+    - Ranges like [#5-#8] or [#5-#6-#7] become individual links
+    - Author handles (A1, A2, ...) from the compact history legend become mentions
+    - 'gronk' / '@gronk' becomes the bot's mention
+    - Raw user IDs of message authors, @username, "username" and Capitalized names become mentions
+    - Redundant '(user ID ...)' / '(which is ...)' asides are dropped
+    """
+
+    def __init__(self, number_map: Optional[dict] = None, *,
+                 link_format: str = "[#{num}]({link})",
+                 authors: Optional[dict] = None,
+                 bot_mention: Optional[str] = None,
+                 name_lookup: Optional[Callable[[str], Optional[str]]] = None):
+        self.number_map = number_map or {}
+        self.link_format = link_format
+        self.authors = authors or {}
+        self.bot_mention = bot_mention
+        self.name_lookup = name_lookup
+        self._known_user_ids: Optional[Set[str]] = None  # built on the first raw ID seen
+        self.cited: Set[int] = set()
+
+    def _link(self, num: int) -> str:
+        msg = self.number_map.get(num)
+        if msg is None:
+            return f"[#{num}]"
+        self.cited.add(num)
+        return self.link_format.format(num=num, link=msg.jump_url)
+
+    def _user_id(self, user_id: str) -> str:
+        if self._known_user_ids is None:
+            self._known_user_ids = {str(msg.author.id) for msg in self.number_map.values()}
+        return f"<@{user_id}>" if user_id in self._known_user_ids else user_id
+
+    def _name(self, match, group: str) -> str:
+        if self.name_lookup is None:
+            return match.group(0)
+        mention = self.name_lookup(match.group(group).lower())
+        return mention or match.group(0)
+
+    def process(self, text: str) -> str:
+        if not text:
+            return text
+        out = []
+        last = 0
+        last_citation_end = -1
+        for match in POSTPROCESS_PATTERN.finditer(text):
+            kind = match.lastgroup
+            start = match.start()
+            out.append(text[last:start])
+            last = match.end()
+
+            if kind == 'keep':
+                replacement = match.group(0)
+            elif kind == 'redundant':
+                replacement = ''
+            elif kind == 'range':
+                if not self.number_map:
+                    replacement = match.group(0)
+                else:
+                    nums = [int(n) for n in RANGE_SPLIT_PATTERN.split(match.group('range_nums'))]
+                    if len(nums) == 2 and 0 < nums[1] - nums[0] < MAX_EXPANDED_RANGE:
+                        nums = list(range(nums[0], nums[1] + 1))
+                    replacement = "-".join(self._link(num) for num in nums)
+            elif kind == 'cite':
+                replacement = self._link(int(match.group('cite_num'))) if self.number_map else match.group(0)
+            elif kind == 'handle':
+                author = self.authors.get(match.group(0))
+                replacement = author.mention if author else match.group(0)
+            elif kind == 'bot':
+                replacement = self.bot_mention or match.group(0)
+            elif kind == 'user_id':
+                replacement = self._user_id(match.group(0))
+            elif kind == 'at':
+                replacement = self._name(match, 'at_name')
+            elif kind == 'quoted':
+                replacement = self._name(match, 'quoted_name')
+            else:
+                replacement = self._name(match, 'word_name')
+
+            # Keep consecutive citations apart: [#1][#2] -> [#1] [#2]
+            if kind in ('range', 'cite') and start == last_citation_end and replacement:
+                replacement = " " + replacement
+            if kind in ('range', 'cite', 'keep') and replacement.startswith(('[#', ' [#')):
+                last_citation_end = last
+            out.append(replacement)
+        out.append(text[last:])
+        return "".join(out)
+
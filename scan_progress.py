@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger('GrokBot')
+
+
+def format_eta(seconds: float) -> str:
+    """Short remaining-time text: 8s, 2m05s, 1h10m"""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m{seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m"
+
+
+class ScanWaiters:
+    """
+    Requesters sharing one coalesced history scan. The scan skips every requester's command message
+    (not just the first one's), and every requester's status message gets the progress edits.
+    Requesters joining while the scan runs are picked up by its next skip check and progress edit.
+    """
+
+    def __init__(self):
+        self.command_ids = set()
+        self.status_messages = []
+
+    def join(self, command_message, status_message):
+        self.command_ids.add(command_message.id)
+        self.status_messages.append(status_message)
+
+    def leave(self, status_message) -> bool:
+        """Stop editing a requester's status message; True once nobody is waiting any more"""
+        if status_message in self.status_messages:
+            self.status_messages.remove(status_message)
+        return not self.status_messages
+
+
+class ScanProgress:
+    """
+    Progress messages for a long history scan, edited at most once per interval.
+
+    update() only records the latest counts, so it is cheap to call for every message scanned.
+    When the interval has passed and no edit is in flight, one background edit is started with the
+    newest counts; updates arriving meanwhile are coalesced into the next edit. Failed edits are
+    logged and dropped so the scan never waits on Discord.
+
+    `messages` is a live list of status messages (e.g. ScanWaiters.status_messages): all of them get
+    the same text, including ones added after the scan started.
+
+    render(scanned, found, pct, rate, eta) builds the message text. pct and eta are None when the
+    scan has no known total; rate is messages scanned per second.
+    """
+
+    def __init__(self, messages: List, render: Callable[..., str], total: Optional[int] = None,
+                 interval: float = 3.0):
+        self.messages = messages
+        self.render = render
+        self.total = total
+        self.interval = interval
+        self.scanned = 0
+        self.found = 0
+        self.edits = 0
+        self.dropped = 0
+        self._started = time.monotonic()
+        self._last_edit = self._started
+        self._task: Optional[asyncio.Task] = None
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return self.scanned / elapsed if elapsed > 0 else 0.0
+
+    def update(self, scanned: int, found: int):
+        self.scanned = scanned
+        self.found = found
+        now = time.monotonic()
+        if now - self._last_edit < self.interval or (self._task and not self._task.done()):
+            return
+        self._last_edit = now
+        self._task = asyncio.ensure_future(self._edit())
+
+    def _content(self) -> str:
+        rate = self.rate()
+        pct = eta = None
+        if self.total:
+            pct = min(100, int(self.scanned / self.total * 100))
+            eta = format_eta((self.total - self.scanned) / rate) if rate > 0 else None
+        return self.render(self.scanned, self.found, pct, rate, eta)
+
+    async def _edit(self):
+        content = self._content()
+        results = await asyncio.gather(*(message.edit(content=content) for message in list(self.messages)),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.dropped += 1
+                logger.debug(f'Progress update dropped: {result}')
+            else:
+                self.edits += 1
+
+    async def close(self):
+        """Stop updating; cancels an edit still in flight so it can't overwrite the final status"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        elapsed = time.monotonic() - self._started
+        logger.info(
+            f'Scanned {self.scanned:,} messages in {elapsed:.1f}s ({self.rate():,.0f}/s), '
+            f'{self.edits} progress edits, {self.dropped} dropped'
+        )
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger('GrokBot')
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work as its own task; callers arriving while it is
+    still running await the same task. Every caller gets the result (or the exception), and a
+    caller being cancelled does not cancel the shared work for the others.
+    """
+
+    def __init__(self, name: str = 'requests'):
+        self.name = name
+        self._calls = {}  # {key: Task}
+        self.counters = {'executed': 0, 'coalesced': 0}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Run fn() for key, or join the run already in flight for it"""
+        task = self._calls.get(key)
+        if task is None:
+            self.counters['executed'] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.counters['coalesced'] += 1
+            logger.info(f'Coalesced duplicate {self.name} request into the one already in flight')
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return dict(self.counters, in_flight=len(self._calls))
@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import logging
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from activity_analytics import AnalyticsQuestion, AnalyticsResult
+from history_pipeline import AuthorRecord
+
+logger = logging.getLogger('GrokBot')
+
+# Words that don't make a topic on their own (noun chunks are reduced to their content words)
+STOPWORDS = frozenset(
+    "a an the this that these those my your his her its our their some any all every each no other another "
+    "i me you he she it we us they them what which who whom whose one ones lot lots thing things stuff "
+    "something anything everything nothing someone anyone everyone guy guys people time way day today "
+    "much many more most few several such own same".split()
+)
+TERM_WORD_PATTERN = re.compile(r"[\w#+.-]+")
+
+
+def normalize_terms(phrases: Iterable[str]) -> List[str]:
+    """
+    Sketch terms for a message's entities / noun chunks: each phrase without leading determiners,
+    plus each of its content words, lowercased and deduplicated
+    """
+    terms = []
+    for phrase in phrases:
+        words = [word.strip(".-") for word in TERM_WORD_PATTERN.findall(phrase.lower())]
+        words = [word for word in words if word]
+        while words and words[0] in STOPWORDS:
+            words.pop(0)
+        content = [word for word in words if word not in STOPWORDS and len(word) > 1 and not word.isdigit()]
+        if not content:
+            continue
+        if len(words) > 1:
+            terms.append(" ".join(words))
+        terms.extend(content)
+    return list(dict.fromkeys(terms))
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: depth rows of width counters; estimates never undercount. Uses conservative
+    update (only the counters at the current minimum are raised), which cuts overcounting a lot.
+    """
+
+    def __init__(self, width: int = 8192, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), np.int32)
+        self._rows = np.arange(depth)
+
+    def _columns(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return np.frombuffer(digest, np.uint32) % self.width
+
+    def add(self, key: str, count: int = 1):
+        columns = self._columns(key)
+        values = self.table[self._rows, columns]
+        self.table[self._rows, columns] = np.maximum(values, values.min() + count)
+
+    def estimate(self, key: str) -> int:
+        return int(self.table[self._rows, self._columns(key)].min())
+
+
+class SpaceSaving:
+    """Space-saving top-k counter: tracks at most k items; counts of tracked items are upper bounds"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: Dict = {}
+
+    def add(self, item, count: int = 1):
+        """Count item; returns the item it displaced, if any"""
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.k:
+            self.counts[item] = count
+        else:
+            # Replace the smallest; the newcomer inherits its count as possible overcount
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(smallest) + count
+            return smallest
+        return None
+
+    def top(self, n: int) -> List[Tuple[object, int]]:
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+
+class ScopeSketch:
+    """Term frequency sketches of one channel or guild: (member, term) and term counts, heavy hitters"""
+
+    def __init__(self, width: int, depth: int, top_terms: int, top_members: int, member_terms: int):
+        self.pairs = CountMinSketch(width, depth)  # Messages by member mentioning term
+        self.terms = CountMinSketch(width, depth)  # Messages mentioning term
+        self.top_terms = SpaceSaving(top_terms)
+        self.members = SpaceSaving(top_members)  # Most active members (candidates for "who talks about X")
+        self.member_names: Dict[int, str] = {}
+        self.member_top_terms: Dict[int, SpaceSaving] = {}
+        self.member_terms = member_terms
+        self.messages = 0
+        self.since: Optional[int] = None  # Oldest message timestamp ingested
+
+    def add(self, author_id: int, author_name: str, created_at: int, terms: List[str]):
+        self.messages += 1
+        self.since = created_at if self.since is None else min(self.since, created_at)
+        displaced = self.members.add(author_id)
+        # Names and per-member heavy hitters only for members still among the tracked ones
+        if displaced is not None:
+            self.member_names.pop(displaced, None)
+            self.member_top_terms.pop(displaced, None)
+        self.member_names[author_id] = author_name
+        member_top = self.member_top_terms.setdefault(author_id, SpaceSaving(self.member_terms))
+        for term in terms:
+            self.pairs.add(f"{author_id}\x1f{term}")
+            self.terms.add(term)
+            self.top_terms.add(term)
+            member_top.add(term)
+
+    def who_mentions(self, term: str, n: int) -> Tuple[int, List[Tuple[int, str, int]]]:
+        """(estimated messages mentioning term, [(member ID, name, estimated messages)] top n)"""
+        estimates = [
+            (member, self.member_names.get(member, str(member)), self.pairs.estimate(f"{member}\x1f{term}"))
+            for member in self.members.counts
+        ]
+        estimates = [estimate for estimate in estimates if estimate[2]]
+        estimates.sort(key=lambda estimate: -estimate[2])
+        return self.terms.estimate(term), estimates[:n]
+
+
+class TermSketches:
+    """
+    Streaming per-channel and per-guild term frequency sketches fed by the message archive.
+
+    Each newly archived human message is reduced to terms (entities and noun chunks from
+    `extract_phrases`, normally advanced_nlp_parse without intent classification) in a worker
+    thread, and counted into count-min sketches of (member, term) and term, plus space-saving
+    top-k lists of terms, members and each member's terms. "Who talks about X the most" then costs a
+    fixed number of sketch lookups however much history was ingested. Memory is bounded: fixed-size
+    sketches, at most `max_scopes` channels / guilds (least recently updated dropped) and a
+    bounded ingest queue (batches beyond it are dropped and counted).
+    """
+
+    def __init__(self, extract_phrases: Callable[[str], List[str]], width: int = 8192, depth: int = 4,
+                 top_terms: int = 200, top_members: int = 200, member_terms: int = 20,
+                 max_scopes: int = 128, queue_size: int = 100):
+        self.extract_phrases = extract_phrases
+        self.sketch_args = (width, depth, top_terms, top_members, member_terms)
+        self.max_scopes = max_scopes
+        self.scopes: OrderedDict = OrderedDict()  # {('channel' | 'guild', id): ScopeSketch}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.counters = {'messages': 0, 'terms': 0, 'dropped_batches': 0}
+        self._lock = threading.Lock()  # Sketches are updated in a worker thread
+
+    def submit(self, rows: List[tuple]):
+        """Queue newly archived rows (message_id, guild_id, channel_id, author_id, author_name, is_bot, created_at, length, content)"""
+        rows = [row for row in rows if not row[5] and row[8].strip()]
+        if not rows:
+            return
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self.counters['dropped_batches'] += 1
+
+    def _scope(self, key: tuple) -> ScopeSketch:
+        sketch = self.scopes.get(key)
+        if sketch is None:
+            sketch = self.scopes[key] = ScopeSketch(*self.sketch_args)
+            while len(self.scopes) > self.max_scopes:
+                self.scopes.popitem(last=False)
+        self.scopes.move_to_end(key)
+        return sketch
+
+    def ingest(self, rows: List[tuple]):
+        """Extract terms and count them (blocking; run in a worker thread)"""
+        for _, guild_id, channel_id, author_id, author_name, _, created_at, _, content in rows:
+            try:
+                terms = normalize_terms(self.extract_phrases(content))
+            except Exception as e:
+                logger.debug(f'Term extraction failed: {e}')
+                continue
+            scopes = [('channel', channel_id)] + ([('guild', guild_id)] if guild_id is not None else [])
+            with self._lock:
+                for key in scopes:
+                    self._scope(key).add(author_id, author_name, created_at, terms)
+            self.counters['messages'] += 1
+            self.counters['terms'] += len(terms)
+
+    async def run(self):
+        """Consume queued batches forever (start once from on_ready)"""
+        while True:
+            rows = await self.queue.get()
+            try:
+                await asyncio.to_thread(self.ingest, rows)
+            except Exception as e:
+                logger.error(f'Error updating term sketches: {e}')
+
+    def who_mentions(self, guild_id: Optional[int], channel_id: int, term: str, guild_wide: bool = False,
+                     n: int = 10):
+        """(scope sketch, estimated messages mentioning term, top members) or None if the scope has no sketch"""
+        key = ('guild', guild_id) if guild_wide and guild_id is not None else ('channel', channel_id)
+        terms = normalize_terms([term])
+        with self._lock:
+            sketch = self.scopes.get(key)
+            if sketch is None or not sketch.messages or not terms:
+                return None
+            # The whole phrase when it has several words, else the word
+            total, top = sketch.who_mentions(terms[0], n)
+        return sketch, total, top
+
+    def answer(self, question: AnalyticsQuestion, guild_id: Optional[int], channel_id: int,
+               n: int = 10) -> Optional[AnalyticsResult]:
+        """
+        Approximate "who talks about X the most" numbers for an analytics question, or None.
+        Sketches only keep the heaviest hitters, so "the least" questions can't be answered here.
+        """
+        if question.ascending:
+            return None
+        started = time.perf_counter()
+        found = self.who_mentions(guild_id, channel_id, question.term, question.guild_wide, n)
+        if found is None:
+            return None
+        sketch, total, top = found
+        scope = "the whole server" if question.guild_wide and guild_id is not None else "this channel"
+        since = time.strftime('%Y-%m-%d', time.gmtime(sketch.since)) if sketch.since else "the start"
+        authors = {f"A{i}": AuthorRecord(member, name) for i, (member, name, _) in enumerate(top, 1)}
+        lines = [
+            f"Approximate statistics from streaming term sketches: {scope}, {sketch.messages:,} messages from members "
+            f"since {since}. Counts are upper-bound estimates (~), close to exact for frequent terms.",
+            f'Term "{question.term}": ~{total:,} messages mentioning it.',
+        ]
+        if authors:
+            lines.append("Authors: " + ", ".join(f"{handle}={author.name}" for handle, author in authors.items()))
+        lines += [f"{i}. A{i}: ~{count:,} messages mentioning it" for i, (_, _, count) in enumerate(top, 1)]
+        return AnalyticsResult("\n".join(lines), authors, sketch.messages, (time.perf_counter() - started) * 1000)
+
+    def init_db(self, db_path: str):
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS term_sketches (
+                scope TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def save(self, db_path: str):
+        """Persist every scope's sketches (so a restart keeps what was counted)"""
+        try:
+            with self._lock:
+                rows = [(f"{kind}:{scope_id}", pickle.dumps(sketch), time.time())
+                        for (kind, scope_id), sketch in self.scopes.items()]
+            conn = sqlite3.connect(db_path)
+            conn.executemany('INSERT OR REPLACE INTO term_sketches (scope, data, updated_at) VALUES (?, ?, ?)', rows)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f'Error saving term sketches: {e}')
+
+    async def autosave(self, db_path: str, interval: float):
+        """Save the sketches every interval seconds while new messages were counted (start once from on_ready)"""
+        saved = self.counters['messages']
+        while True:
+            await asyncio.sleep(interval)
+            if self.counters['messages'] != saved:
+                saved = self.counters['messages']
+                await asyncio.to_thread(self.save, db_path)
+
+    def load(self, db_path: str):
+        try:
+            conn = sqlite3.connect(db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT scope, data FROM term_sketches ORDER BY updated_at DESC LIMIT ?', (self.max_scopes,))
+            rows = cursor.fetchall()
+            conn.close()
+            for scope, data in reversed(rows):
+                kind, scope_id = scope.split(":", 1)
+                self.scopes[(kind, int(scope_id))] = pickle.loads(data)
+            if rows:
+                logger.info(f'Loaded term sketches for {len(rows)} channels / guilds')
+        except Exception as e:
+            logger.error(f'Error loading term sketches: {e}')
+
+    def stats(self) -> dict:
+        width, depth = self.sketch_args[:2]
+        return dict(
+            self.counters,
+            scopes=len(self.scopes),
+            queued=self.queue.qsize(),
+            sketch_bytes=len(self.scopes) * 2 * width * depth * 4,
+        )
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import timezone
+
+from activity_analytics import ActivityAnalytics, ActivityColumns, parse_analytics_question
+from message_archive import MessageArchive
+
+BASE = 1_700_000_000
+
+
+def archive_row(seq, message_id, author_id, content, channel_id=10, created_at=BASE):
+    return (seq, message_id, channel_id, author_id, f"user{author_id}", created_at, len(content), content)
+
+
+def test_parse_analytics_questions():
+    question = parse_analytics_question("who talks the most about rust in the last 2 weeks?")
+    assert (question.kind, question.term, question.window, question.ascending) == ('rank_term', 'rust', 14 * 86400, False)
+    assert parse_analytics_question("who posts the least on the server").guild_wide
+    assert parse_analytics_question("who posts the least").ascending
+    assert parse_analytics_question("how many messages have I sent?").about_self
+    assert parse_analytics_question("when is this channel most active").kind == 'histogram'
+    assert parse_analytics_question("what is the capital of France") is None
+
+
+def test_columns_grow_and_term_hits_extend_incrementally():
+    columns = ActivityColumns()
+    columns.extend([archive_row(i + 1, 100 + i, i % 3, "Rust rust and crust") for i in range(1000)])
+    assert len(columns.term_hits("rust")) == 2000  # Whole words only, case-insensitive
+    columns.extend([archive_row(1001 + i, 2000 + i, 7, "more rust") for i in range(500)])
+    assert len(columns) == 1500 and columns.last_seq == 1500
+    assert len(columns.message_ids) == 1500 and columns.message_ids[-1] == 2499
+    hits = columns.term_hits("RUST")
+    assert len(hits) == 2500
+    assert set(columns.author_codes[hits[-500:]]) == {columns.code(7)}
+
+
+def test_term_hit_cache_is_bounded():
+    columns = ActivityColumns(max_cached_terms=2)
+    columns.extend([archive_row(1, 1, 1, "a b c")])
+    for term in "abc":
+        columns.term_hits(term)
+    assert list(columns._term_hits) == ['b', 'c']
+
+
+def make_analytics(tmp_path, max_scopes=8):
+    archive = MessageArchive(str(tmp_path / "archive.db"), batch_size=1000)
+    archive.init_db()
+    return archive, ActivityAnalytics(archive, timezone.utc, top_n=5, max_scopes=max_scopes)
+
+
+def test_answer_ranks_members_and_sees_new_messages(tmp_path):
+    archive, analytics = make_analytics(tmp_path)
+    archive._write([(i, 1, 10, 100 + i % 2, f"user{i % 2}", 0, BASE + i, 9, "deploy it" if i % 2 else "hello")
+                    for i in range(1, 11)])
+
+    question = parse_analytics_question("who mentions deploy the most")
+    result = asyncio.run(analytics.answer(question, 1, 10))
+    assert "5 mentions in 5 messages by 1 members" in result.facts
+    assert result.authors["A1"].id == 101
+    assert result.messages_in_scope == 10
+
+    archive._write([(20 + i, 1, 10, 100, "user0", 0, BASE + 20 + i, 6, "deploy") for i in range(7)])
+    result = asyncio.run(analytics.answer(question, 1, 10))
+    assert "12 mentions in 12 messages by 2 members" in result.facts
+    assert result.authors["A1"].id == 100  # 7 messages beat 5
+
+    assert asyncio.run(analytics.answer(question, 2, 10)) is None
+
+
+def test_scopes_are_bounded(tmp_path):
+    archive, analytics = make_analytics(tmp_path, max_scopes=2)
+    archive._write([(guild, guild, 10, 100, "user0", 0, BASE, 5, "hello") for guild in (1, 2, 3)])
+    question = parse_analytics_question("who talks the most")
+    for guild in (1, 2, 3):
+        assert asyncio.run(analytics.answer(question, guild, 10)).messages_in_scope == 1
+    assert list(analytics._columns) == [('guild', 2), ('guild', 3)]
+    assert analytics.stats()['loaded_scopes'] == 2
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from block_summaries import BlockSummaryStore, is_block_boundary, make_block_key, renumber_citations, split_blocks
+
+
+def message(message_id, content="hi"):
+    return SimpleNamespace(id=message_id, content=content, author=SimpleNamespace(id=1, name="sam"))
+
+
+def test_blocks_cover_every_message_in_order():
+    messages = [message(1000 + i) for i in range(1000)]
+    blocks = split_blocks(messages, block_size=50)
+    assert blocks[0][0] == 0 and blocks[-1][1] == len(messages)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(blocks, blocks[1:]))
+    assert all(end - start <= 100 for start, end in blocks)
+
+
+def test_block_boundaries_do_not_depend_on_the_window():
+    messages = [message(5000 + i * 7) for i in range(2000)]
+    full = split_blocks(messages, block_size=40)
+    window = messages[333:1500]
+    shifted = split_blocks(window, block_size=40)
+    ends_full = {messages[end - 1].id for _, end in full}
+    ends_window = [window[end - 1].id for _, end in shifted]
+    # From the first ID-hashed boundary on, the window's blocks are the full scan's blocks
+    first = next(i for i, end in enumerate(ends_window) if is_block_boundary(end, 40))
+    assert len(ends_window) - first > 10
+    assert all(end in ends_full for end in ends_window[first:-1])
+
+
+def test_block_key_changes_with_content_model_and_version():
+    block = [message(1), message(2, "hello")]
+    key = make_block_key(block, 'grok', 1)
+    assert make_block_key([message(1), message(2, "hello")], 'grok', 1) == key
+    assert make_block_key([message(1), message(2, "edited")], 'grok', 1) != key
+    assert make_block_key(block, 'grok-mini', 1) != key
+    assert make_block_key(block, 'grok', 2) != key
+
+
+def test_renumber_citations_shifts_every_form():
+    text = "Alice asked [#1], Bob replied [#2-#4] and [#3, #5]; see also #7 and [#2–#3]."
+    assert renumber_citations(text, 100) == (
+        "Alice asked [#101], Bob replied [#102-#104] and [#103, #105]; see also #7 and [#102–#103]."
+    )
+    assert renumber_citations(text, 0) == text
+
+
+def test_store_round_trip_and_eviction(tmp_path):
+    store = BlockSummaryStore(str(tmp_path / "blocks.db"), max_entries=2)
+    store.init_db()
+    for i, key in enumerate(("a", "b", "c")):
+        store.put(key, 'grok', 1, i, i, 1, f"summary {key}")
+    assert store.get_many(["a", "b", "c", "missing"])["c"] == "summary c"
+    store.evict()
+    assert len(store.get_many(["a", "b", "c"])) == 2
@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from channel_digests import (DAY, HOUR, Digest, DigestState, DigestStore, digest_history_block, local_day_start,
+                             parse_summary_window)
+
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+def test_plain_summary_questions_give_their_window():
+    assert parse_summary_window("summarize the last week") == 7 * DAY
+    assert parse_summary_window("Can you recap the past 3 days?") == 3 * DAY
+    assert parse_summary_window("what happened in the channel today") == DAY
+    assert parse_summary_window("catch me up on the last few hours") == 3 * HOUR
+    assert parse_summary_window("what did we miss this month?") == 30 * DAY
+
+
+def test_filtered_questions_are_not_summary_windows():
+    assert parse_summary_window("summarize what alice said about rust last week") is None
+    assert parse_summary_window("who talked the most last week") is None
+    assert parse_summary_window("summarize the discussion") is None
+
+
+def test_local_day_start_is_local_midnight():
+    noon = int(datetime(2026, 7, 1, 12, 30, tzinfo=NEW_YORK).timestamp())
+    assert local_day_start(noon, NEW_YORK) == int(datetime(2026, 7, 1, tzinfo=NEW_YORK).timestamp())
+
+
+def test_local_day_start_across_dst_changes():
+    # Spring forward (23-hour day) and fall back (25-hour day) in New York
+    for day in (datetime(2026, 3, 8), datetime(2026, 11, 1)):
+        midnight = int(day.replace(tzinfo=NEW_YORK).timestamp())
+        evening = int(day.replace(hour=22, tzinfo=NEW_YORK).timestamp())
+        assert local_day_start(evening, NEW_YORK) == midnight
+        assert datetime.fromtimestamp(local_day_start(evening, NEW_YORK), NEW_YORK).hour == 0
+
+
+def make_store(tmp_path):
+    store = DigestStore(str(tmp_path / "digests.db"))
+    store.init_db()
+    return store
+
+
+def digest(granularity, start, length, summary, count=10):
+    return Digest(granularity, start, start + length, start, start + length - 1, count, summary)
+
+
+def test_cover_combines_days_then_later_hours(tmp_path):
+    store = make_store(tmp_path)
+    day_start = 1_700_006_400  # A UTC midnight
+    store.put(1, digest('day', day_start - DAY, DAY, "day one"), 'grok')
+    store.put(1, digest('day', day_start, DAY, "day two"), 'grok')
+    for hour in range(3):
+        store.put(1, digest('hour', day_start + hour * HOUR, HOUR, f"day two hour {hour}"), 'grok')
+        store.put(1, digest('hour', day_start + DAY + hour * HOUR, HOUR, f"day three hour {hour}"), 'grok')
+    store.set_state(1, DigestState(day_start - DAY, day_start + DAY + 3 * HOUR, 99))
+
+    digests, state = store.cover(1, day_start - DAY)
+    assert [d.summary for d in digests] == ["day one", "day two", "day three hour 0", "day three hour 1",
+                                            "day three hour 2"]
+    assert state.last_message_id == 99
+    # Digests that don't reach back far enough can't answer
+    assert store.cover(1, day_start - 2 * DAY) is None
+    assert store.cover(2, day_start) is None
+
+
+def test_cleanup_drops_rolled_up_hours_and_old_days(tmp_path):
+    store = make_store(tmp_path)
+    now = int(time.time())
+    old_day = now - now % DAY - 10 * DAY
+    store.put(1, digest('day', old_day, DAY, "old day"), 'grok')
+    store.put(1, digest('hour', old_day, HOUR, "rolled up hour"), 'grok')
+    store.put(1, digest('hour', now - 5 * DAY, HOUR, "hour without a day"), 'grok')
+    store.put(1, digest('day', now - now % DAY - DAY, DAY, "yesterday"), 'grok')
+    store.set_state(1, DigestState(old_day, now, 1))
+
+    store.cleanup(hourly_retention=2 * DAY, daily_retention=7 * DAY)
+    remaining = [d.summary for granularity in ('day', 'hour') for d in store.digests(1, granularity)]
+    assert remaining == ["yesterday", "hour without a day"]
+    assert store.get_state(1).covered_from >= now - 7 * DAY - 1
+    assert store.stats() == {'channels': 1, 'hourly': 1, 'daily': 1}
+
+
+def test_history_block_labels_days_and_hours():
+    day_start = int(datetime(2026, 1, 6, tzinfo=timezone.utc).timestamp())
+    block = digest_history_block([
+        digest('day', day_start, DAY, "launch planning", 812),
+        digest('hour', day_start + DAY + 14 * HOUR, HOUR, "release went out", 40),
+    ], timezone.utc)
+    assert block.splitlines() == [
+        "Digests:",
+        "[2026-01-06 (day), 812 messages] launch planning",
+        "[2026-01-07 14:00, 40 messages] release went out",
+    ]
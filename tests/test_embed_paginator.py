@@ -0,0 +1,45 @@
+import re
+
+from embed_paginator import UNBREAKABLE_PATTERN, paginate_text
+
+
+def test_short_text_is_one_page():
+    assert paginate_text("  hello  ", 100) == ["hello"]
+    assert paginate_text("   ", 100) == []
+
+
+def test_pages_respect_the_limit_and_keep_all_words():
+    text = " ".join(f"word{i}" for i in range(2000))
+    pages = paginate_text(text, 500)
+    assert all(len(page) <= 500 for page in pages)
+    assert " ".join(pages).split() == text.split()
+
+
+def test_prefers_paragraph_breaks():
+    first = "a" * 300
+    text = f"{first}\n\n{'b ' * 200}"
+    pages = paginate_text(text, 500)
+    assert pages[0] == first
+
+
+def test_never_breaks_inside_links_or_mentions():
+    link = "[#12](https://discord.com/channels/1/2/123456789012345678)"
+    parts = []
+    for i in range(200):
+        parts.append(f"point {i} {link} by <@123456789012345678> see https://example.com/page/{i}")
+    text = " ".join(parts)
+    for limit in (97, 150, 333, 1000):
+        pages = paginate_text(text, limit)
+        assert all(len(page) <= limit for page in pages)
+        for page in pages:
+            # Every link, mention and URL on a page is complete
+            assert page.count("[#12](") == page.count(link)
+            assert len(re.findall(r"<@\d+>", page)) == page.count("<@")
+        assert sum(len(UNBREAKABLE_PATTERN.findall(page)) for page in pages) == len(UNBREAKABLE_PATTERN.findall(text))
+
+
+def test_unbreakable_span_longer_than_a_page_is_cut():
+    url = "https://example.com/" + "x" * 300
+    pages = paginate_text(url, 100)
+    assert "".join(pages) == url
+    assert all(len(page) <= 100 for page in pages)
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+import grok_resilience
+from grok_resilience import CircuitBreaker, CircuitOpenError, GrokResilience
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    """API error carrying an HTTP status, like openai.APIStatusError"""
+
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+        self.response = None
+
+
+def failing(*errors, result='ok'):
+    """Attempt factory raising the given errors in turn, then returning result"""
+    remaining = list(errors)
+    calls = []
+
+    async def attempt(on_dispatch):
+        calls.append(1)
+        on_dispatch()
+        if remaining:
+            raise remaining.pop(0)
+        return result
+
+    attempt.calls = calls
+    return attempt
+
+
+def test_breaker_opens_after_threshold_and_recovers(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_resilience.time, 'monotonic', clock)
+    breaker = CircuitBreaker(threshold=3, cooldown=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    breaker.before_call()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one probe at a time
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_failed_probe_reopens_breaker(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_resilience.time, 'monotonic', clock)
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now += 29
+    assert breaker.state == 'open'
+
+
+def test_released_probe_lets_another_request_through(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_resilience.time, 'monotonic', clock)
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == 'half-open'
+
+
+def test_transient_errors_are_retried():
+    resilience = GrokResilience(max_retries=3, base_delay=0)
+    attempt = failing(StatusError(503), StatusError(500))
+    assert asyncio.run(resilience.call(attempt)) == 'ok'
+    assert len(attempt.calls) == 3
+    assert resilience.counters['retries'] == 2 and resilience.counters['success_after_retry'] == 1
+    assert resilience.breaker.state == 'closed'
+
+
+def test_server_errors_open_the_breaker():
+    resilience = GrokResilience(max_retries=10, base_delay=0, breaker_threshold=3)
+    attempt = failing(*[StatusError(500)] * 5)
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.call(attempt))
+    assert len(attempt.calls) == 3
+    assert resilience.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call(failing()))
+    assert resilience.counters['short_circuited'] == 1
+
+
+def test_rate_limits_pause_instead_of_tripping_the_breaker():
+    paused = []
+    resilience = GrokResilience(max_retries=5, base_delay=0, breaker_threshold=2, on_rate_limited=paused.append)
+    attempt = failing(*[StatusError(429)] * 4)
+    assert asyncio.run(resilience.call(attempt)) == 'ok'
+    assert len(paused) == 4
+    assert resilience.breaker.state == 'closed' and resilience.breaker.failures == 0
+
+
+def test_caller_errors_are_not_retried_and_leave_the_breaker_alone():
+    resilience = GrokResilience(max_retries=3, base_delay=0, breaker_threshold=2)
+    resilience.breaker.record_failure()
+    attempt = failing(StatusError(400))
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.call(attempt))
+    assert len(attempt.calls) == 1
+    # Neither counted as a failure nor as a success that would reset the count
+    assert resilience.breaker.failures == 1
+    assert resilience.counters['failures'] == 1
+
+
+def test_latency_samples_exclude_queue_wait():
+    resilience = GrokResilience(hedge_enabled=False)
+
+    async def attempt(on_dispatch):
+        await asyncio.sleep(0.2)  # Waiting in the scheduler's queue
+        on_dispatch()
+        await asyncio.sleep(0.02)  # Upstream
+        return 'ok'
+
+    asyncio.run(resilience.call(attempt))
+    assert len(resilience.latency.samples) == 1
+    assert resilience.latency.samples[0] < 0.15
+
+
+def test_slow_request_is_hedged():
+    resilience = GrokResilience(hedge_enabled=True, hedge_min_samples=5)
+    for _ in range(5):
+        resilience.latency.record(0.01)
+    started = []
+
+    async def attempt(on_dispatch):
+        on_dispatch()
+        started.append(1)
+        # The first attempt hangs; the hedged duplicate answers quickly
+        await asyncio.sleep(10 if len(started) == 1 else 0)
+        return len(started)
+
+    assert asyncio.run(resilience.call(attempt, hedge=True)) == 2
+    assert resilience.counters['hedges_sent'] == 1 and resilience.counters['hedges_won'] == 1
@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+import grok_scheduler
+from grok_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, GrokScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingClient:
+    """Stands in for the OpenAI client; records the order requests go upstream"""
+
+    def __init__(self):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **params):
+        self.calls.append(params['name'])
+        return SimpleNamespace(usage=None, name=params['name'])
+
+
+def request(name):
+    return {'name': name, 'messages': [{'role': 'user', 'content': 'hi'}], 'max_tokens': 10}
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_scheduler.time, 'monotonic', clock)
+    bucket = TokenBucket(60)  # One unit per second
+    assert bucket.wait_time(60) == 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == 1.0
+    clock.now += 0.5
+    assert bucket.wait_time(1) == 0.5
+    clock.now += 10
+    assert bucket.wait_time(10) == 0.0
+    clock.now += 1000
+    assert bucket.tokens <= bucket.capacity and bucket.wait_time(60) == 0.0
+
+
+def test_token_bucket_caps_requests_larger_than_capacity(monkeypatch):
+    monkeypatch.setattr(grok_scheduler.time, 'monotonic', FakeClock())
+    bucket = TokenBucket(100)
+    # An oversized request waits for a full bucket instead of forever
+    assert bucket.wait_time(1000) == 0.0
+    bucket.consume(1000)
+    assert bucket.tokens == 0.0
+
+
+def test_token_bucket_adjust_and_drain(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_scheduler.time, 'monotonic', clock)
+    bucket = TokenBucket(60)
+    bucket.consume(30)
+    bucket.adjust(-20)  # The request cost 20 less than estimated
+    assert bucket.tokens == 50
+    bucket.drain(5)
+    assert bucket.wait_time(1) == 6.0  # 5 s drained plus one unit
+
+
+def run_scheduler(jobs, **kwargs):
+    """Submit (name, priority, guild_id) jobs together and return the upstream order"""
+    client = RecordingClient()
+
+    async def main():
+        scheduler = GrokScheduler(client, max_concurrency=1, **kwargs)
+        await asyncio.gather(*(
+            scheduler.submit(request(name), priority=priority, guild_id=guild_id)
+            for name, priority, guild_id in jobs
+        ))
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    return client.calls, scheduler
+
+
+def test_guilds_are_served_round_robin():
+    calls, _ = run_scheduler([
+        ('a1', PRIORITY_INTERACTIVE, 1),
+        ('a2', PRIORITY_INTERACTIVE, 1),
+        ('a3', PRIORITY_INTERACTIVE, 1),
+        ('b1', PRIORITY_INTERACTIVE, 2),
+        ('c1', PRIORITY_INTERACTIVE, 3),
+    ])
+    assert calls == ['a1', 'b1', 'c1', 'a2', 'a3']
+
+
+def test_interactive_requests_go_before_bulk():
+    calls, scheduler = run_scheduler([
+        ('bulk1', PRIORITY_BULK, 1),
+        ('bulk2', PRIORITY_BULK, 1),
+        ('chat', PRIORITY_INTERACTIVE, 2),
+    ])
+    assert calls == ['chat', 'bulk1', 'bulk2']
+    stats = scheduler.stats()
+    assert stats['completed'] == 3 and stats['in_flight'] == 0
+    assert stats['interactive_queued'] == 0 and stats['bulk_queued'] == 0
+
+
+def test_bulk_waiting_too_long_is_promoted(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_scheduler.time, 'monotonic', clock)
+    scheduler = GrokScheduler(RecordingClient(), bulk_max_wait=30)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        scheduler._queues[PRIORITY_BULK][1] = grok_scheduler.deque([
+            grok_scheduler._Job(request('bulk'), PRIORITY_BULK, 1, 'bulk', 10, loop.create_future())
+        ])
+        clock.now += 1
+        scheduler._queues[PRIORITY_INTERACTIVE][2] = grok_scheduler.deque([
+            grok_scheduler._Job(request('chat'), PRIORITY_INTERACTIVE, 2, 'chat', 10, loop.create_future())
+        ])
+        assert scheduler._peek().request_params['name'] == 'chat'
+        clock.now += 31
+        assert scheduler._peek().request_params['name'] == 'bulk'
+
+    asyncio.run(main())
+
+
+def test_pause_holds_back_dispatching(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(grok_scheduler.time, 'monotonic', clock)
+    scheduler = GrokScheduler(RecordingClient(), requests_per_minute=60)
+    scheduler.pause(5)
+    assert scheduler.request_bucket.wait_time(1) == 6.0
+    clock.now += 6
+    assert scheduler.request_bucket.wait_time(1) == 0.0
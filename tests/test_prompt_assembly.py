@@ -0,0 +1,70 @@
+from datetime import timezone
+
+from block_summaries import is_block_boundary
+from history_pipeline import AuthorRecord, MessageRecord
+from prompt_assembly import HistoryEncoder, age_reference, encode_history, format_age
+
+BASE = 1_700_000_000
+AUTHORS = [AuthorRecord(100 + i, f"user{i}") for i in range(3)]
+
+
+def make_messages(count, start_id=1):
+    """Oldest first, one minute apart"""
+    return [MessageRecord(start_id + i, AUTHORS[i % 3], BASE + 60 * i, f"message {start_id + i}", "https://x/1/2")
+            for i in range(count)]
+
+
+def encode_window(messages, max_messages, align=32):
+    encoder = HistoryEncoder(timezone.utc, "History", max_messages=max_messages, align=align)
+    for msg in reversed(messages):
+        if encoder.full:
+            break
+        encoder.add(msg)
+    return encoder.finish()
+
+
+def test_format_age():
+    assert [format_age(s) for s in (30, 45 * 60, 5 * 3600 + 12 * 60, 3 * 86400 + 4 * 3600)] == ["0m", "45m", "5h12m", "3d4h"]
+
+
+def test_age_reference_rounds_up_to_the_hour():
+    newest = make_messages(1)[0].created_at
+    reference = age_reference(newest)
+    assert reference >= newest and reference.minute == 0 and (reference - newest).total_seconds() < 3600
+
+
+def test_lines_are_numbered_oldest_first_with_legend_after():
+    encoded = encode_history(make_messages(4), timezone.utc, "History")
+    assert [line.split(" ")[0:2] for line in encoded.lines] == [["[1]", "A1"], ["[2]", "A2"], ["[3]", "A3"], ["[4]", "A1"]]
+    assert encoded.number_map[1].id == 1 and encoded.number_map[4].id == 4
+    assert encoded.footer == "Authors: A1=user0, A2=user1, A3=user2"
+    assert encoded.text.index("[4]") < encoded.text.index("Authors:")
+    assert encoded.authors["A2"] is AUTHORS[1]
+
+
+def test_new_messages_only_add_to_the_end():
+    messages = make_messages(10)
+    before = encode_history(messages[:8], timezone.utc, "History")
+    after = encode_history(messages, timezone.utc, "History")
+    assert after.lines[:8] == before.lines
+    assert after.text.startswith(before.text[:before.text.index("Authors:")].rstrip())
+
+
+def test_aligned_full_window_starts_at_a_block_boundary():
+    messages = make_messages(600)
+    encoded = encode_window(messages, max_messages=200, align=16)
+    assert 200 - 2 * 16 <= len(encoded.lines) <= 200
+    assert is_block_boundary(encoded.number_map[1].id, 16)
+
+
+def test_aligned_window_keeps_its_prefix_while_sliding():
+    messages = make_messages(600)
+    first = encode_window(messages[:500], max_messages=200, align=16)
+    # A few newer messages arrive: the window only moves when its oldest boundary drops out
+    same_start = 0
+    for extra in range(1, 6):
+        later = encode_window(messages[:500 + extra], max_messages=200, align=16)
+        if later.number_map[1].id == first.number_map[1].id:
+            same_start += 1
+            assert later.lines[:len(first.lines)] == first.lines
+    assert same_start
@@ -0,0 +1,82 @@
+import response_cache
+from response_cache import (ResponseCache, hash_bytes, is_time_sensitive, make_response_cache_key,
+                            normalize_prompt, normalize_url)
+
+
+def test_near_identical_prompts_share_a_key():
+    assert normalize_prompt("  What is   the Speed of light?? ") == "what is the speed of light"
+    assert (make_response_cache_key('grok', "What is the speed of light?", context={'a': 1})
+            == make_response_cache_key('grok', "what is  the speed of light", context={'a': 1}))
+
+
+def test_key_covers_model_context_and_attachments():
+    base = make_response_cache_key('grok', "hi")
+    assert make_response_cache_key('grok-mini', "hi") != base
+    assert make_response_cache_key('grok', "hi", context=[{'role': 'user', 'content': 'earlier'}]) != base
+    assert make_response_cache_key('grok', "hi", image_hashes=['a']) != base
+    assert make_response_cache_key('grok', "hi", file_hashes=['a']) != base
+    # Attachment order doesn't matter
+    assert (make_response_cache_key('grok', "hi", file_hashes=['a', 'b'])
+            == make_response_cache_key('grok', "hi", file_hashes=['b', 'a']))
+
+
+def test_documents_are_keyed_on_content():
+    # The same bytes re-uploaded under another name or CDN URL hit the same entry
+    first = make_response_cache_key('grok', "summarize", file_hashes=[hash_bytes(b"report body")])
+    again = make_response_cache_key('grok', "summarize", file_hashes=[hash_bytes(b"report body")])
+    edited = make_response_cache_key('grok', "summarize", file_hashes=[hash_bytes(b"report body v2")])
+    assert first == again and first != edited
+
+
+def test_signed_urls_normalize_to_one_address():
+    assert (normalize_url("https://cdn.discordapp.com/a/B.png?ex=1&hm=2")
+            == normalize_url("https://cdn.discordapp.com/a/b.png?ex=3&hm=4"))
+
+
+def test_time_sensitive_questions_are_detected():
+    assert is_time_sensitive("What's the weather today?")
+    assert is_time_sensitive("latest bitcoin price")
+    assert not is_time_sensitive("Explain photosynthesis")
+
+
+def make_cache(tmp_path, **kwargs):
+    cache = ResponseCache(str(tmp_path / "cache.db"), **kwargs)
+    cache.init_db()
+    return cache
+
+
+def test_put_and_get_round_trip_through_sqlite(tmp_path):
+    cache = make_cache(tmp_path, memory_entries=1)
+    cache.put('k1', 'grok', 'answer one')
+    cache.put('k2', 'grok', 'answer two')  # Pushes k1 out of the memory layer
+    assert cache.get('k1') == 'answer one'
+    assert cache.get('k2') == 'answer two'
+    assert cache.get('missing') is None
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.put('k', 'grok', 'answer')
+    now[0] += 59
+    assert cache.get('k') == 'answer'
+    now[0] += 2
+    assert cache.get('k') is None
+    # A fresh instance (memory layer empty) sees the row as expired too
+    assert make_cache(tmp_path, ttl_seconds=60).get('k') is None
+
+
+def test_evict_drops_expired_and_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = make_cache(tmp_path, ttl_seconds=100, max_entries=2)
+    cache.put('old', 'grok', 'x')
+    now[0] += 150
+    for key in ('a', 'b', 'c'):
+        now[0] += 1
+        cache.put(key, 'grok', key)
+    cache.evict()
+    fresh = make_cache(tmp_path, ttl_seconds=100)
+    assert [fresh.get(key) for key in ('old', 'a', 'b', 'c')] == [None, None, 'b', 'c']
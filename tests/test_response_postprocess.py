@@ -0,0 +1,53 @@
+from history_pipeline import AuthorRecord, MessageRecord
+from response_postprocess import ResponsePostProcessor
+
+ALICE = AuthorRecord(123456789012345678, "alice")
+BOB = AuthorRecord(223456789012345678, "bob")
+
+
+def make_processor(**kwargs):
+    number_map = {n: MessageRecord(1000 + n, ALICE if n % 2 else BOB, 0, "", "https://discord.com/channels/1/2")
+                  for n in range(1, 21)}
+    return ResponsePostProcessor(number_map, authors={"A1": ALICE, "A2": BOB}, **kwargs)
+
+
+def test_bracketed_citations_become_links():
+    processor = make_processor()
+    assert processor.process("See [#3].") == "See [#3](https://discord.com/channels/1/2/1003)."
+    assert processor.process("[#4(general)]") == "[#4](https://discord.com/channels/1/2/1004)"
+    assert processor.cited == {3, 4}
+
+
+def test_bare_hash_numbers_are_left_alone():
+    processor = make_processor()
+    assert processor.process("Fixed in issue #3 and PR #12") == "Fixed in issue #3 and PR #12"
+    assert not processor.cited
+
+
+def test_ranges_expand_to_individual_links():
+    text = make_processor(link_format="<{num}>").process("[#3-#5] and [#1-#20]")
+    assert text == "<3>-<4>-<5> and <1>-<20>"
+
+
+def test_consecutive_citations_are_kept_apart():
+    assert make_processor(link_format="[#{num}]").process("[#1][#2]") == "[#1] [#2]"
+
+
+def test_unknown_citations_stay_plain():
+    assert make_processor().process("[#99]") == "[#99]"
+
+
+def test_handles_ids_and_bot_name_become_mentions():
+    processor = make_processor(bot_mention="<@42>")
+    text = processor.process("A1 asked gronk, and 223456789012345678 replied (user ID 223456789012345678)")
+    assert text == f"<@{ALICE.id}> asked <@42>, and <@{BOB.id}> replied"
+
+
+def test_existing_mentions_and_urls_are_kept():
+    text = "<@1> posted https://example.com/A1 and [#2](https://x)"
+    assert make_processor().process(text) == text
+
+
+def test_names_resolve_through_lookup():
+    processor = make_processor(name_lookup={"carol": "<@7>"}.get)
+    assert processor.process('Ask @carol or "carol", or Carol.') == 'Ask <@7> or <@7>, or <@7>.'
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from scan_progress import ScanProgress, ScanWaiters
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flights.do('key', work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['result'] * 5
+    assert len(runs) == 1
+    assert flights.counters == {'executed': 1, 'coalesced': 4}
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_different_keys_and_later_calls_run_again():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        return len(runs)
+
+    async def main():
+        first = await asyncio.gather(flights.do('a', work), flights.do('b', work))
+        later = await flights.do('a', work)
+        return first, later
+
+    assert asyncio.run(main()) == ([1, 2], 3)
+
+
+def test_every_caller_gets_the_exception():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0)
+        raise ValueError('boom')
+
+    async def main():
+        return await asyncio.gather(flights.do('k', work), flights.do('k', work), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        first = asyncio.ensure_future(flights.do('k', work))
+        second = asyncio.ensure_future(flights.do('k', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 'done'
+
+
+class StatusMessage:
+    def __init__(self, message_id):
+        self.id = message_id
+        self.contents = []
+
+    async def edit(self, content):
+        self.contents.append(content)
+
+
+def test_waiters_collect_every_command_and_status_message():
+    waiters = ScanWaiters()
+    first, second = StatusMessage(11), StatusMessage(12)
+    waiters.join(StatusMessage(1), first)
+    waiters.join(StatusMessage(2), second)
+    assert waiters.command_ids == {1, 2}
+    assert not waiters.leave(first)
+    assert waiters.leave(second)
+    # The scan keeps skipping commands of requesters that already left
+    assert waiters.command_ids == {1, 2}
+
+
+def test_progress_reaches_requesters_who_join_mid_scan():
+    waiters = ScanWaiters()
+    first, second = StatusMessage(11), StatusMessage(12)
+    waiters.join(StatusMessage(1), first)
+
+    async def main():
+        progress = ScanProgress(waiters.status_messages, lambda scanned, *_: f"scanned {scanned}", interval=0)
+        progress.update(10, 1)
+        await asyncio.sleep(0.01)
+        waiters.join(StatusMessage(2), second)
+        progress.update(20, 2)
+        await asyncio.sleep(0.01)
+        await progress.close()
+        return progress
+
+    progress = asyncio.run(main())
+    assert first.contents == ["scanned 10", "scanned 20"]
+    assert second.contents == ["scanned 20"]
+    assert progress.edits == 3 and progress.dropped == 0
+
+
+def test_scan_skips_all_waiting_commands():
+    from datetime import datetime, timedelta, timezone
+    from types import SimpleNamespace
+
+    from history_pipeline import HistoryScan
+    from prompt_assembly import HistoryEncoder
+
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    author = SimpleNamespace(id=5, name='sam', bot=False)
+    messages = [SimpleNamespace(id=i, author=author, content=f"message {i}", created_at=now - timedelta(minutes=i))
+                for i in (4, 3, 2, 1)]
+
+    class Channel:
+        id = 7
+        guild = SimpleNamespace(id=9)
+
+        async def history(self, **_):
+            for msg in messages:
+                yield msg
+
+    waiters = ScanWaiters()
+    waiters.join(SimpleNamespace(id=4), StatusMessage(40))
+    waiters.join(SimpleNamespace(id=3), StatusMessage(30))
+    scan = HistoryScan(Channel(), limit=10, matches=lambda msg: True,
+                       encoder=HistoryEncoder(timezone.utc, "Messages:"), skip_ids=waiters.command_ids)
+    encoded = asyncio.run(scan.run())
+    assert scan.scanned == 2
+    assert [msg.id for msg in encoded.number_map.values()] == [1, 2]
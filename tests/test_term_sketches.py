@@ -0,0 +1,98 @@
+import random
+from collections import Counter
+
+from activity_analytics import AnalyticsQuestion
+from term_sketches import CountMinSketch, SpaceSaving, TermSketches, normalize_terms
+
+
+def test_normalize_terms_keeps_phrases_and_content_words():
+    assert normalize_terms(["the Rust compiler", "it", "2024", "Rust"]) == ["rust compiler", "rust", "compiler"]
+
+
+def test_count_min_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=4)  # Small, so collisions are certain
+    rng = random.Random(7)
+    truth = Counter(f"term{rng.randrange(500)}" for _ in range(5000))
+    for term, count in truth.items():
+        sketch.add(term, count)
+    assert all(sketch.estimate(term) >= count for term, count in truth.items())
+    assert sketch.estimate("never added") >= 0
+
+
+def test_count_min_is_exact_without_collisions():
+    sketch = CountMinSketch(width=8192, depth=4)
+    for _ in range(3):
+        sketch.add("python")
+    sketch.add("rust", 5)
+    assert sketch.estimate("python") == 3 and sketch.estimate("rust") == 5
+
+
+def test_space_saving_finds_heavy_hitters():
+    top = SpaceSaving(k=5)
+    rng = random.Random(3)
+    stream = ["heavy1"] * 300 + ["heavy2"] * 200 + [f"noise{rng.randrange(1000)}" for _ in range(400)]
+    rng.shuffle(stream)
+    for item in stream:
+        top.add(item)
+    assert len(top.counts) == 5
+    ranked = [item for item, _ in top.top(2)]
+    assert ranked == ["heavy1", "heavy2"]
+    # Tracked counts are upper bounds
+    assert top.counts["heavy1"] >= 300 and top.counts["heavy2"] >= 200
+
+
+def test_space_saving_reports_the_displaced_item():
+    top = SpaceSaving(k=2)
+    assert top.add("a") is None and top.add("b", 2) is None
+    assert top.add("c") == "a"
+    assert top.counts == {"b": 2, "c": 2}
+
+
+def row(message_id, author_id, content, channel_id=10, guild_id=1, is_bot=0):
+    return (message_id, guild_id, channel_id, author_id, f"user{author_id}", is_bot, 1_700_000_000 + message_id,
+            len(content), content)
+
+
+def make_sketches(**kwargs):
+    # Phrases are just the message's words here (advanced_nlp_parse in the bot)
+    return TermSketches(lambda text: text.split(), **kwargs)
+
+
+def test_who_mentions_ranks_members_by_term():
+    sketches = make_sketches()
+    rows = [row(i, 1, "rust is great") for i in range(6)]
+    rows += [row(10 + i, 2, "I like rust") for i in range(3)]
+    rows += [row(20 + i, 3, "python please", channel_id=11) for i in range(4)]
+    rows.append(row(30, 4, "rust rust", is_bot=1))  # Bots are not counted
+    sketches.submit(rows)
+    sketches.ingest(sketches.queue.get_nowait())
+
+    _, total, top = sketches.who_mentions(1, 10, "Rust")
+    assert total == 9
+    assert [(member, count) for member, _, count in top] == [(1, 6), (2, 3)]
+    # Guild-wide scope includes other channels; channel scope doesn't
+    assert sketches.who_mentions(1, 10, "python")[1] == 0
+    assert sketches.who_mentions(1, 10, "python", guild_wide=True)[1] == 4
+
+    result = sketches.answer(AnalyticsQuestion('rank_term', term="rust"), 1, 10)
+    assert "~9 messages mentioning it" in result.facts
+    assert result.authors["A1"].id == 1
+    assert sketches.answer(AnalyticsQuestion('rank_term', term="rust", ascending=True), 1, 10) is None
+
+
+def test_sketches_survive_save_and_load(tmp_path):
+    db_path = str(tmp_path / "sketches.db")
+    sketches = make_sketches()
+    sketches.init_db(db_path)
+    sketches.ingest([row(i, 1, "deploy friday") for i in range(4)])
+    sketches.save(db_path)
+
+    restored = make_sketches()
+    restored.load(db_path)
+    assert restored.who_mentions(1, 10, "deploy")[1] == 4
+
+
+def test_scopes_are_bounded():
+    sketches = make_sketches(max_scopes=3, width=64)
+    sketches.ingest([row(i, 1, "hello world", channel_id=100 + i, guild_id=None) for i in range(5)])
+    assert list(sketches.scopes) == [('channel', 102), ('channel', 103), ('channel', 104)]
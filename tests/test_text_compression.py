@@ -0,0 +1,53 @@
+import random
+import sqlite3
+import string
+
+import pytest
+
+from text_compression import CURRENT_CODEC, compress_columns, compress_text, decompress_text
+
+LONG_TEXT = "the deploy failed again because the migration timed out on the archive table. " * 10
+
+
+def test_round_trip():
+    packed = compress_text(LONG_TEXT)
+    assert isinstance(packed, bytes) and packed[0] == CURRENT_CODEC
+    assert len(packed) < len(LONG_TEXT.encode())
+    assert decompress_text(packed) == LONG_TEXT
+
+
+def test_round_trip_non_ascii():
+    text = "café ☕ ünïcödé " * 40
+    assert decompress_text(compress_text(text)) == text
+
+
+def test_short_text_stays_plain():
+    assert compress_text("short message") == "short message"
+    assert compress_text(LONG_TEXT, min_bytes=len(LONG_TEXT) + 1) == LONG_TEXT
+
+
+def test_text_that_does_not_shrink_stays_plain():
+    rng = random.Random(1)
+    incompressible = "".join(rng.choice(string.ascii_letters) for _ in range(12))
+    assert compress_text(incompressible, min_bytes=10) == incompressible
+
+
+def test_decompress_passes_plain_values_through():
+    assert decompress_text("plain") == "plain"
+    assert decompress_text(None) is None
+    with pytest.raises(ValueError):
+        decompress_text(b"\xff123")
+
+
+def test_compress_columns_backfills_once():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE messages (message_id INTEGER PRIMARY KEY, content TEXT)")
+    conn.executemany("INSERT INTO messages VALUES (?, ?)", [(i, LONG_TEXT) for i in range(5)] + [(10, "hi")])
+    conn.commit()
+
+    assert compress_columns(conn, "messages", "message_id", ["content"], batch_size=2) == 5
+    rows = dict(conn.execute("SELECT message_id, content FROM messages"))
+    assert all(isinstance(rows[i], bytes) for i in range(5)) and rows[10] == "hi"
+    assert all(decompress_text(value) == (LONG_TEXT if key < 10 else "hi") for key, value in rows.items())
+    # Recorded as done for the current codec
+    assert compress_columns(conn, "messages", "message_id", ["content"]) == 0
@@ -0,0 +1,92 @@
+import calendar
+import sqlite3
+
+import pytest
+
+from message_archive import MessageArchive
+from time_partitions import TimePartitions, snowflake_time, time_snowflake
+
+JAN_15 = calendar.timegm((2024, 1, 15, 12, 0, 0))
+FEB_10 = calendar.timegm((2024, 2, 10, 0, 0, 0))
+MAR_1 = calendar.timegm((2024, 3, 1, 0, 0, 0))
+
+
+def make_partitions(period='month'):
+    return TimePartitions('events', 'id INTEGER PRIMARY KEY, created_at INTEGER', period=period,
+                          indexes=['(created_at)'])
+
+
+def test_names_and_bounds():
+    months, days = make_partitions(), make_partitions('day')
+    assert months.name(JAN_15) == 'events_202401'
+    assert months.bounds('events_202401') == (calendar.timegm((2024, 1, 1, 0, 0, 0)), calendar.timegm((2024, 2, 1, 0, 0, 0)))
+    assert months.bounds('events_202412')[1] == calendar.timegm((2025, 1, 1, 0, 0, 0))
+    assert days.name(JAN_15) == 'events_20240115'
+    assert days.bounds('events_20240115') == (JAN_15 - 12 * 3600, JAN_15 + 12 * 3600)
+    with pytest.raises(ValueError):
+        TimePartitions('events', '', period='week')
+
+
+def test_existing_selects_overlapping_partitions():
+    partitions = make_partitions()
+    conn = sqlite3.connect(':memory:')
+    for ts in (JAN_15, FEB_10, MAR_1):
+        partitions.ensure(conn, ts)
+    conn.execute('CREATE TABLE events_archive (id INTEGER)')  # Not a partition
+    assert partitions.existing(conn) == ['events_202401', 'events_202402', 'events_202403']
+    assert partitions.existing(conn, start=FEB_10) == ['events_202402', 'events_202403']
+    assert partitions.existing(conn, start=FEB_10, end=MAR_1) == ['events_202402']
+
+
+def test_drop_before_only_drops_whole_partitions():
+    partitions = make_partitions()
+    conn = sqlite3.connect(':memory:')
+    for ts in (JAN_15, FEB_10, MAR_1):
+        partitions.ensure(conn, ts)
+    # February isn't over at the cutoff, so it stays
+    assert partitions.drop_before(conn, FEB_10) == ['events_202401']
+    assert partitions.existing(conn) == ['events_202402', 'events_202403']
+    # A dropped partition is recreated on the next write
+    assert partitions.ensure(conn, JAN_15) == 'events_202401'
+    assert conn.execute('SELECT COUNT(*) FROM events_202401').fetchone()[0] == 0
+
+
+def test_snowflake_round_trip():
+    assert snowflake_time(time_snowflake(JAN_15)) == JAN_15
+
+
+def test_archive_moves_legacy_table_into_partitions(tmp_path):
+    db_path = str(tmp_path / 'archive.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'CREATE TABLE message_archive ({MessageArchive.SCHEMA})')
+    conn.executemany('INSERT INTO message_archive VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+        (1, 5, 10, 100, 'alice', 0, JAN_15, 5, 'hello', 1),
+        (2, 5, 10, 101, 'bob', 0, FEB_10, 3, 'hey', 2),
+    ])
+    conn.commit()
+    conn.close()
+
+    archive = MessageArchive(db_path)
+    archive.init_db()
+    assert archive.stats()['partitions'] == 2 and archive.stats()['messages'] == 2
+    assert [row[1] for row in archive.rows_after(5, 10, 0)] == [1, 2]
+    assert [row[1] for row in archive.rows_after(5, 10, 0, since=FEB_10)] == [2]
+    assert archive._next_seq == 3
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'message_archive'").fetchone() is None
+    conn.close()
+
+
+def test_archive_cleanup_drops_expired_months(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'archive.db')
+    archive = MessageArchive(db_path)
+    archive.init_db()
+    archive._write([
+        (1, 5, 10, 100, 'alice', 0, JAN_15, 5, 'hello'),
+        (2, 5, 10, 100, 'alice', 0, FEB_10, 5, 'again'),
+    ])
+    monkeypatch.setattr('message_archive.time.time', lambda: MAR_1 + 86400)
+    # 30 days back is Jan 31: January is dropped, February is kept
+    assert archive.cleanup(30 * 86400) == 1
+    assert [row[1] for row in archive.rows_after(5, 10, 0)] == [2]
@@ -0,0 +1,92 @@
+import logging
+import sqlite3
+import zlib
+from typing import Iterable, Optional, Union
+
+logger = logging.getLogger('GrokBot')
+
+# Stored values are either TEXT (uncompressed) or a BLOB whose first byte is the codec version:
+#   1 - raw DEFLATE (zlib level 6, no zlib header / checksum)
+# Add a new version (e.g. a trained dictionary) rather than changing an existing one; old values
+# stay readable and compress_columns() rewrites them.
+CODEC_DEFLATE = 1
+CURRENT_CODEC = CODEC_DEFLATE
+
+
+def compress_text(text: str, min_bytes: int = 200) -> Union[str, bytes]:
+    """Value to store for text: compressed if it is at least min_bytes long and compression saves space"""
+    raw = text.encode()
+    if len(raw) < min_bytes:
+        return text
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    packed = bytes([CURRENT_CODEC]) + compressor.compress(raw) + compressor.flush()
+    return packed if len(packed) < len(raw) else text
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """Text of a stored value (plain TEXT passes through)"""
+    if value is None or isinstance(value, str):
+        return value
+    codec = value[0]
+    if codec == CODEC_DEFLATE:
+        return zlib.decompressobj(-15).decompress(value[1:]).decode()
+    raise ValueError(f'Unknown text codec version {codec}')
+
+
+def init_compression_state(conn: sqlite3.Connection):
+    """Table recording which tables have been backfilled with which codec version"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS text_compression_state (
+            table_name TEXT PRIMARY KEY,
+            codec INTEGER NOT NULL
+        )
+    ''')
+
+
+def compress_columns(conn: sqlite3.Connection, table: str, key: str, columns: Iterable[str],
+                     min_bytes: int = 200, batch_size: int = 1000) -> int:
+    """
+    Backfill: compress existing plain (or older-codec) values of columns in table, once per codec
+    version. Commits every batch_size rows. Returns the number of rows rewritten.
+    """
+    init_compression_state(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT codec FROM text_compression_state WHERE table_name = ?', (table,))
+    state = cursor.fetchone()
+    if state and state[0] == CURRENT_CODEC:
+        return 0
+
+    columns = list(columns)
+    # Candidates: long plain text, or values written with an older codec
+    stale = " OR ".join(
+        f"(typeof({column}) = 'text' AND length(CAST({column} AS BLOB)) >= :min_bytes) OR "
+        f"(typeof({column}) = 'blob' AND substr({column}, 1, 1) != :codec)"
+        for column in columns
+    )
+    rewritten = 0
+    last_key = -1  # Keys are message IDs
+    while True:
+        # Key order in batches, so values that don't shrink (left as text) are passed over
+        cursor.execute(f'''
+            SELECT {key}, {", ".join(columns)} FROM {table}
+            WHERE {key} > :last_key AND ({stale})
+            ORDER BY {key} LIMIT :batch_size
+        ''', {'min_bytes': min_bytes, 'codec': bytes([CURRENT_CODEC]), 'last_key': last_key, 'batch_size': batch_size})
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_key = rows[-1][0]
+        updates = [
+            tuple(compress_text(decompress_text(value), min_bytes) for value in row[1:]) + (row[0],)
+            for row in rows
+        ]
+        conn.executemany(f'UPDATE {table} SET {", ".join(f"{column} = ?" for column in columns)} WHERE {key} = ?',
+                         updates)
+        conn.commit()
+        rewritten += len(updates)
+    conn.execute('INSERT OR REPLACE INTO text_compression_state (table_name, codec) VALUES (?, ?)',
+                 (table, CURRENT_CODEC))
+    conn.commit()
+    if rewritten:
+        logger.info(f'Compressed {rewritten} rows of {table}')
+    return rewritten
@@ -0,0 +1,87 @@
+import calendar
+import re
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Tuple
+
+DISCORD_EPOCH = 1420070400  # Seconds; snowflake IDs count milliseconds from here
+
+
+def snowflake_time(snowflake: int) -> int:
+    """Creation time (epoch seconds) encoded in a Discord snowflake ID"""
+    return ((snowflake >> 22) // 1000) + DISCORD_EPOCH
+
+
+def time_snowflake(ts: float) -> int:
+    """Smallest snowflake ID created at epoch seconds ts (for ID range bounds)"""
+    return max(0, int((ts - DISCORD_EPOCH) * 1000)) << 22
+
+
+class TimePartitions:
+    """
+    A logical table stored as one SQLite table per UTC day or month ({base}_YYYYMMDD / {base}_YYYYMM),
+    so retention drops whole tables instead of deleting rows (no long write locks, no free-page
+    bloat) and time-window reads only touch the partitions that overlap the window.
+
+    `schema` is the column list of each partition; `indexes` are "(columns)" strings created on
+    every partition. Partitions are created on first write.
+    """
+
+    def __init__(self, base: str, schema: str, period: str = 'month', indexes: Iterable[str] = ()):
+        if period not in ('day', 'month'):
+            raise ValueError(f'Unknown partition period: {period}')
+        self.base = base
+        self.schema = schema
+        self.period = period
+        self.indexes = list(indexes)
+        self._name_pattern = re.compile(rf"^{re.escape(base)}_(\d{{{8 if period == 'day' else 6}}})$")
+        self._created = set()  # Partitions known to exist
+
+    def name(self, ts: float) -> str:
+        """Partition table holding rows at epoch seconds ts"""
+        return f"{self.base}_{time.strftime('%Y%m%d' if self.period == 'day' else '%Y%m', time.gmtime(ts))}"
+
+    def bounds(self, name: str) -> Tuple[int, int]:
+        """[start, end) epoch seconds covered by a partition"""
+        key = self._name_pattern.match(name).group(1)
+        year, month = int(key[:4]), int(key[4:6])
+        if self.period == 'day':
+            start = calendar.timegm((year, month, int(key[6:]), 0, 0, 0))
+            return start, start + 86400
+        start = calendar.timegm((year, month, 1, 0, 0, 0))
+        end = calendar.timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0))
+        return start, end
+
+    def ensure(self, conn: sqlite3.Connection, ts: float) -> str:
+        """Name of the partition for ts, created (with its indexes) if it doesn't exist yet"""
+        name = self.name(ts)
+        if name not in self._created:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {name} ({self.schema})')
+            for i, columns in enumerate(self.indexes):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_{i} ON {name}{columns}')
+            self._created.add(name)
+        return name
+
+    def existing(self, conn: sqlite3.Connection, start: Optional[float] = None,
+                 end: Optional[float] = None) -> List[str]:
+        """Existing partitions overlapping [start, end), oldest first"""
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                              (f"{self.base}\\_%",))
+        names = sorted(row[0] for row in cursor.fetchall() if self._name_pattern.match(row[0]))
+        self._created.update(names)
+        selected = []
+        for name in names:
+            first, last = self.bounds(name)
+            if (start is None or last > start) and (end is None or first < end):
+                selected.append(name)
+        return selected
+
+    def drop_before(self, conn: sqlite3.Connection, cutoff: float) -> List[str]:
+        """Drop partitions that end at or before cutoff (retention is rounded to whole partitions)"""
+        dropped = []
+        for name in self.existing(conn, end=cutoff):
+            if self.bounds(name)[1] <= cutoff:
+                conn.execute(f'DROP TABLE {name}')
+                self._created.discard(name)
+                dropped.append(name)
+        return dropped